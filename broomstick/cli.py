@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import argparse
+import contextlib
+import itertools
+import json
+import math
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from broomstick import runner
+from broomstick.profiling import profile
+
+
+OUTPUT_FORMATS = ['jsonl', 'parquet', 'dataset']
+
+
+def parse_window(window):
+    """Parses a `START:END` window. `END` is optional.
+
+    :param window: the window string, e.g. `2019-01-01:2020-01-01`.
+    :returns: a tuple with start and end dates, end being `None` if empty.
+    """
+
+    start_date, sep, end_date = window.partition(':')
+
+    if not start_date:
+        raise argparse.ArgumentTypeError(
+            "Invalid window '{}', expected START[:END]".format(window))
+
+    return start_date, end_date or None
+
+
+def create_parser():
+    """Creates the command line parser."""
+
+    parser = argparse.ArgumentParser(
+        prog='broomstick',
+        description="Compute Broomstick metrics from GrimoireLab data.")
+
+    parser.add_argument('metrics', nargs='+', metavar='metric',
+                        choices=sorted(runner.METRICS),
+                        help="metrics to compute: %(choices)s")
+    parser.add_argument('-s', '--data-source', dest='data_sources',
+                        action='append', required=True,
+                        help="data source to query, can be repeated")
+    parser.add_argument('-w', '--window', dest='windows',
+                        action='append', type=parse_window, required=True,
+                        help="START[:END] date window (start exclusive, "
+                             "end inclusive), can be repeated")
+    parser.add_argument('-c', '--config', default='.settings',
+                        help="ElasticSearch settings file "
+                             "(default: %(default)s)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file, `-` for stdout "
+                             "(default: %(default)s)")
+    parser.add_argument('-f', '--format', default='jsonl',
+                        choices=OUTPUT_FORMATS,
+                        help="output format (default: %(default)s), "
+                             "`dataset` appends to a partitioned Parquet "
+                             "dataset in the output directory")
+    parser.add_argument('--project',
+                        help="project the metrics are computed for, "
+                             "required by `dataset` output")
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help="number of metrics computed in parallel "
+                             "(default: %(default)s)")
+    parser.add_argument('--include-unknown', action='store_true',
+                        help="count contributions from 'Unknown' "
+                             "organization")
+    parser.add_argument('--exclude-bots', action='store_true',
+                        help="exclude contributions sent by bots")
+    parser.add_argument('--exclude-merges', action='store_true',
+                        help="exclude merge commits")
+    parser.add_argument('--include-org', dest='include_orgs',
+                        action='append',
+                        help="only count contributions from this "
+                             "organization, can be repeated")
+    parser.add_argument('--exclude-org', dest='exclude_orgs',
+                        action='append',
+                        help="don't count contributions from this "
+                             "organization, can be repeated")
+    parser.add_argument('--affiliations',
+                        help="affiliation override table (CSV, Parquet or "
+                             "SortingHat JSON export) for organization "
+                             "metrics")
+    parser.add_argument('--preview', dest='mode', action='store_const',
+                        const='preview', default='exact',
+                        help="estimate metrics from a random sample of "
+                             "documents, only for metrics supporting it")
+    parser.add_argument('--profile', action='store_true',
+                        help="print the time and memory spent in each "
+                             "stage to stderr")
+    parser.add_argument('--speedscope', metavar='PATH',
+                        help="write the timeline of the stages to PATH, "
+                             "in speedscope format (implies --profile)")
+    parser.add_argument('--preference',
+                        help="ES shard preference, use the same value for "
+                             "runs that should hit the same shard caches")
+
+    return parser
+
+
+def run(metrics, data_sources, windows, jobs=4, **params):
+    """Computes every combination of metrics, data sources and windows.
+
+    :param metrics: list of metric names.
+    :param data_sources: list of data source names.
+    :param windows: list of `(start_date, end_date)` tuples.
+    :param jobs: number of metrics computed in parallel.
+    :param params: params passed to every metric.
+    :returns: a list of records, in the same order as the combinations.
+    """
+
+    tasks = list(itertools.product(metrics, data_sources, windows))
+
+    def run_task(task):
+        metric, data_source, (start_date, end_date) = task
+        return runner.run_metric(metric, data_source,
+                                 start_date, end_date, **params)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = executor.map(run_task, tasks)
+
+    return list(itertools.chain.from_iterable(results))
+
+
+def __json_value(value):
+    """Replaces NaN and infinite floats, not valid in JSON, by `None`."""
+
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    elif isinstance(value, dict):
+        return {k: __json_value(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [__json_value(v) for v in value]
+
+    return value
+
+
+def write_jsonl(records, output):
+    """Writes records as JSON Lines to the given path (`-` for stdout).
+
+    NaN and infinite values are written as `null`.
+    """
+
+    out = sys.stdout if output == '-' else open(output, 'w')
+
+    try:
+        for record in records:
+            out.write(json.dumps(__json_value(record), default=str,
+                                 allow_nan=False) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+def write_parquet(records, output):
+    """Writes records as a Parquet file. Requires `pyarrow`."""
+
+    if output == '-':
+        raise ValueError("Parquet output requires an output file")
+
+    import pandas
+
+    pandas.DataFrame.from_records(records).to_parquet(output, index=False)
+
+
+def write_output(records, output, output_format='jsonl', project=None):
+    """Writes records in any of the `OUTPUT_FORMATS`.
+
+    :param records: list of records (see `broomstick.runner.to_records`).
+    :param output: output file, `-` for stdout, or dataset directory.
+    :param output_format: one of `OUTPUT_FORMATS`.
+    :param project: project the records belong to, for `dataset` output
+        (see `broomstick.dataset.write_results`).
+    """
+
+    if output_format == 'parquet':
+        write_parquet(records, output)
+    elif output_format == 'dataset':
+        if output == '-' or not project:
+            raise ValueError("Dataset output requires an output directory "
+                             "and a project")
+
+        from broomstick import dataset
+
+        dataset.write_results(records, output, project)
+    else:
+        write_jsonl(records, output)
+
+
+def main(argv=None):
+    """Entry point for the `broomstick` console script."""
+
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        data_sources = [runner.parse_data_source(ds)
+                        for ds in args.data_sources]
+    except ValueError as e:
+        parser.error(str(e))
+
+    unsupported = [metric for metric in args.metrics
+                   if not runner.supports_mode(metric, args.mode)]
+    if unsupported:
+        parser.error("{} mode is not supported by: {}"
+                     .format(args.mode, ', '.join(unsupported)))
+
+    from broomstick.data.es import common as com
+
+    # Create the shared connection before spawning threads
+    com.create_es_connection(config_file=args.config)
+    com.set_search_preference(preference=args.preference)
+
+    if args.profile or args.speedscope:
+        profiling = profile(speedscope=args.speedscope)
+    else:
+        profiling = contextlib.nullcontext()
+
+    with profiling as profiler:
+        records = run(args.metrics, data_sources, args.windows,
+                      jobs=args.jobs,
+                      exclude_unknown=not args.include_unknown,
+                      exclude_bots=args.exclude_bots,
+                      exclude_merges=args.exclude_merges,
+                      include_orgs=args.include_orgs,
+                      exclude_orgs=args.exclude_orgs,
+                      affiliations=args.affiliations,
+                      mode=args.mode)
+
+    if profiler is not None:
+        sys.stderr.write(profiler.summary().to_string(index=False) + '\n')
+
+    write_output(records, args.output, args.format, project=args.project)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -20,19 +20,34 @@
 #
 
 
-import certifi
 import configparser
-import pandas
-import urllib3
-
-
-from elasticsearch import Elasticsearch, RequestsHttpConnection
-from elasticsearch_dsl import Search
+import contextlib
+import re
 
+from broomstick import profiling as prof
 from broomstick.core import DataSource
-
-# Disable urlib3 warnings
-urllib3.disable_warnings()
+from broomstick.data.es import fields as fc
+from broomstick.data.es import resilience as rs
+from broomstick.lazy import lazy_attributes, lazy_import
+
+# Heavy dependencies are only imported when first used
+certifi = lazy_import('certifi')
+dsl = lazy_import('elasticsearch_dsl')
+es = lazy_import('elasticsearch')
+numpy = lazy_import('numpy')
+pandas = lazy_import('pandas')
+rp = lazy_import('broomstick.data.es.replay')
+urllib3 = lazy_import('urllib3')
+
+# Names this module used to import eagerly
+__getattr__ = lazy_attributes(globals(), {
+    'Elasticsearch': 'elasticsearch:Elasticsearch',
+    'RequestsHttpConnection': 'elasticsearch:RequestsHttpConnection',
+    'MultiSearch': 'elasticsearch_dsl:MultiSearch',
+    'Q': 'elasticsearch_dsl:Q',
+    'SF': 'elasticsearch_dsl:SF',
+    'Search': 'elasticsearch_dsl:Search'
+})
 
 
 # Data source to index name correpondence
@@ -48,9 +63,96 @@ DS_ID_FIELD = {
 
 UNKNOWN_ORG_NAME = 'Unknown'
 
+# Maximum number of organizations retrieved by terms aggregations
+MAX_ORGS = 1000
+
+# Maximum number of organizations in a `terms` filter, longer lists must
+# be used through a terms lookup (see `terms_lookup`)
+MAX_TERMS = 65536
+
+# Headers asking ES for compressed responses
+COMPRESSION_HEADERS = {'accept-encoding': 'gzip,deflate'}
+
+# Parts of the response envelope kept when trimming responses, needed to
+# report shard failures (see `resilience.report_shard_failures`)
+ENVELOPE_PATHS = ['_shards.total', '_shards.failed',
+                  '_shards.failures.reason.type']
+
+# Parts of the response read from an `organizations` aggregation (see
+# `add_org_aggregation`)
+ORG_BUCKET_PATHS = ['buckets.key', 'buckets.total_contribs.value']
+
+# Documents sampled per shard by preview searches, the random score seed
+# used to pick them, and the z-score of the confidence interval of preview
+# errors (95%)
+PREVIEW_SHARD_SIZE = 5000
+PREVIEW_SEED = 42
+PREVIEW_Z = 1.96
+
+# Number of buckets retrieved per request by composite aggregations
+COMPOSITE_PAGE_SIZE = 1000
+
+# Fields used to group contributions by author, organization and date
+AUTHOR_FIELD = 'author_uuid'
+ORG_FIELD = 'author_org_name'
+DATE_FIELD = 'grimoire_creation_date'
+
+# Field holding when each document was (re)enriched, used to find the
+# documents changed since a given time (see `enriched_days`)
+ENRICHED_FIELD = 'metadata__enriched_on'
+
+# Maximum number of ranges of days in a single filter (see
+# `add_days_filter`), below the default ES `max_clause_count`
+MAX_DAY_RANGES = 512
+
+# Canonical format for dates sent to ES, always in UTC
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+# Allowed date rounding resolutions and their Pandas frequency
+DATE_ROUNDING = {
+    'day': 'D',
+    'hour': 'H'
+}
+
+# ES date math supported when normalizing dates: an anchor (`now` or a
+# date followed by `||`), offsets and rounding, e.g. `now-90d/d` or
+# `2020-01-01||+1M`
+DATE_MATH_RE = re.compile(r'^(?:(?P<now>now)|(?P<anchor>.+)\|\|)'
+                          r'(?P<offsets>([+-]\d+[yMwdhHms])*)'
+                          r'(/(?P<round>[yMwdhHms]))?$')
+
+# Rounding applied to `now` when neither the date math nor the caller
+# round it, so repeated queries are identical within the same hour
+NOW_ROUNDING = 'hour'
+
+DATE_MATH_UNITS = {
+    'y': 'years',
+    'M': 'months',
+    'w': 'weeks',
+    'd': 'days',
+    'h': 'hours',
+    'H': 'hours',
+    'm': 'minutes',
+    's': 'seconds'
+}
+
+# How requests are sent to ES, see `create_es_connection`
+TRANSPORT_MODES = ('live', 'record', 'replay')
+
 # Connection to ElasticSearch, all functions should use the same
 __es_conn = None
 
+# Rounding applied to date filters, see `set_date_rounding`
+__date_rounding = None
+
+# Whether aggregated fields are resolved against index mappings, see
+# `set_field_resolution`
+__field_resolution = False
+
+# Shard preference and routing of every new search, see
+# `set_search_preference`
+__search_hints = {}
+
 
 def create_es_connection(config_file='.settings'):
     """Creates and returns a new ElasticSearch connection.
@@ -66,6 +168,30 @@ def create_es_connection(config_file='.settings'):
         host=localhost
         port=443
         path=path
+        resolve_fields=no
+        compressed_responses=yes
+
+        [Indexes]
+        git=git_aliased
+        all=all_enriched*
+
+        [Transport]
+        mode=live
+        recording=recordings/report.jsonl.gz
+        latency=0.05
+
+    `resolve_fields` (optional) enables checking aggregated fields against
+    the index mappings, see `set_field_resolution`. `compressed_responses`
+    (optional, enabled by default) asks ES to gzip responses, using
+    `COMPRESSION_HEADERS`. The optional `Indexes` section overrides the
+    index, alias or index pattern queried for each data source.
+
+    The optional `Transport` section sets how requests are sent (see
+    `broomstick.data.es.replay`): `live` (default) sends them to ES,
+    `record` also saves them with their responses to `recording`, and
+    `replay` answers them from `recording` after waiting `latency`
+    seconds, without connecting to ES (the `ElasticSearch` section is not
+    needed then).
 
     :returns: the connection to the ES server.
     """
@@ -73,9 +199,39 @@ def create_es_connection(config_file='.settings'):
     global __es_conn
 
     if not __es_conn:
+        # Certificates are not verified
+        urllib3.disable_warnings()
+
         parser = configparser.ConfigParser()
         parser.read(config_file)
 
+        if parser.getboolean('ElasticSearch', 'resolve_fields',
+                             fallback=False):
+            set_field_resolution()
+
+        if parser.has_section('Indexes'):
+            for name, index in parser['Indexes'].items():
+                DS_INDEX[DataSource[name.upper()]] = index
+
+        transport = parser['Transport'] \
+            if parser.has_section('Transport') else {}
+        mode = transport.get('mode', 'live')
+
+        if mode not in TRANSPORT_MODES:
+            raise ValueError("Unknown transport mode '{}', use one of {}"
+                             .format(mode, TRANSPORT_MODES))
+
+        # Retries are done with backoff by `resilience.execute`, so the
+        # client must not retry on its own
+        if mode == 'replay':
+            __es_conn = es.Elasticsearch(
+                connection_class=rp.ReplayConnection,
+                recording=transport['recording'],
+                latency=transport.get('latency', 0),
+                max_retries=0)
+
+            return __es_conn
+
         section = parser['ElasticSearch']
         user = section['user']
         password = section['password']
@@ -86,22 +242,39 @@ def create_es_connection(config_file='.settings'):
         connection = "https://" + user + ":" + password + "@" + host + ":" \
                      + port + "/" + path
 
-        __es_conn = Elasticsearch([connection],
-                                  verify_certs=False,
-                                  connection_class=RequestsHttpConnection,
-                                  ca_cert=certifi.where(),
-                                  scroll='300m',
-                                  timeout=1000)
+        if mode == 'record':
+            transport_args = {'connection_class': rp.RecordingConnection,
+                              'recording': transport['recording']}
+        else:
+            transport_args = {
+                'connection_class': es.RequestsHttpConnection}
+
+        # `requests` connections don't ask for compressed responses unless
+        # told to by the headers. Requests are not compressed.
+        if section.getboolean('compressed_responses', fallback=True):
+            transport_args['headers'] = dict(COMPRESSION_HEADERS)
+
+        __es_conn = es.Elasticsearch([connection],
+                                     verify_certs=False,
+                                     ca_cert=certifi.where(),
+                                     scroll='300m',
+                                     timeout=1000,
+                                     max_retries=0,
+                                     **transport_args)
 
     return __es_conn
 
 
-def create_search(data_source, start_date, end_date=None):
+@prof.profiled()
+def create_search(data_source, start_date, end_date=None,
+                  exclude_bots=False, exclude_merges=False,
+                  include_orgs=None, exclude_orgs=None):
     """ Creates and returns a new ES Search object.
 
     The returned search is configured against the
     given data source, and with a date filter between start_date
-    and end_date (optional).
+    and end_date (optional). Bot authors, merge commits and sets of
+    organizations can be excluded too.
 
     If the ES connection doesn't exist, it tries to create a new
     one using the default config file path: `.settings`.
@@ -110,29 +283,282 @@ def create_search(data_source, start_date, end_date=None):
     :param start_date: date range start (exclusive).
     :param end_date: date range end (inclusive). If `end_date` is not provided,
         adds a filter to retrieve documents from `start_date`.
+    :param exclude_bots: whether or not to exclude documents whose author is
+        marked as a bot.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to retrieve
+        documents from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose documents
+        are excluded, or a terms lookup.
     :returns: the search object configured according to the params.
     """
 
     if not __es_conn:
         create_es_connection()
 
-    s = Search(using=__es_conn, index=DS_INDEX[data_source])
+    s = dsl.Search(using=__es_conn, index=DS_INDEX[data_source])
 
     # Add bot, merges and date filtering.
-    s = add_date_filter(s, start_date, end_date)
+    s = add_date_filter(s, start_date, end_date, round_to=__date_rounding)
+
+    if exclude_bots:
+        s = exclude_bot_authors(s)
+
+    if exclude_merges:
+        s = exclude_merge_commits(s)
+
+    s = add_org_filters(s, include_orgs, exclude_orgs)
+
+    if __search_hints:
+        s = add_search_hints(s, **__search_hints)
 
     return s
 
 
-def add_date_filter(s, start_date, end_date=None):
+def set_search_preference(preference=None, routing=None):
+    """Sets the shard preference and routing of every new search.
+
+    ES picks a random copy of each shard for every search, so identical
+    queries are spread across replicas and their shard request caches
+    stay cold. Using the same `preference` (e.g. a user or report session
+    string) sends them to the same copies instead.
+
+    :param preference: ES `preference` value, `None` to let ES choose.
+    :param routing: optional custom routing value(s), only useful for
+        indexes written with the same routing.
+    """
+
+    global __search_hints
+
+    __search_hints = {name: value for name, value
+                      in (('preference', preference), ('routing', routing))
+                      if value is not None}
+
+
+@contextlib.contextmanager
+def search_preference(preference=None, routing=None):
+    """Sets the shard preference and routing of searches within a context.
+
+    Previous settings are restored when leaving the context. Settings are
+    global, so they also apply to searches created by other threads in the
+    meantime.
+
+    :param preference: ES `preference` value, see `set_search_preference`.
+    :param routing: optional custom routing value(s).
+    """
+
+    global __search_hints
+
+    previous = __search_hints
+    set_search_preference(preference=preference, routing=routing)
+
+    try:
+        yield
+    finally:
+        __search_hints = previous
+
+
+def add_search_hints(s, preference=None, routing=None):
+    """Adds shard preference and routing to a search.
+
+    :param s: the search.
+    :param preference: ES `preference` value.
+    :param routing: custom routing value(s), as a string or a list.
+    :returns: the search with the given hints set.
+    """
+
+    params = {}
+
+    if preference is not None:
+        params['preference'] = preference
+
+    if routing is not None:
+        params['routing'] = routing if isinstance(routing, str) \
+            else ','.join(routing)
+
+    return s.params(**params)
+
+
+def set_field_resolution(enabled=True):
+    """Enables or disables checking aggregated fields against mappings.
+
+    When enabled, aggregations use the cheapest aggregatable variant of
+    each field (e.g. its `.keyword` multi-field) according to the
+    `_field_caps` of the data source index, and fields that can't be
+    aggregated fail before sending the query. Field capabilities are
+    retrieved once per index.
+
+    :param enabled: whether or not to resolve fields.
+    """
+
+    global __field_resolution
+
+    __field_resolution = enabled
+
+
+def agg_field(data_source, field):
+    """Gets the name of the field to aggregate on for a data source.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param field: field name.
+    :returns: the field itself, or its cheapest aggregatable variant if
+        field resolution is enabled (see `set_field_resolution`).
+    :raises ValueError: if field resolution is enabled and the field can't
+        be aggregated.
+    """
+
+    if not __field_resolution:
+        return field
+
+    if not __es_conn:
+        create_es_connection()
+
+    return fc.aggregatable_field(__es_conn, DS_INDEX[data_source], field)
+
+
+def check_fields(data_source):
+    """Checks every field aggregated by broomstick for a data source.
+
+    Useful at startup, to find mapping problems before running any
+    metric. See `set_field_resolution`.
+
+    :param data_source: `broomstick.core.DataSource`
+    :returns: dict of field name to the name of the field to aggregate on.
+    :raises ValueError: if any field can't be aggregated.
+    """
+
+    if not __es_conn:
+        create_es_connection()
+
+    index = DS_INDEX[data_source]
+
+    return {field: fc.aggregatable_field(__es_conn, index, field)
+            for field in (DS_ID_FIELD[data_source], AUTHOR_FIELD, ORG_FIELD,
+                          DATE_FIELD)}
+
+
+def set_date_rounding(round_to=None):
+    """Sets the rounding applied to the dates of every new search.
+
+    Rounding dates makes repeated queries over `now`-relative or slightly
+    different ranges identical, so they can be served from ES shard
+    request caches.
+
+    :param round_to: one of the keys in `DATE_ROUNDING` (`'day'` or
+        `'hour'`), or `None` to keep dates at second resolution.
+    """
+
+    global __date_rounding
+
+    __date_rounding = __check_date_rounding(round_to)
+
+
+def normalize_date(date, round_to=None):
+    """Converts a date into its canonical UTC string representation.
+
+    Accepts strings, `datetime` objects, epoch milliseconds (as numbers or
+    digit strings) and ES date math (`now` or `<date>||`, optionally
+    followed by offsets and rounding, like `now-90d/d` or `2020-01-01||+1M`).
+    `now` is resolved at call time and rounded to `NOW_ROUNDING` unless
+    another rounding is given. Naive dates are assumed to be in UTC.
+
+    :param date: the date to normalize.
+    :param round_to: optional rounding, one of the keys in `DATE_ROUNDING`.
+        Dates are rounded down.
+    :returns: the date formatted according to `DATE_FORMAT`.
+    """
+
+    round_to = __check_date_rounding(round_to)
+    match = DATE_MATH_RE.match(date) if isinstance(date, str) else None
+
+    if match:
+        if match.group('now'):
+            ts = pandas.Timestamp.now(tz='UTC')
+
+            if round_to is None and not match.group('round'):
+                round_to = NOW_ROUNDING
+        else:
+            ts = __parse_date(match.group('anchor'))
+
+        for sign, amount, unit in re.findall(r'([+-])(\d+)(\w)',
+                                             match.group('offsets')):
+            offset = pandas.DateOffset(**{DATE_MATH_UNITS[unit]: int(amount)})
+            ts = ts + offset if sign == '+' else ts - offset
+
+        if match.group('round'):
+            ts = __floor_date(ts, match.group('round'))
+    else:
+        ts = __parse_date(date)
+
+    ts = ts.floor('S')
+
+    if round_to:
+        ts = ts.floor(DATE_ROUNDING[round_to])
+
+    return ts.strftime(DATE_FORMAT)
+
+
+def __parse_date(date):
+    """Parses a date or epoch milliseconds into a UTC timestamp."""
+
+    if isinstance(date, str) and date.isdigit():
+        date = int(date)
+
+    if isinstance(date, (int, float)) and not isinstance(date, bool):
+        return pandas.Timestamp(date, unit='ms', tz='UTC')
+
+    ts = pandas.Timestamp(date)
+
+    if ts.tzinfo is None:
+        return ts.tz_localize('UTC')
+
+    return ts.tz_convert('UTC')
+
+
+def __check_date_rounding(round_to):
+    """Makes sure the given date rounding is supported and returns it."""
+
+    if round_to is not None and round_to not in DATE_ROUNDING:
+        raise ValueError("Unknown date rounding '{}', expected one of {}"
+                         .format(round_to, list(DATE_ROUNDING)))
+
+    return round_to
+
+
+def __floor_date(ts, unit):
+    """Rounds down a timestamp following ES date math rounding units."""
+
+    if unit == 'y':
+        return ts.normalize().replace(month=1, day=1)
+    elif unit == 'M':
+        return ts.normalize().replace(day=1)
+    elif unit == 'w':
+        return ts.normalize() - pandas.Timedelta(days=ts.dayofweek)
+
+    return ts.floor({'d': 'D', 'h': 'H', 'H': 'H',
+                     'm': 'min', 's': 'S'}[unit])
+
+
+def add_date_filter(s, start_date, end_date=None, round_to=None):
     """Adds a filter to retrieve documents created between start and end dates.
 
+    Dates are normalized to canonical UTC strings (see `normalize_date`), so
+    equivalent ranges always produce the same query.
+
     :param start_date: date range start (exclusive).
     :param end_date: date range end (inclusive). If `end_date` is not provided,
         adds a filter to retrieve documents from `start_date`.
+    :param round_to: optional rounding for both dates, one of the keys in
+        `DATE_ROUNDING`.
     :returns: the search with the desired filter set.
     """
 
+    if start_date:
+        start_date = normalize_date(start_date, round_to=round_to)
+
+    if end_date:
+        end_date = normalize_date(end_date, round_to=round_to)
+
     if start_date and end_date:
         s = s.filter(
             'range',
@@ -144,6 +570,86 @@ def add_date_filter(s, start_date, end_date=None):
     return s
 
 
+def day_ranges(days):
+    """Groups days into ranges of consecutive days.
+
+    :param days: UTC days (midnight timestamps), in any order and possibly
+        repeated.
+    :returns: a list of `(start, end)` timestamps, `start` being the first
+        day of the range and `end` the day after the last one.
+    """
+
+    days = pandas.DatetimeIndex(days).unique().sort_values()
+    one_day = pandas.Timedelta(days=1)
+
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + one_day
+        else:
+            ranges.append([day, day + one_day])
+
+    return [tuple(day_range) for day_range in ranges]
+
+
+def add_days_filter(s, days):
+    """Adds a filter to retrieve documents created in the given days.
+
+    Consecutive days are queried as a single range.
+
+    :param days: UTC days (midnight timestamps).
+    :returns: the search with the desired filter set.
+    :raises ValueError: if days make more than `MAX_DAY_RANGES` ranges.
+    """
+
+    ranges = day_ranges(days)
+
+    if len(ranges) > MAX_DAY_RANGES:
+        raise ValueError("{} ranges of days, up to {} can be queried at once"
+                         .format(len(ranges), MAX_DAY_RANGES))
+
+    return s.filter('bool', minimum_should_match=1, should=[
+        dsl.Q('range', **{DATE_FIELD: {'gte': start.strftime(DATE_FORMAT),
+                                       'lt': end.strftime(DATE_FORMAT)}})
+        for start, end in ranges])
+
+
+def exclude_bot_authors(s):
+    """Adds a filter for excluding documents authored by bots.
+
+    Relies on the `author_bot` field set by GrimoireLab enrichment. The
+    clause is added in filter context, so ES can cache it.
+
+    :param s: the search we want to update.
+    :returns: the search with the exclusion filter set.
+    """
+    return s.exclude('term', author_bot=True)
+
+
+def exclude_merge_commits(s):
+    """Adds a filter for excluding merge commits.
+
+    Relies on the `merge` field set by GrimoireLab git enrichment. Documents
+    lacking that field (i.e., coming from other data sources) are kept.
+
+    :param s: the search we want to update.
+    :returns: the search with the exclusion filter set.
+    """
+    return s.exclude('term', merge=True)
+
+
+def aggregations_only(s):
+    """Sets a search to return aggregation results only.
+
+    No hits are returned and the ES shard request cache is explicitly
+    enabled, so repeated aggregations are served from cache.
+
+    :param s: the search we want to update.
+    :returns: the updated search.
+    """
+    return s[0:0].params(request_cache=True)
+
+
 def exclude_org(s, org_name):
     """Adds a filter for excluding authors affiliated to the given org.
 
@@ -163,10 +669,76 @@ def filter_org(s, org_name):
     return s.filter('term', author_org_name=org_name)
 
 
+def add_org_filters(s, include_orgs=None, exclude_orgs=None):
+    """Adds filters for sets of organizations.
+
+    Each set becomes a single `terms` filter, no matter how many
+    organizations it has.
+
+    :param s: the search we want to update.
+    :param include_orgs: optional list of organizations to retrieve
+        documents from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose documents
+        are excluded, or a terms lookup.
+    :returns: the search with the filters set.
+    """
+
+    if include_orgs is not None:
+        s = s.filter(orgs_query(include_orgs))
+
+    if exclude_orgs is not None:
+        s = s.exclude(orgs_query(exclude_orgs))
+
+    return s
+
+
+def orgs_query(org_names):
+    """Builds a single `terms` query matching a set of organizations.
+
+    Names are deduplicated and sorted, so the same set of organizations
+    always produces the same query and ES can reuse its cached filter.
+
+    :param org_names: list of organization names, or a terms lookup (see
+        `terms_lookup`) for lists longer than `MAX_TERMS`.
+    :returns: the query.
+    """
+
+    if isinstance(org_names, dict):
+        return dsl.Q('terms', **{ORG_FIELD: org_names})
+
+    org_names = sorted(set(org_names))
+
+    if len(org_names) > MAX_TERMS:
+        raise ValueError("Too many organizations ({} > {}), use a terms "
+                         "lookup instead".format(len(org_names), MAX_TERMS))
+
+    return dsl.Q('terms', **{ORG_FIELD: org_names})
+
+
+def terms_lookup(index, doc_id, path, doc_type='_doc'):
+    """Builds a terms lookup, to filter by a list stored in ES.
+
+    Long lists of organizations are better stored once in a document and
+    referenced from queries, instead of being sent with every query.
+
+    :param index: index of the document.
+    :param doc_id: ID of the document.
+    :param path: field of the document holding the list.
+    :param doc_type: type of the document.
+    :returns: the terms lookup, to be used as `include_orgs` or
+        `exclude_orgs`.
+    """
+    return {'index': index, 'type': doc_type, 'id': doc_id, 'path': path}
+
+
 def contributions_count_total(data_source,
                               start_date,
                               end_date=None,
-                              exclude_unknown=True):
+                              exclude_unknown=True,
+                              exclude_bots=False,
+                              exclude_merges=False,
+                              include_orgs=None,
+                              exclude_orgs=None):
     """Get total number of contributions.
 
     :param data_source: target `broomstick.data.general.DataSource`.
@@ -176,28 +748,46 @@ def contributions_count_total(data_source,
         `None` by default, means count everything from `start_date`.
     :param exclude_unknown: whether or not to exclude contributions sent by
         people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
     :returns: the number of contributions sent to the specified data source.
     """
 
     s = create_search(data_source=data_source,
                       start_date=start_date,
-                      end_date=end_date)
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
 
     if exclude_unknown:
         s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
 
     s.aggs.metric('total_contribs',
                   'cardinality',
-                  field=DS_ID_FIELD[data_source],
+                  field=agg_field(data_source, DS_ID_FIELD[data_source]),
                   precision_threshold=40000)
-    s = s[0:0]
+    s = aggregations_only(s)
+
+    s = trim_response(s, 'aggregations.total_contribs.value')
 
-    return s.execute().to_dict()['aggregations']['total_contribs']['value']
+    return response_value(rs.execute(s), 'aggregations.total_contribs.value',
+                          default=0)
 
 
 def contributions_count_unknown(data_source,
                                 start_date,
-                                end_date=None):
+                                end_date=None,
+                                exclude_bots=False,
+                                exclude_merges=False,
+                                include_orgs=None,
+                                exclude_orgs=None):
     """ Get total number of contributions performed by Unknown
 
     :param data_source: `broomstick.core.DataSource`
@@ -205,28 +795,46 @@ def contributions_count_unknown(data_source,
         (exclusive).
     :param end_date: date until we want to counts contributions to (inclusive).
         `None` by default, means count everything from `start_date`.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
     :returns: the number of contributions sent by people affiliated to
         'Unknown' to the specified data source.
     """
     s = create_search(data_source=data_source,
                       start_date=start_date,
-                      end_date=end_date)
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
 
     s = filter_org(s=s, org_name=UNKNOWN_ORG_NAME)
 
     s.aggs.metric('unknown_contribs',
                   'cardinality',
-                  field=DS_ID_FIELD[data_source],
+                  field=agg_field(data_source, DS_ID_FIELD[data_source]),
                   precision_threshold=40000)
-    s = s[0:0]
+    s = aggregations_only(s)
 
-    return s.execute().to_dict()['aggregations']['unknown_contribs']['value']
+    s = trim_response(s, 'aggregations.unknown_contribs.value')
+
+    return response_value(rs.execute(s),
+                          'aggregations.unknown_contribs.value', default=0)
 
 
 def contributions_count_by_org(data_source,
                                start_date,
                                end_date=None,
-                               exclude_unknown=True):
+                               exclude_unknown=True,
+                               exclude_bots=False,
+                               exclude_merges=False,
+                               include_orgs=None,
+                               exclude_orgs=None):
     """ Gets number of contributions of each organization.
 
     :param data_source: `broomstick.core.DataSource`
@@ -236,6 +844,13 @@ def contributions_count_by_org(data_source,
         `None` by default, means count everything from `start_date`.
     :param exclude_unknown: whether or not to exclude contributions sent by
         people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
     :returns: a Pandas DataFrame with two columns:
         - Organization name.
         - The number of contributions sent by that organization to the
@@ -244,28 +859,1056 @@ def contributions_count_by_org(data_source,
 
     s = create_search(data_source=data_source,
                       start_date=start_date,
-                      end_date=end_date)
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
+
+    if exclude_unknown:
+        s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
+
+    add_org_aggregation(s, data_source)
+    s = aggregations_only(s)
+
+    s = trim_response(s, *org_bucket_paths('aggregations.organizations'))
+
+    buckets = response_value(rs.execute(s),
+                             'aggregations.organizations.buckets', default=[])
+
+    return org_buckets_to_frame(buckets)
+
+
+def contributions_count_by_org_page(data_source,
+                                    start_date,
+                                    end_date=None,
+                                    exclude_unknown=True,
+                                    exclude_bots=False,
+                                    exclude_merges=False,
+                                    include_orgs=None,
+                                    exclude_orgs=None,
+                                    offset=0,
+                                    size=10):
+    """ Gets a page of organizations sorted by number of contributions.
+
+    Organizations are sorted in descending order by ES. The `terms`
+    aggregation is only sized to reach the end of the page, and the
+    organizations before `offset` are dropped by a `bucket_sort` pipeline,
+    so only the requested page is sent back.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param offset: number of organizations to skip.
+    :param size: maximum number of organizations to return.
+    :returns: a Pandas DataFrame with the same columns returned by
+        `contributions_count_by_org`, and `size` rows at most.
+    """
+
+    s = create_search(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
+
+    if exclude_unknown:
+        s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
+
+    add_org_aggregation(s, data_source, size=offset + size)\
+        .pipeline('page',
+                  'bucket_sort',
+                  size=size,
+                  **{'from': offset})
+    s = aggregations_only(s)
+
+    s = trim_response(s, *org_bucket_paths('aggregations.organizations'))
+
+    buckets = response_value(rs.execute(s),
+                             'aggregations.organizations.buckets', default=[])
+
+    return org_buckets_to_frame(buckets)
+
+
+def contributions_count_by_org_pages(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     page_size=10):
+    """ Iterates over organizations sorted by number of contributions.
+
+    Pages are only requested when the previous one has been consumed, so
+    callers can stop as soon as they have enough organizations. Every new
+    page doubles the size of the previous one, to keep the number of
+    requests low for long tails. Up to `MAX_ORGS` organizations are read.
+
+    ES cannot resume a `terms` aggregation, so every page computes the
+    top organizations up to its end again, but earlier organizations are
+    not sent back.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param page_size: number of organizations in the first page.
+    :returns: a generator of Pandas DataFrames, see
+        `contributions_count_by_org_page`.
+    """
+
+    offset = 0
+    size = min(page_size, MAX_ORGS)
+
+    while size > 0:
+        page = contributions_count_by_org_page(
+            data_source=data_source,
+            start_date=start_date,
+            end_date=end_date,
+            exclude_unknown=exclude_unknown,
+            exclude_bots=exclude_bots,
+            exclude_merges=exclude_merges,
+            include_orgs=include_orgs,
+            exclude_orgs=exclude_orgs,
+            offset=offset,
+            size=size)
+
+        if not page.empty:
+            yield page
+
+        if len(page) < size:
+            return
+
+        offset += size
+        size = min(size * 2, MAX_ORGS - offset)
+
+
+def contributions_percentiles_by_org(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     percents=(1, 5, 25, 50, 75, 95, 99)):
+    """ Gets percentiles of the number of contributions per organization.
+
+    Percentiles are computed by ES with a `percentiles_bucket` pipeline
+    over the organization buckets, and the response is trimmed to the
+    percentiles, so organization buckets are never sent back.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param percents: percentiles to compute.
+    :returns: a Pandas DataFrame with `percent` and `contributions` columns.
+    """
+
+    s = create_search(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
+
+    if exclude_unknown:
+        s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
+
+    add_org_aggregation(s, data_source)
+    s.aggs.pipeline('contribs_percentiles',
+                    'percentiles_bucket',
+                    buckets_path='organizations>total_contribs',
+                    percents=list(percents))
+    s = aggregations_only(s)
+    s = trim_response(s, 'aggregations.contribs_percentiles.values')
+
+    values = response_value(rs.execute(s),
+                            'aggregations.contribs_percentiles.values',
+                            default={})
+
+    return pandas.DataFrame({
+        'percent': [float(percent) for percent in percents],
+        'contributions': [values.get(str(float(percent)))
+                          for percent in percents]
+    }, columns=['percent', 'contributions'])
+
+
+def org_summary_search(data_source,
+                       start_date,
+                       end_date=None,
+                       exclude_bots=False,
+                       exclude_merges=False,
+                       include_orgs=None,
+                       exclude_orgs=None):
+    """ Creates a search summarizing contributions by organization.
+
+    A single search gets the total number of contributions, the number of
+    contributions sent by people affiliated to 'Unknown' and the number of
+    contributions of each organization, which is all most organization
+    metrics need (see `org_summary`).
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: the search, ready to be executed alone or in a `MultiSearch`.
+    """
+
+    s = create_search(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
+
+    id_field = agg_field(data_source, DS_ID_FIELD[data_source])
+
+    s.aggs.metric('total_contribs',
+                  'cardinality',
+                  field=id_field,
+                  precision_threshold=40000)
+    s.aggs.bucket('unknown',
+                  'filter',
+                  term={ORG_FIELD: UNKNOWN_ORG_NAME})\
+        .metric('unknown_contribs',
+                'cardinality',
+                field=id_field,
+                precision_threshold=40000)
+    add_org_aggregation(s, data_source)
+
+    return trim_response(aggregations_only(s),
+                         'aggregations.total_contribs.value',
+                         'aggregations.unknown.unknown_contribs.value',
+                         *org_bucket_paths('aggregations.organizations'))
+
+
+def org_summary(response, exclude_unknown=True):
+    """ Extracts organization metrics from an `org_summary_search` response.
+
+    :param response: the response, as a dict.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization from `total` and
+        `by_org`.
+    :returns: a dict with `total` (number of contributions), `unknown`
+        (number of contributions sent by people affiliated to 'Unknown')
+        and `by_org` (Pandas DataFrame with `organization` and
+        `contributions` columns) keys.
+    """
+
+    aggs = response_value(response, 'aggregations', default={})
+    unknown = response_value(aggs, 'unknown.unknown_contribs.value',
+                             default=0)
+    total = response_value(aggs, 'total_contribs.value', default=0)
+    by_org = org_buckets_to_frame(
+        response_value(aggs, 'organizations.buckets', default=[]))
+
+    if exclude_unknown:
+        total -= unknown
+        by_org = by_org[by_org['organization'] != UNKNOWN_ORG_NAME]\
+            .reset_index(drop=True)
+
+    return {'total': total, 'unknown': unknown, 'by_org': by_org}
+
+
+def multi_search(searches):
+    """ Executes several searches in a single `_msearch` request.
+
+    `_msearch` only accepts a `filter_path` for the whole request, not in
+    the header of each search, so responses are only trimmed if every
+    search is (see `trim_response`), to the paths of all of them.
+
+    :param searches: list of searches.
+    :returns: list of responses, as dicts, in the same order as `searches`.
+    """
+
+    if not __es_conn:
+        create_es_connection()
+
+    ms = dsl.MultiSearch(using=__es_conn)
+    paths = []
+
+    for s in searches:
+        s = s._clone()
+        search_paths = s._params.pop('filter_path', None)
+        ms = ms.add(s)
+
+        if paths is not None and search_paths:
+            paths.extend(p for p in search_paths if p not in paths)
+        else:
+            paths = None
+
+    if paths:
+        # Failed searches return an error instead of a response
+        ms = ms.params(filter_path=['responses.' + p
+                                    for p in ['error', 'status'] + paths])
+
+    return rs.execute(ms)
+
+
+def trim_response(s, *paths):
+    """ Trims the response of a search to the given paths.
+
+    ES only sends back the parts of the response matching the paths, plus
+    `ENVELOPE_PATHS`, using the `filter_path` param. Empty objects and
+    arrays, as well as `null` values, are removed too, so values must be
+    read with `response_value`.
+
+    :param s: the search we want to update.
+    :param paths: dot separated paths of the values to send back, e.g.
+        `aggregations.total_contribs.value`.
+    :returns: the updated search.
+    """
+
+    return s.params(filter_path=ENVELOPE_PATHS + list(paths))
+
+
+def org_bucket_paths(path):
+    """ Returns the paths read from an `organizations` aggregation.
+
+    :param path: path of the aggregation in the response.
+    :returns: a list of paths (see `trim_response`).
+    """
+
+    return [path + '.' + bucket_path for bucket_path in ORG_BUCKET_PATHS]
+
+
+def response_value(response, path, default=None):
+    """ Reads a value from a response, trimmed or not.
+
+    :param response: the response, as a dict.
+    :param path: dot separated path of the value.
+    :param default: value returned if the path is not found, e.g. because
+        it was removed by `trim_response` for being empty.
+    :returns: the value.
+    """
+
+    for key in path.split('.'):
+        if not isinstance(response, dict) or key not in response:
+            return default
+        response = response[key]
+
+    return response
+
+
+def add_preview_sampler(s, shard_size=PREVIEW_SHARD_SIZE, seed=PREVIEW_SEED):
+    """Adds an aggregation sampling documents at random.
+
+    Documents get a random score, so the `sampler` aggregation keeps a
+    random subset of up to `shard_size` documents per shard. The same
+    `seed` always picks the same documents. Hits are counted exactly, as
+    estimates are scaled to them (ES 7 stops counting at 10000 otherwise).
+
+    :param s: the search we want to sample.
+    :param shard_size: number of documents sampled per shard.
+    :param seed: random score seed.
+    :returns: a tuple with the updated search and the `sample` aggregation,
+        where the aggregations to estimate should be added.
+    """
+
+    score = dsl.SF('random_score', seed=seed, field='_seq_no')
+    s = s.query('function_score', functions=[score], boost_mode='replace')\
+        .extra(track_total_hits=True)
+
+    return s, s.aggs.bucket('sample', 'sampler', shard_size=shard_size)
+
+
+def scale_sample(counts, sampled, population):
+    """Scales counts from a random sample of documents to the population.
+
+    Errors are the half-width of the `PREVIEW_Z` confidence interval of a
+    proportion, with finite population correction, so they are 0 when the
+    whole population was sampled.
+
+    :param counts: counts in the sample, a number or an array.
+    :param sampled: number of documents sampled.
+    :param population: number of documents matching the search.
+    :returns: a tuple with the estimated counts and their errors.
+    """
+
+    counts = numpy.asarray(counts, dtype=numpy.float64)
+
+    if not sampled:
+        return counts * 0, counts * 0
+
+    proportion = counts / sampled
+    correction = (population - sampled) / max(population - 1, 1)
+    error = PREVIEW_Z * population \
+        * numpy.sqrt(proportion * (1 - proportion) / sampled * correction)
+
+    return proportion * population, error
+
+
+def contributions_count_total_preview(data_source,
+                                      start_date,
+                                      end_date=None,
+                                      exclude_unknown=True,
+                                      exclude_bots=False,
+                                      exclude_merges=False,
+                                      include_orgs=None,
+                                      exclude_orgs=None,
+                                      shard_size=PREVIEW_SHARD_SIZE):
+    """Estimates the total number of contributions from a random sample.
+
+    See `contributions_count_total` for the params, and
+    `add_preview_sampler` for `shard_size`.
+
+    :returns: a dict with `value` (estimated contributions), `error`
+        (see `scale_sample`), `sampled` and `population` (number of
+        documents sampled and matching the search) keys.
+    """
+
+    s = create_search(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
+
+    if exclude_unknown:
+        s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
+
+    s, sample = add_preview_sampler(s, shard_size=shard_size)
+    sample.metric('total_contribs',
+                  'cardinality',
+                  field=agg_field(data_source, DS_ID_FIELD[data_source]),
+                  precision_threshold=40000)
+    s = trim_response(aggregations_only(s),
+                      'hits.total',
+                      'aggregations.sample.doc_count',
+                      'aggregations.sample.total_contribs.value')
+
+    response = rs.execute(s)
+    population = __hits_total(response)
+    sampled = response_value(response, 'aggregations.sample.doc_count',
+                             default=0)
+
+    value, error = scale_sample(
+        response_value(response, 'aggregations.sample.total_contribs.value',
+                       default=0),
+        sampled, population)
+
+    return {'value': int(round(float(value))),
+            'error': float(error),
+            'sampled': sampled,
+            'population': population}
+
+
+def contributions_count_by_org_preview(data_source,
+                                       start_date,
+                                       end_date=None,
+                                       exclude_unknown=True,
+                                       exclude_bots=False,
+                                       exclude_merges=False,
+                                       include_orgs=None,
+                                       exclude_orgs=None,
+                                       shard_size=PREVIEW_SHARD_SIZE):
+    """Estimates contributions of each organization from a random sample.
+
+    See `contributions_count_by_org` for the params, and
+    `add_preview_sampler` for `shard_size`. Organizations without
+    contributions in the sample are missing.
+
+    :returns: a Pandas DataFrame with `organization`, `contributions`
+        (estimated) and `error` (see `scale_sample`) columns, sorted in
+        descending order by number of contributions. The number of
+        documents sampled and matching the search are in its `sampled` and
+        `population` attrs.
+    """
+
+    s = create_search(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
+
+    if exclude_unknown:
+        s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
+
+    s, sample = add_preview_sampler(s, shard_size=shard_size)
+    add_org_aggregation(sample, data_source)
+    s = trim_response(
+        aggregations_only(s),
+        'hits.total',
+        'aggregations.sample.doc_count',
+        *org_bucket_paths('aggregations.sample.organizations'))
+
+    response = rs.execute(s)
+
+    df = org_buckets_to_frame(
+        response_value(response, 'aggregations.sample.organizations.buckets',
+                       default=[]))
+    sampled = response_value(response, 'aggregations.sample.doc_count',
+                             default=0)
+    population = __hits_total(response)
+    contributions, error = scale_sample(df['contributions'].values,
+                                        sampled, population)
+
+    df = pandas.DataFrame({
+        'organization': df['organization'].values,
+        'contributions': numpy.round(contributions).astype('int64'),
+        'error': error
+    }, columns=['organization', 'contributions', 'error'])
+
+    df = df.sort_values('contributions', ascending=False,
+                        kind='mergesort', ignore_index=True)
+    df.attrs.update(sampled=sampled, population=population)
+
+    return df
+
+
+def __hits_total(response):
+    """Gets the number of documents matching a search from its response."""
+
+    total = response_value(response, 'hits.total', default=0)
+
+    # ES 7 returns an object with the value and its relation
+    return total['value'] if isinstance(total, dict) else total
+
+
+def contributions_count_by_author(data_source,
+                                  start_date,
+                                  end_date=None,
+                                  exclude_unknown=False,
+                                  exclude_bots=False,
+                                  exclude_merges=False,
+                                  include_orgs=None,
+                                  exclude_orgs=None):
+    """ Gets number of contributions of each author.
+
+    Authors are identified by their unique identity (`author_uuid`). All of
+    them are retrieved, paginating through a composite aggregation, and
+    returned in a memory-compact frame (see `compact_frame`).
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `author` (categorical) and
+        `contributions` columns, sorted in descending order by number of
+        contributions.
+    """
+
+    return __contributions_count_by_fields(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        fields={'author': AUTHOR_FIELD})
+
+
+def contributions_count_by_author_org(data_source,
+                                      start_date,
+                                      end_date=None,
+                                      exclude_unknown=False,
+                                      exclude_bots=False,
+                                      exclude_merges=False,
+                                      include_orgs=None,
+                                      exclude_orgs=None):
+    """ Gets number of contributions of each author and organization.
+
+    Authors affiliated to several organizations during the given dates
+    have a row per organization. Results are retrieved the same way as in
+    `contributions_count_by_author`.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `author`, `organization` (both
+        categorical) and `contributions` columns, sorted in descending order
+        by number of contributions.
+    """
+
+    return __contributions_count_by_fields(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        fields={'author': AUTHOR_FIELD, 'organization': ORG_FIELD})
+
+
+def contributions_count_by_org_daily(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     days=None):
+    """ Gets number of contributions of each organization per day.
+
+    Every contribution belongs to a single day, so daily counts can be
+    added up to get the exact number of contributions of any range of days.
+    Results are retrieved the same way as in `contributions_count_by_author`.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param days: optional UTC days to count contributions of, within the
+        date range (see `add_days_filter`).
+    :returns: a Pandas DataFrame with `day` (UTC midnight), `organization`
+        (categorical) and `contributions` columns, sorted by day.
+    """
+
+    return __contributions_count_by_sources(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        days=days,
+        sources={
+            'day': {'date_histogram': {'field': DATE_FIELD,
+                                       'interval': '1d'}},
+            'organization': {
+                'terms': {'field': agg_field(data_source, ORG_FIELD)}}
+        })
+
+
+def contributions_count_by_author_org_daily(data_source,
+                                            start_date,
+                                            end_date=None,
+                                            exclude_unknown=False,
+                                            exclude_bots=False,
+                                            exclude_merges=False,
+                                            include_orgs=None,
+                                            exclude_orgs=None):
+    """ Gets number of contributions of each author and organization per day.
+
+    Used to re-affiliate contributions depending on when they were sent.
+    Results are retrieved the same way as in `contributions_count_by_author`.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `day` (UTC midnight), `author`,
+        `organization` (both categorical) and `contributions` columns,
+        sorted by day.
+    """
+
+    return __contributions_count_by_sources(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        sources={
+            'day': {'date_histogram': {'field': DATE_FIELD,
+                                       'interval': '1d'}},
+            'author': {
+                'terms': {'field': agg_field(data_source, AUTHOR_FIELD)}},
+            'organization': {
+                'terms': {'field': agg_field(data_source, ORG_FIELD)}}
+        })
+
+
+def contributions_count_by_author_period(data_source,
+                                         start_date,
+                                         end_date=None,
+                                         interval='1M',
+                                         exclude_unknown=False,
+                                         exclude_bots=False,
+                                         exclude_merges=False,
+                                         include_orgs=None,
+                                         exclude_orgs=None):
+    """ Gets number of contributions of each author per period.
+
+    Periods are sorted, and so are authors within each period, so results
+    can be processed as they arrive. Results are retrieved the same way as
+    in `contributions_count_by_author`.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param interval: period length, as an ES date histogram interval (e.g.
+        `1w`, `1M`, `1q` or `1y`), monthly by default.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see `terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `period` (UTC start of the period),
+        `author` (categorical) and `contributions` columns.
+    """
+
+    return __contributions_count_by_sources(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        sources={
+            'period': {'date_histogram': {'field': DATE_FIELD,
+                                          'interval': interval}},
+            'author': {
+                'terms': {'field': agg_field(data_source, AUTHOR_FIELD)}}
+        })
+
+
+def last_enriched(data_source):
+    """ Gets when the last document of a data source was enriched.
+
+    :param data_source: `broomstick.core.DataSource`
+    :returns: the greatest `ENRICHED_FIELD` value, in milliseconds since
+        the epoch, or `None` if the index is empty.
+    """
+
+    s = create_search(data_source=data_source, start_date=None)
+
+    s.aggs.metric('last_enriched', 'max', field=ENRICHED_FIELD)
+    s = aggregations_only(s)
+
+    s = trim_response(s, 'aggregations.last_enriched.value')
+
+    value = response_value(rs.execute(s), 'aggregations.last_enriched.value')
+
+    return None if value is None else int(value)
+
+
+def enriched_days(data_source, since=None, until=None):
+    """ Gets the days of the documents enriched within a period.
+
+    Documents are enriched again when they change (e.g. when their author
+    affiliation is updated), so these are the days whose contributions may
+    have changed. Documents deleted in the meantime are not found.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param since: start of the period (inclusive), in milliseconds since
+        the epoch. `None` by default, means every document.
+    :param until: end of the period (inclusive), in milliseconds since
+        the epoch. `None` by default, means up to now.
+    :returns: a `pandas.DatetimeIndex` of UTC days, sorted.
+    """
+
+    s = create_search(data_source=data_source, start_date=None)
+
+    enriched = {'format': 'epoch_millis'}
+    if since is not None:
+        enriched['gte'] = since
+    if until is not None:
+        enriched['lte'] = until
+
+    if len(enriched) > 1:
+        s = s.filter('range', **{ENRICHED_FIELD: enriched})
+
+    sources = [{'day': {'date_histogram': {'field': DATE_FIELD,
+                                           'interval': '1d'}}}]
+
+    days = [bucket['key']['day']
+            for bucket in composite_buckets(s, sources, data_source)]
+
+    return pandas.DatetimeIndex(pandas.to_datetime(days, unit='ms', utc=True))
+
+
+def __contributions_count_by_fields(data_source, start_date, end_date,
+                                    exclude_unknown, exclude_bots,
+                                    exclude_merges, include_orgs,
+                                    exclude_orgs, fields):
+    """Counts contributions for every combination of values of `fields`.
+
+    :param fields: dict of column name to ES field name.
+    :returns: a compact frame with a categorical column per field and a
+        `contributions` column, sorted in descending order by number of
+        contributions.
+    """
+
+    df = __contributions_count_by_sources(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        sources={column: {'terms': {'field': agg_field(data_source, field)}}
+                 for column, field in fields.items()})
+
+    return df.sort_values('contributions', ascending=False,
+                          kind='mergesort', ignore_index=True)
+
+
+def __contributions_count_by_sources(data_source, start_date, end_date,
+                                     exclude_unknown, exclude_bots,
+                                     exclude_merges, include_orgs,
+                                     exclude_orgs, sources, days=None):
+    """Counts contributions for every bucket of a composite aggregation.
+
+    :param sources: dict of column name to composite aggregation source.
+        Terms sources produce categorical columns and date histogram sources
+        produce UTC datetime columns.
+    :param days: optional UTC days to count contributions of.
+    :returns: a compact frame with a column per source and a
+        `contributions` column, in the order returned by ES.
+    """
+
+    s = create_search(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      exclude_bots=exclude_bots,
+                      exclude_merges=exclude_merges,
+                      include_orgs=include_orgs,
+                      exclude_orgs=exclude_orgs)
 
     if exclude_unknown:
         s = exclude_org(s=s, org_name=UNKNOWN_ORG_NAME)
 
-    s.aggs.bucket('organizations',
-                  'terms',
-                  field='author_org_name',
-                  order={'total_contribs': 'desc'},
-                  size=1000)\
+    if days is not None:
+        s = add_days_filter(s, days)
+
+    columns = {column: [] for column in sources}
+    columns['contributions'] = []
+
+    composite_sources = [{column: source}
+                         for column, source in sources.items()]
+
+    for bucket in composite_buckets(s, composite_sources, data_source):
+        for column in sources:
+            columns[column].append(bucket['key'][column])
+        columns['contributions'].append(bucket['total_contribs']['value'])
+
+    categorical = [column for column, source in sources.items()
+                   if 'terms' in source]
+
+    df = compact_frame(columns, categorical=categorical)
+
+    for column, source in sources.items():
+        if 'date_histogram' in source:
+            df[column] = pandas.to_datetime(df[column], unit='ms', utc=True)
+
+    return df
+
+
+def composite_buckets(s, sources, data_source,
+                      page_size=COMPOSITE_PAGE_SIZE):
+    """Iterates over every bucket of a composite aggregation.
+
+    Each bucket counts the contributions of a combination of values of the
+    given sources. Pages are requested one after another, following the
+    `after_key` returned by ES.
+
+    :param s: the search we want to aggregate. It is not modified.
+    :param sources: composite aggregation sources.
+    :param data_source: `broomstick.core.DataSource`
+    :param page_size: number of buckets per request.
+    :returns: a generator of buckets, as returned by ES.
+    """
+
+    after_key = None
+
+    while True:
+        page = aggregations_only(s)
+
+        params = {'sources': sources, 'size': page_size}
+        if after_key:
+            params['after'] = after_key
+
+        page.aggs.bucket('composite_contribs', 'composite', **params)\
+            .metric('total_contribs',
+                    'cardinality',
+                    field=agg_field(data_source, DS_ID_FIELD[data_source]),
+                    precision_threshold=40000)
+
+        page = trim_response(
+            page,
+            'aggregations.composite_contribs.after_key',
+            'aggregations.composite_contribs.buckets.key',
+            'aggregations.composite_contribs.buckets.total_contribs.value')
+
+        agg = response_value(rs.execute(page),
+                             'aggregations.composite_contribs', default={})
+        buckets = agg.get('buckets', [])
+
+        yield from buckets
+
+        after_key = agg.get('after_key')
+
+        if not buckets or not after_key:
+            return
+
+
+@prof.profiled()
+def compact_frame(columns, categorical=()):
+    """Builds a memory-compact data frame.
+
+    String columns listed in `categorical` are stored as Pandas categories
+    and the rest of columns are downcast to the smallest numeric type able
+    to hold their values.
+
+    :param columns: dict of column name to list of values.
+    :param categorical: names of the columns to store as categories.
+    :returns: a Pandas DataFrame with the columns in the given order.
+    """
+
+    data = {}
+
+    for name, values in columns.items():
+        if name in categorical:
+            data[name] = pandas.Categorical(values)
+        else:
+            series = pandas.Series(values, dtype=None if values else 'int64')
+            data[name] = pandas.to_numeric(series, downcast='unsigned')
+
+    return pandas.DataFrame(data, columns=list(columns))
+
+
+def add_org_aggregation(s, data_source, size=MAX_ORGS):
+    """Adds an aggregation counting contributions by organization.
+
+    Organizations are sorted in descending order by number of contributions,
+    up to `size`.
+
+    :param s: the search, or the bucket aggregation, we want to update.
+    :param data_source: `broomstick.core.DataSource`
+    :param size: max number of organizations, `MAX_ORGS` by default.
+    :returns: the `organizations` terms aggregation.
+    """
+
+    aggs = s if isinstance(s, dsl.aggs.Agg) else s.aggs
+
+    return aggs.bucket('organizations',
+                       'terms',
+                       field=agg_field(data_source, ORG_FIELD),
+                       order={'total_contribs': 'desc'},
+                       size=size)\
         .metric('total_contribs',
                 'cardinality',
-                field=DS_ID_FIELD[data_source],
+                field=agg_field(data_source, DS_ID_FIELD[data_source]),
                 precision_threshold=40000)
-    s = s[0:0]
 
-    buckets = s.execute().to_dict()['aggregations']['organizations']['buckets']
+
+@prof.profiled()
+def org_buckets_to_frame(buckets):
+    """Converts `organizations` aggregation buckets into a data frame.
+
+    :param buckets: list of buckets as returned by ES.
+    :returns: a Pandas DataFrame with `organization` and `contributions`
+        columns.
+    """
+
+    if not buckets:
+        return pandas.DataFrame(columns=['organization', 'contributions'])
 
     contribs_by_org_df = pandas.json_normalize(buckets)
 
-    # remove `doc_count` column
-    contribs_by_org_df = contribs_by_org_df.drop(['doc_count'], axis=1)
+    # remove `doc_count` column, unless trimmed by ES already
+    contribs_by_org_df = contribs_by_org_df.drop(columns=['doc_count'],
+                                                 errors='ignore')
 
     contribs_by_org_df.rename(
         columns={
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+# Suffixes of the multi-fields usually holding an aggregatable copy of a
+# field, in order of preference
+AGGREGATABLE_SUFFIXES = ('', '.keyword', '.raw')
+
+# Field types whose aggregations need fielddata instead of doc values
+FIELDDATA_TYPES = ('text',)
+
+# Field capabilities by index (or alias, or pattern)
+__caps = {}
+__caps_lock = threading.Lock()
+
+
+def field_caps(es, index):
+    """Gets the capabilities of every field of an index.
+
+    Capabilities are retrieved once per index and cached afterwards.
+
+    :param es: ES connection.
+    :param index: index name, alias or pattern.
+    :returns: dict of field name to dict of field type to capabilities,
+        as returned by the ES `_field_caps` API. Fields mapped with
+        different types in the indexes matching `index` have several
+        types.
+    """
+    with __caps_lock:
+        if index not in __caps:
+            __caps[index] = es.field_caps(index=index, fields='*')['fields']
+        return __caps[index]
+
+
+def clear_cache():
+    """Forgets every field capability retrieved so far."""
+    with __caps_lock:
+        __caps.clear()
+
+
+def aggregatable_field(es, index, field):
+    """Picks the cheapest aggregatable variant of a field.
+
+    Variants are the field itself and its `AGGREGATABLE_SUFFIXES`
+    multi-fields. Doc values backed variants are preferred, and
+    fielddata backed ones are only used if there is nothing else.
+
+    :param es: ES connection.
+    :param index: index name, alias or pattern.
+    :param field: field name.
+    :returns: the name of the field to aggregate on.
+    :raises ValueError: if neither the field nor its variants can be
+        aggregated in every index matching `index`.
+    """
+    caps = field_caps(es, index)
+
+    variants = [field + suffix for suffix in AGGREGATABLE_SUFFIXES
+                if field + suffix in caps]
+
+    if not variants:
+        raise ValueError("Field '{}' not found in '{}'".format(field, index))
+
+    for doc_values_only in (True, False):
+        for variant in variants:
+            if __is_aggregatable(caps[variant], doc_values_only):
+                if not doc_values_only:
+                    logger.warning("Aggregating '%s' in '%s' uses fielddata",
+                                   variant, index)
+                return variant
+
+    raise ValueError("Field '{}' is not aggregatable in '{}'"
+                     .format(field, index))
+
+
+def __is_aggregatable(types, doc_values_only):
+    """Checks whether a field is aggregatable in every index.
+
+    :param types: dict of field type to capabilities.
+    :param doc_values_only: whether or not to reject fielddata types.
+    """
+    for field_type, caps in types.items():
+        if not caps.get('aggregatable') \
+                or caps.get('non_aggregatable_indices'):
+            return False
+
+        if doc_values_only and field_type in FIELDDATA_TYPES:
+            return False
+
+    return True
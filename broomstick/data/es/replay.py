@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import collections
+import gzip
+import json
+import threading
+import time
+
+from elasticsearch import RequestsHttpConnection
+from elasticsearch.connection import Connection
+from elasticsearch.exceptions import TransportError
+
+
+# Params not sent to ES, or not changing the response
+IGNORED_PARAMS = ('request_timeout',)
+
+
+def request_key(method, url, params=None, body=None):
+    """Builds the key identifying a request within a recording.
+
+    Bodies are compared by their JSON content, so the order of their keys
+    doesn't matter.
+
+    :param method: HTTP method.
+    :param url: request path.
+    :param params: query string params.
+    :param body: request body, as a string or bytes.
+    :returns: a string.
+    """
+    params = {name: str(value) for name, value in (params or {}).items()
+              if name not in IGNORED_PARAMS}
+
+    if isinstance(body, bytes):
+        body = body.decode('utf-8')
+
+    try:
+        body = json.loads(body) if body else None
+    except ValueError:
+        # Not a single JSON document, e.g. `_msearch` bodies
+        pass
+
+    return json.dumps([method, url, params, body], sort_keys=True)
+
+
+class RecordingConnection(RequestsHttpConnection):
+    """ES connection saving every successful request and its response.
+
+    Recordings are gzip compressed JSON Lines files that can be served
+    later by `ReplayConnection`. New requests are appended to the file.
+
+    :param recording: path to the recording file.
+    """
+
+    # Connections of the same client write to the same file
+    __lock = threading.Lock()
+
+    def __init__(self, recording, **kwargs):
+        super().__init__(**kwargs)
+        self.recording = recording
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        status, response_headers, data = super().perform_request(
+            method, url, params=params, body=body, timeout=timeout,
+            ignore=ignore, headers=headers)
+
+        line = json.dumps({
+            'request': request_key(method, url, params, body),
+            'status': status,
+            'headers': dict(response_headers),
+            'response': data
+        })
+
+        with self.__lock, gzip.open(self.recording, 'at') as f:
+            f.write(line + '\n')
+
+        return status, response_headers, data
+
+
+class ReplayConnection(Connection):
+    """ES connection serving responses from a recording.
+
+    Identical requests recorded several times are answered in the same
+    order, repeating the last answer once they are exhausted. Requests
+    that weren't recorded fail with a `TransportError`.
+
+    :param recording: path to a recording made with `RecordingConnection`.
+    :param latency: seconds to wait before answering each request, to
+        simulate a real cluster.
+    """
+
+    def __init__(self, recording, latency=0, **kwargs):
+        super().__init__(**kwargs)
+        self.recording = recording
+        self.latency = float(latency)
+        self.__responses = collections.defaultdict(list)
+        self.__served = collections.Counter()
+        self.__lock = threading.Lock()
+
+        with gzip.open(recording, 'rt') as f:
+            for line in f:
+                record = json.loads(line)
+                self.__responses[record['request']].append(record)
+
+    def perform_request(self, method, url, params=None, body=None,
+                        timeout=None, ignore=(), headers=None):
+        if self.latency:
+            time.sleep(self.latency)
+
+        key = request_key(method, url, params, body)
+
+        with self.__lock:
+            responses = self.__responses.get(key)
+
+            if not responses:
+                raise TransportError('N/A',
+                                     'Request not found in recording',
+                                     key)
+
+            record = responses[min(self.__served[key], len(responses) - 1)]
+            self.__served[key] += 1
+
+        status = record['status']
+        data = record['response']
+
+        if not (200 <= status < 300) and status not in ignore:
+            self._raise_error(status, data)
+
+        return status, record['headers'], data
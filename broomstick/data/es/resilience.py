@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import logging
+import random
+import threading
+import time
+
+from broomstick import profiling as prof
+from broomstick.lazy import lazy_import
+
+exceptions = lazy_import('elasticsearch.exceptions')
+
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes meaning the cluster is overloaded, so it is worth
+# trying again a bit later
+RETRY_STATUSES = (429, 503)
+
+# Default retry policy: max number of retries after the first attempt,
+# initial and max backoff between attempts, and max seconds a call may
+# take including retries
+MAX_RETRIES = 5
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+DEADLINE = 300
+
+# Consecutive failures opening a circuit, and seconds to wait before
+# letting a trial request go through
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+__breakers = {}
+__breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised when a cluster is not called because its circuit is open."""
+
+
+class CircuitBreaker:
+    """Stops calling a cluster after too many consecutive failures.
+
+    The circuit opens after `failure_threshold` consecutive failures. Once
+    `reset_timeout` seconds have passed, a single trial call is let
+    through: the circuit closes if it succeeds and opens again otherwise.
+
+    :param failure_threshold: consecutive failures opening the circuit.
+    :param reset_timeout: seconds to wait before a trial call.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD,
+                 reset_timeout=RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.__trial = False
+        self.__lock = threading.Lock()
+
+    def allow(self):
+        """Checks whether a call can be done now.
+
+        :returns: `True` if the circuit is closed, or if it is the trial
+            call of an open circuit.
+        """
+        with self.__lock:
+            if self.opened_at is None:
+                return True
+
+            if self.__trial \
+                    or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+
+            self.__trial = True
+            return True
+
+    def record_success(self):
+        with self.__lock:
+            self.failures = 0
+            self.opened_at = None
+            self.__trial = False
+
+    def record_failure(self):
+        with self.__lock:
+            self.failures += 1
+            if self.__trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.__trial = False
+
+
+def get_breaker(cluster):
+    """Gets the circuit breaker of a cluster, creating it if needed.
+
+    :param cluster: any hashable identifying the cluster.
+    :returns: a `CircuitBreaker`.
+    """
+    with __breakers_lock:
+        if cluster not in __breakers:
+            __breakers[cluster] = CircuitBreaker()
+        return __breakers[cluster]
+
+
+def cluster_name(client):
+    """Names the cluster a client sends requests to.
+
+    Only hosts and ports are used, as client reprs include credentials.
+
+    :param client: `elasticsearch.Elasticsearch` client, or the alias of
+        an `elasticsearch_dsl` connection.
+    :returns: a string like `localhost:9200`, suitable as breaker key and
+        for error messages.
+    """
+    if isinstance(client, str):
+        return client
+
+    hosts = getattr(getattr(client, 'transport', None), 'hosts', None) or []
+
+    return ','.join(sorted('{}:{}'.format(host.get('host'), host.get('port'))
+                           for host in hosts if isinstance(host, dict)))
+
+
+def reset_breakers():
+    """Forgets the state of every circuit breaker."""
+    with __breakers_lock:
+        __breakers.clear()
+
+
+def is_retryable(error):
+    """Checks whether a failed call is worth retrying.
+
+    :param error: exception raised by the ES client.
+    :returns: `True` for overloaded clusters and connection errors
+        (including timeouts).
+    """
+    if isinstance(error, exceptions.ConnectionError):
+        return True
+
+    return isinstance(error, exceptions.TransportError) \
+        and error.status_code in RETRY_STATUSES
+
+
+def backoff_delay(attempt, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+    """Computes how long to wait before retrying.
+
+    Uses exponential backoff with full jitter, so concurrent clients
+    hitting the same overloaded cluster spread their retries.
+
+    :param attempt: number of the failed attempt, starting at 0.
+    :param backoff: delay base, in seconds.
+    :param max_backoff: max delay, in seconds.
+    :returns: seconds to wait.
+    """
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+def execute(s,
+            deadline=DEADLINE,
+            max_retries=MAX_RETRIES,
+            backoff=BACKOFF,
+            max_backoff=MAX_BACKOFF):
+    """Executes a search, retrying if the cluster is overloaded.
+
+    Every attempt is limited to the time left until the deadline. Calls
+    to a cluster whose circuit is open fail straight away.
+
+    :param s: `elasticsearch_dsl.Search` or `elasticsearch_dsl.MultiSearch`
+        to execute.
+    :param deadline: max seconds the call may take, including retries.
+    :param max_retries: max number of retries after the first attempt.
+    :param backoff: delay base between attempts, in seconds.
+    :param max_backoff: max delay between attempts, in seconds.
+    :returns: the response, as a dict, or a list of them for multi
+        searches.
+    :raises CircuitOpenError: if the cluster circuit is open.
+    :raises elasticsearch.exceptions.TransportError: if the call fails and
+        cannot be retried, there are no retries left, or the deadline is
+        reached.
+    """
+    cluster = cluster_name(s._using)
+    breaker = get_breaker(cluster)
+    expires = time.monotonic() + deadline
+    attempt = 0
+
+    while True:
+        if not breaker.allow():
+            raise CircuitOpenError("Circuit open for {}".format(cluster))
+
+        try:
+            with prof.stage('http'):
+                response = s.params(
+                    request_timeout=max(expires - time.monotonic(), 0))\
+                    .execute()
+        except exceptions.TransportError as e:
+            if not is_retryable(e):
+                # The cluster answered, the request was wrong
+                breaker.record_success()
+                raise
+
+            breaker.record_failure()
+
+            delay = backoff_delay(attempt, backoff, max_backoff)
+            if attempt >= max_retries \
+                    or time.monotonic() + delay >= expires:
+                raise
+
+            logger.warning("Search failed with %s, retrying in %.2fs",
+                           e.status_code, delay)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except Exception:
+            # Every call must be recorded, or a trial call would keep the
+            # circuit open forever
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+
+        # Multi searches return a response per search
+        with prof.stage('to_dict'):
+            if isinstance(response, list):
+                response = [r.to_dict() for r in response]
+            else:
+                response = response.to_dict()
+
+        for r in response if isinstance(response, list) else [response]:
+            report_shard_failures(r)
+
+        return response
+
+
+def report_shard_failures(response):
+    """Logs the shards failing to answer a search.
+
+    Results are still returned when some shards fail, but they only
+    cover the shards that answered.
+
+    :param response: search response, as a dict.
+    :returns: number of failed shards.
+    """
+    shards = response.get('_shards', {})
+    failed = shards.get('failed', 0)
+
+    if failed:
+        reasons = {failure.get('reason', {}).get('type', 'unknown')
+                   for failure in shards.get('failures', [])}
+        logger.warning("Partial results, %s of %s shards failed: %s",
+                       failed, shards.get('total'),
+                       ', '.join(sorted(reasons)))
+
+    return failed
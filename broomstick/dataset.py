@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import datetime
+import json
+import numbers
+
+from broomstick.lazy import lazy_import
+
+pandas = lazy_import('pandas')
+
+
+# Partition columns, in directory order
+PARTITION_COLUMNS = ['project', 'data_source', 'date']
+
+# Columns of every results dataset. Results are stored in long format: a
+# row per numeric field of each record, named `field`, and the rest of
+# non-numeric fields (e.g. `organization`) as a JSON object in `labels`
+RESULT_COLUMNS = PARTITION_COLUMNS + ['metric', 'start_date', 'end_date',
+                                      'labels', 'field', 'value',
+                                      'computed_at']
+
+# Record fields stored in their own columns instead of `labels`
+RECORD_COLUMNS = ('metric', 'data_source', 'start_date', 'end_date')
+
+# Operators accepted in read filters
+FILTER_OPERATORS = ('=', '==', '!=', '<', '<=', '>', '>=', 'in', 'not in')
+
+
+def records_to_frame(records, project, computed_at=None):
+    """Converts metric records into rows of a results dataset.
+
+    :param records: list of records (see `broomstick.runner.to_records`).
+    :param project: project the metrics were computed for.
+    :param computed_at: when metrics were computed, now by default.
+    :returns: a Pandas DataFrame with `RESULT_COLUMNS`. The `date` of
+        each row is the end of its window, or the computation date for
+        windows without end.
+    """
+
+    computed_at = pandas.Timestamp(computed_at or datetime.datetime.utcnow())
+    rows = []
+
+    for record in records:
+        labels = {}
+        values = {}
+
+        for name, value in record.items():
+            if name in RECORD_COLUMNS:
+                continue
+            if value is None or isinstance(value, numbers.Number):
+                values[name] = value
+            else:
+                labels[name] = value
+
+        end_date = record.get('end_date')
+        date = pandas.Timestamp(end_date) if end_date else computed_at
+
+        common = {
+            'project': project,
+            'data_source': record.get('data_source'),
+            'date': date.strftime('%Y-%m-%d'),
+            'metric': record.get('metric'),
+            'start_date': record.get('start_date'),
+            'end_date': end_date,
+            'labels': json.dumps(labels, sort_keys=True, default=str),
+            'computed_at': computed_at
+        }
+
+        for field, value in values.items():
+            row = dict(common, field=field, value=value)
+            rows.append(row)
+
+    df = pandas.DataFrame(rows, columns=RESULT_COLUMNS)
+    df['value'] = df['value'].astype('float64')
+    df['computed_at'] = pandas.to_datetime(df['computed_at'])
+
+    return df
+
+
+def write_results(records, root, project, computed_at=None):
+    """Appends metric records to a partitioned Parquet dataset.
+
+    Results are partitioned by project, data source and date (see
+    `PARTITION_COLUMNS`), in Hive layout (`project=.../data_source=...`).
+    Every call adds new files, so results computed again are kept along
+    with the previous ones (see `computed_at`). Requires `pyarrow`.
+
+    :param records: list of records (see `broomstick.runner.to_records`).
+    :param root: dataset directory, created if needed.
+    :param project: project the metrics were computed for.
+    :param computed_at: when metrics were computed, now by default.
+    :returns: the number of rows written.
+    """
+
+    df = records_to_frame(records, project, computed_at=computed_at)
+
+    if not df.empty:
+        df.to_parquet(root, engine='pyarrow', index=False,
+                      partition_cols=PARTITION_COLUMNS)
+
+    return len(df)
+
+
+def read_results(root, filters=None, columns=None, latest=False,
+                 **equals):
+    """Reads a results dataset, loading only the data matching the filters.
+
+    Filters on partition columns skip whole directories, and the rest
+    skip row groups using Parquet statistics. Requires `pyarrow`.
+
+        read_results('results', project='grimoirelab',
+                     metric='elephant_factor',
+                     filters=[('date', '>=', '2019-01-01')])
+
+    :param root: dataset directory.
+    :param filters: list of `(column, operator, value)` tuples, all of them
+        must match (see `FILTER_OPERATORS`).
+    :param columns: columns to read, all of `RESULT_COLUMNS` by default.
+    :param latest: whether or not to keep only the latest computation of
+        each metric value.
+    :param equals: filters on column values, e.g. `project='grimoirelab'`.
+        Lists and tuples match any of their values.
+    :returns: a Pandas DataFrame.
+    """
+
+    filters = list(filters or [])
+
+    for column, value in equals.items():
+        if isinstance(value, (list, tuple, set)):
+            filters.append((column, 'in', list(value)))
+        else:
+            filters.append((column, '==', value))
+
+    for column, operator, _ in filters:
+        if column not in RESULT_COLUMNS:
+            raise ValueError("Unknown column '{}', expected one of {}"
+                             .format(column, RESULT_COLUMNS))
+        if operator not in FILTER_OPERATORS:
+            raise ValueError("Unknown operator '{}', expected one of {}"
+                             .format(operator, FILTER_OPERATORS))
+
+    df = pandas.read_parquet(root, engine='pyarrow', columns=columns,
+                             filters=filters or None)
+
+    # Partition values are read as categories, at the end
+    for column in PARTITION_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(str)
+
+    df = df[[column for column in RESULT_COLUMNS if column in df.columns]]
+
+    if latest:
+        key = [column for column in RESULT_COLUMNS
+               if column not in ('value', 'computed_at')]
+        df = df.sort_values('computed_at', kind='mergesort')\
+            .drop_duplicates(key, keep='last')\
+            .sort_index()
+
+    return df.reset_index(drop=True)
@@ -0,0 +1,516 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import argparse
+import collections
+import contextlib
+import itertools
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+from broomstick import cli, report, runner
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds a worker owns a job for, unless renewed. Jobs of workers that
+# crash are run again once their lease expires
+LEASE = 300
+
+# Times a job is run before giving up
+MAX_ATTEMPTS = 3
+
+# Seconds between queue checks of workers waiting for jobs
+POLL_INTERVAL = 5
+
+# Seconds to wait for other processes to release the database
+DB_TIMEOUT = 60
+
+# `summary` jobs compute several metrics from an organization summary
+# search, `metric` jobs run a single metric
+JOB_KINDS = ('summary', 'metric')
+
+JOB_STATES = ('pending', 'running', 'done', 'failed')
+
+# The default rollback journal is used, instead of WAL, so the database
+# can be shared over network filesystems
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    tasks TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT,
+    result TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id);
+"""
+
+# A job claimed by a worker
+Job = collections.namedtuple('Job', ['id', 'kind', 'tasks', 'attempts'])
+
+
+def connect(path):
+    """Opens a job queue, creating it if needed.
+
+    :param path: path to the SQLite database.
+    :returns: a `sqlite3.Connection`, in autocommit mode (see
+        `transaction`).
+    """
+
+    conn = sqlite3.connect(path, timeout=DB_TIMEOUT, isolation_level=None)
+    conn.executescript(SCHEMA)
+
+    return conn
+
+
+@contextlib.contextmanager
+def transaction(conn):
+    """Runs statements in a transaction holding the database write lock.
+
+    :param conn: job queue connection.
+    :returns: a context manager, committing on exit or rolling back if an
+        exception is raised.
+    """
+
+    conn.execute('BEGIN IMMEDIATE')
+
+    try:
+        yield conn
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+
+    conn.execute('COMMIT')
+
+
+def submit_spec(conn, spec):
+    """Adds the jobs computing a report specification to the queue.
+
+    See `submit_plan`.
+
+    :param conn: job queue connection.
+    :param spec: report specification, or the path to it (see
+        `broomstick.report.load_spec`).
+    :returns: the number of jobs added.
+    """
+
+    if isinstance(spec, str):
+        spec = report.load_spec(spec)
+
+    return submit_plan(conn, report.compile_spec(spec))
+
+
+def submit_plan(conn, plan):
+    """Adds the jobs computing an execution plan to the queue.
+
+    Tasks sharing an organization summary make a single job, and the rest
+    of tasks a job each. Jobs already in the queue are not added again, so
+    submitting the same plan twice resumes it instead of running it again.
+
+    :param conn: job queue connection.
+    :param plan: a `broomstick.report.Plan`.
+    :returns: the number of jobs added.
+    """
+
+    jobs = [('summary', tasks) for tasks in plan.summaries.values()]
+    jobs += [('metric', [task]) for task in plan.standalone]
+
+    added = 0
+
+    with transaction(conn):
+        for kind, tasks in jobs:
+            tasks = json.dumps([task_to_dict(task) for task in tasks],
+                               sort_keys=True, default=str)
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO jobs (key, kind, tasks, updated) '
+                'VALUES (?, ?, ?, ?)',
+                (kind + ':' + tasks, kind, tasks, time.time()))
+            added += cursor.rowcount
+
+    return added
+
+
+def task_to_dict(task):
+    """Converts a `broomstick.report.Task` into a JSON serializable dict."""
+
+    task = task._asdict()
+    task['data_source'] = task['data_source'].name.lower()
+
+    return task
+
+
+def task_from_dict(task):
+    """Converts a dict made by `task_to_dict` back into a task."""
+
+    task = dict(task)
+    task['data_source'] = runner.parse_data_source(task['data_source'])
+
+    return report.Task(**task)
+
+
+def claim(conn, worker, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+    """Takes the next job to run.
+
+    Pending jobs are taken in order, as well as jobs whose worker lease
+    expired. Jobs expired after `max_attempts` are marked as failed.
+
+    :param conn: job queue connection.
+    :param worker: worker identifier.
+    :param lease: seconds the job is owned by the worker (see `renew`).
+    :param max_attempts: times a job is run before giving up.
+    :returns: a `Job`, or `None` if there are no jobs to run.
+    """
+
+    now = time.time()
+
+    with transaction(conn):
+        conn.execute(
+            "UPDATE jobs SET state = 'failed', error = 'lease expired', "
+            "updated = ? WHERE state = 'running' AND lease_expires < ? "
+            "AND attempts >= ?",
+            (now, now, max_attempts))
+
+        row = conn.execute(
+            "SELECT id, kind, tasks, attempts FROM jobs "
+            "WHERE state = 'pending' "
+            "OR (state = 'running' AND lease_expires < ?) "
+            "ORDER BY id LIMIT 1",
+            (now,)).fetchone()
+
+        if row is None:
+            return None
+
+        job_id, kind, tasks, attempts = row
+
+        conn.execute(
+            "UPDATE jobs SET state = 'running', worker = ?, "
+            "attempts = attempts + 1, lease_expires = ?, updated = ? "
+            "WHERE id = ?",
+            (worker, now + lease, now, job_id))
+
+    return Job(id=job_id,
+               kind=kind,
+               tasks=[task_from_dict(task) for task in json.loads(tasks)],
+               attempts=attempts + 1)
+
+
+def renew(conn, job, worker, lease=LEASE):
+    """Extends the lease of a running job.
+
+    :param conn: job queue connection.
+    :param job: the `Job`.
+    :param worker: identifier of the worker running it.
+    :param lease: seconds from now the job is owned by the worker.
+    :returns: whether the worker still owns the job.
+    """
+
+    cursor = conn.execute(
+        "UPDATE jobs SET lease_expires = ?, updated = ? "
+        "WHERE id = ? AND worker = ? AND state = 'running'",
+        (time.time() + lease, time.time(), job.id, worker))
+
+    return cursor.rowcount == 1
+
+
+def complete(conn, job, worker, records):
+    """Saves the results of a job.
+
+    Results are only saved if the worker still owns the job, so jobs run
+    twice after a lease expired are saved once.
+
+    :param conn: job queue connection.
+    :param job: the `Job`.
+    :param worker: identifier of the worker running it.
+    :param records: list of records (see `broomstick.runner.to_records`).
+    :returns: whether the results were saved.
+    """
+
+    cursor = conn.execute(
+        "UPDATE jobs SET state = 'done', result = ?, error = NULL, "
+        "updated = ? WHERE id = ? AND worker = ? AND state = 'running'",
+        (json.dumps(records, default=str), time.time(), job.id, worker))
+
+    return cursor.rowcount == 1
+
+
+def fail(conn, job, worker, error, max_attempts=MAX_ATTEMPTS):
+    """Records a job failure, leaving it pending unless out of attempts.
+
+    :param conn: job queue connection.
+    :param job: the `Job`.
+    :param worker: identifier of the worker running it.
+    :param error: error message.
+    :param max_attempts: times a job is run before giving up.
+    :returns: the new state of the job.
+    """
+
+    state = 'failed' if job.attempts >= max_attempts else 'pending'
+
+    conn.execute(
+        "UPDATE jobs SET state = ?, error = ?, updated = ? "
+        "WHERE id = ? AND worker = ? AND state = 'running'",
+        (state, error, time.time(), job.id, worker))
+
+    return state
+
+
+def run_job(job):
+    """Computes the metrics of a job.
+
+    :param job: the `Job`.
+    :returns: a list of records (see `broomstick.runner.to_records`).
+    """
+
+    if job.kind == 'metric':
+        task = job.tasks[0]
+        return runner.run_metric(task.metric, task.data_source,
+                                 task.start_date, task.end_date,
+                                 **task.params)
+
+    from broomstick.data.es import common as com
+    from broomstick.data.es import resilience as rs
+
+    # Tasks of a summary job share their query params
+    task = job.tasks[0]
+    response = rs.execute(com.org_summary_search(
+        data_source=task.data_source,
+        start_date=task.start_date,
+        end_date=task.end_date,
+        **json.loads(report.summary_query_params(task.params))))
+
+    return list(itertools.chain.from_iterable(
+        report.run_summary_task(task, response) for task in job.tasks))
+
+
+def work(path, worker=None, lease=LEASE, max_attempts=MAX_ATTEMPTS,
+         wait=False, poll_interval=POLL_INTERVAL):
+    """Runs jobs from a queue until there are none left.
+
+    The lease of the running job is renewed in background, so jobs only
+    run again if their worker dies. Any number of workers can share a
+    queue.
+
+    :param path: path to the job queue database.
+    :param worker: worker identifier, host name and process id by default.
+    :param lease: seconds a job is owned by the worker without renewing.
+    :param max_attempts: times a job is run before giving up.
+    :param wait: whether or not to wait for jobs run by other workers,
+        which may fail and be left pending, instead of returning as soon as
+        there are no pending jobs.
+    :param poll_interval: seconds between queue checks when waiting.
+    :returns: the number of jobs completed by this worker.
+    """
+
+    worker = worker or '{}:{}'.format(socket.gethostname(), os.getpid())
+    conn = connect(path)
+    completed = 0
+
+    try:
+        while True:
+            job = claim(conn, worker, lease=lease, max_attempts=max_attempts)
+
+            if job is None:
+                if not wait or not count_states(conn).get('running'):
+                    return completed
+
+                time.sleep(poll_interval)
+                continue
+
+            stop = threading.Event()
+            heartbeat = threading.Thread(
+                target=__renew_lease, args=(path, job, worker, lease, stop),
+                daemon=True)
+            heartbeat.start()
+
+            try:
+                records = run_job(job)
+            except Exception as e:
+                state = fail(conn, job, worker, repr(e),
+                             max_attempts=max_attempts)
+                logger.warning("Job %s failed (attempt %s), %s: %r",
+                               job.id, job.attempts, state, e)
+                continue
+            finally:
+                stop.set()
+                heartbeat.join()
+
+            if complete(conn, job, worker, records):
+                completed += 1
+    finally:
+        conn.close()
+
+
+def retry_failed(conn):
+    """Leaves failed jobs pending again, with all their attempts.
+
+    :param conn: job queue connection.
+    :returns: the number of jobs to retry.
+    """
+
+    cursor = conn.execute(
+        "UPDATE jobs SET state = 'pending', attempts = 0, updated = ? "
+        "WHERE state = 'failed'",
+        (time.time(),))
+
+    return cursor.rowcount
+
+
+def count_states(conn):
+    """Counts the jobs in each state.
+
+    :param conn: job queue connection.
+    :returns: a dict of state to number of jobs, for every `JOB_STATES`.
+    """
+
+    counts = dict.fromkeys(JOB_STATES, 0)
+    counts.update(conn.execute(
+        'SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    return counts
+
+
+def results(conn):
+    """Gets the results of every completed job.
+
+    :param conn: job queue connection.
+    :returns: a list of records (see `broomstick.runner.to_records`), in
+        the order jobs were submitted.
+    """
+
+    rows = conn.execute(
+        "SELECT result FROM jobs WHERE state = 'done' ORDER BY id")
+
+    return list(itertools.chain.from_iterable(
+        json.loads(result) for result, in rows))
+
+
+def create_parser():
+    """Creates the command line parser."""
+
+    parser = argparse.ArgumentParser(
+        prog='broomstick-jobs',
+        description="Compute Broomstick reports with a queue of jobs "
+                    "shared by any number of workers.")
+    parser.add_argument('-q', '--queue', default='broomstick-jobs.sqlite',
+                        help="job queue database (default: %(default)s)")
+
+    commands = parser.add_subparsers(dest='command', metavar='command')
+    commands.required = True
+
+    submit = commands.add_parser('submit',
+                                 help="add the jobs of a report to the queue")
+    submit.add_argument('spec', help="report specification, YAML or JSON")
+
+    worker = commands.add_parser('work', help="run jobs from the queue")
+    worker.add_argument('-c', '--config', default='.settings',
+                        help="ElasticSearch settings file "
+                             "(default: %(default)s)")
+    worker.add_argument('--lease', type=float, default=LEASE,
+                        help="seconds before jobs of dead workers are run "
+                             "again (default: %(default)s)")
+    worker.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help="times a job is run before giving up "
+                             "(default: %(default)s)")
+    worker.add_argument('--wait', action='store_true',
+                        help="wait for jobs run by other workers to finish")
+
+    commands.add_parser('status', help="count the jobs in each state")
+    commands.add_parser('retry', help="run failed jobs again")
+
+    output = commands.add_parser('results',
+                                 help="write the results of completed jobs")
+    output.add_argument('-o', '--output', default='-',
+                        help="output file, `-` for stdout "
+                             "(default: %(default)s)")
+    output.add_argument('-f', '--format', default='jsonl',
+                        choices=cli.OUTPUT_FORMATS,
+                        help="output format (default: %(default)s)")
+    output.add_argument('--project',
+                        help="project the report is computed for, "
+                             "required by `dataset` output")
+
+    return parser
+
+
+def main(argv=None):
+    """Entry point for the `broomstick-jobs` console script."""
+
+    args = create_parser().parse_args(argv)
+
+    if args.command == 'work':
+        from broomstick.data.es import common as com
+
+        com.create_es_connection(config_file=args.config)
+
+        completed = work(args.queue, lease=args.lease,
+                         max_attempts=args.max_attempts, wait=args.wait)
+        sys.stderr.write("{} jobs completed\n".format(completed))
+
+        return 0
+
+    conn = connect(args.queue)
+
+    try:
+        if args.command == 'submit':
+            added = submit_spec(conn, args.spec)
+            sys.stderr.write("{} jobs added\n".format(added))
+        elif args.command == 'status':
+            sys.stdout.write(json.dumps(count_states(conn)) + '\n')
+        elif args.command == 'retry':
+            retried = retry_failed(conn)
+            sys.stderr.write("{} jobs to retry\n".format(retried))
+        else:
+            cli.write_output(results(conn), args.output, args.format,
+                             project=args.project)
+    finally:
+        conn.close()
+
+    return 0
+
+
+def __renew_lease(path, job, worker, lease, stop):
+    """Renews the lease of a job until `stop` is set."""
+
+    conn = connect(path)
+
+    try:
+        while not stop.wait(lease / 3):
+            if not renew(conn, job, worker, lease=lease):
+                logger.warning("Job %s lease lost", job.id)
+                return
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import importlib
+
+
+class LazyModule:
+    """Stands for a module that is only imported on first attribute access.
+
+    Attributes are always read from the imported module, so they can be
+    patched in tests as usual.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes not set on the proxy itself
+        return getattr(self.load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return "<lazy module '{}' ({})>".format(self._name, state)
+
+    def load(self):
+        """Imports the module, if not done yet.
+
+        :returns: the module.
+        """
+
+        if self._module is None:
+            # The import system takes care of concurrent imports
+            self._module = importlib.import_module(self._name)
+
+        return self._module
+
+
+def lazy_import(name):
+    """Returns a module to be imported on first use.
+
+    Heavy dependencies (pandas, the ES clients...) are imported this way,
+    so importing Broomstick modules stays cheap for processes that don't
+    end up using them.
+
+    :param name: absolute module name, e.g. `elasticsearch_dsl`.
+    :returns: a `LazyModule`.
+    """
+
+    return LazyModule(name)
+
+
+def lazy_attributes(module_globals, attributes):
+    """Builds a module `__getattr__` resolving some names lazily.
+
+    :param module_globals: `globals()` of the module, where names are
+        cached once resolved.
+    :param attributes: dict mapping names to the `module` or
+        `module:attribute` they stand for.
+    :returns: a function to be assigned to the module `__getattr__`.
+    """
+
+    def __getattr__(name):
+        if name not in attributes:
+            raise AttributeError("module '{}' has no attribute '{}'"
+                                 .format(module_globals['__name__'], name))
+
+        module_name, _, attr = attributes[name].partition(':')
+        value = importlib.import_module(module_name)
+        if attr:
+            value = getattr(value, attr)
+
+        module_globals[name] = value
+
+        return value
+
+    return __getattr__
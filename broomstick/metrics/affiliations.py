@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import functools
+import json
+import os
+
+from broomstick.lazy import lazy_import
+
+numpy = lazy_import('numpy')
+pandas = lazy_import('pandas')
+
+# Columns of an affiliation override table. Rows with an `author` (UUID)
+# re-affiliate that author, rows without it rename an `organization`.
+# Author rows with a `start` or `end` date (UTC, end excluded) only
+# re-affiliate the contributions sent between those dates.
+AFFILIATION_COLUMNS = ['author', 'organization', 'affiliation', 'start',
+                       'end']
+
+
+def load_affiliations(path):
+    """Loads an affiliation override table.
+
+    Tables can be CSV or Parquet files (requires `pyarrow`) with
+    `AFFILIATION_COLUMNS` columns, or SortingHat identities exports
+    (`.json`, see `sortinghat_affiliations`). Tables are cached by path
+    until the file is modified.
+
+    :param path: path to the table.
+    :returns: a Pandas DataFrame with `AFFILIATION_COLUMNS` columns. It is
+        a copy, so callers may modify it.
+    """
+
+    return __load_affiliations(path, os.stat(path).st_mtime_ns).copy()
+
+
+@functools.lru_cache(maxsize=8)
+def __load_affiliations(path, mtime):
+    """Loads an affiliation override table, see `load_affiliations`.
+
+    :param mtime: modification time of the file, so changes are loaded.
+    """
+
+    if path.endswith('.parquet'):
+        affiliations = pandas.read_parquet(path)
+    elif path.endswith('.json'):
+        with open(path) as f:
+            affiliations = sortinghat_affiliations(json.load(f))
+    else:
+        affiliations = pandas.read_csv(path, dtype=str)
+
+    return __normalize(affiliations)
+
+
+def sortinghat_affiliations(export):
+    """Builds an affiliation override table from a SortingHat export.
+
+    Every enrollment becomes a dated row, so contributions are affiliated
+    to the organization the author was enrolled to when they were sent.
+    Contributions sent outside every enrollment keep their organization.
+
+    :param export: SortingHat identities export, as a dict.
+    :returns: a Pandas DataFrame with `AFFILIATION_COLUMNS` columns.
+    """
+
+    rows = []
+
+    for uuid, uidentity in export.get('uidentities', {}).items():
+        enrollments = sorted(uidentity.get('enrollments', []),
+                             key=lambda e: (e.get('start') or '',
+                                            e.get('end') or ''))
+        for enrollment in enrollments:
+            rows.append({'author': uuid,
+                         'affiliation': enrollment['organization'],
+                         'start': enrollment.get('start'),
+                         'end': enrollment.get('end')})
+
+    return __normalize(pandas.DataFrame(rows, columns=AFFILIATION_COLUMNS))
+
+
+def resolve_affiliations(affiliations):
+    """Gets an affiliation override table from a table or its path.
+
+    :param affiliations: Pandas DataFrame or path (see
+        `load_affiliations`).
+    :returns: a Pandas DataFrame with `AFFILIATION_COLUMNS` columns.
+    """
+
+    if isinstance(affiliations, str):
+        return load_affiliations(affiliations)
+
+    return __normalize(affiliations)
+
+
+def has_author_overrides(affiliations):
+    """Checks whether a table re-affiliates any author.
+
+    :param affiliations: affiliation override table.
+    """
+
+    return bool(affiliations['author'].notna().any())
+
+
+def has_dated_overrides(affiliations):
+    """Checks whether a table re-affiliates authors between dates only.
+
+    :param affiliations: affiliation override table.
+    """
+
+    return bool(__dated(affiliations).any())
+
+
+def remap_orgs(org_contributions_df, affiliations):
+    """Renames organizations and adds up their contributions.
+
+    :param org_contributions_df: Pandas DataFrame with `organization` and
+        `contributions` columns.
+    :param affiliations: affiliation override table. Only rows without an
+        `author` are used.
+    :returns: a Pandas DataFrame with `organization` and `contributions`
+        columns, sorted in descending order by number of contributions.
+    """
+
+    aliases = affiliations[affiliations['author'].isna()]\
+        .drop_duplicates('organization', keep='last')\
+        .set_index('organization')['affiliation']
+
+    organizations = __replace(org_contributions_df['organization'], aliases)
+
+    return __sum_by_org(organizations,
+                        org_contributions_df['contributions'])
+
+
+def remap_author_orgs(author_org_contributions_df, affiliations):
+    """Re-affiliates authors and renames organizations.
+
+    Authors in the override table are moved to their new organization,
+    then organizations are renamed as in `remap_orgs`. Dated rows take
+    precedence over undated ones, and later rows over earlier ones.
+
+    :param author_org_contributions_df: Pandas DataFrame with `author`,
+        `organization` and `contributions` columns, plus a `day` column
+        (UTC datetimes) if the table has dated rows (see
+        `has_dated_overrides`).
+    :param affiliations: affiliation override table.
+    :returns: a Pandas DataFrame with `organization` and `contributions`
+        columns, sorted in descending order by number of contributions.
+    """
+
+    dated = __dated(affiliations)
+
+    overrides = affiliations[affiliations['author'].notna() & ~dated]\
+        .drop_duplicates('author', keep='last')\
+        .set_index('author')['affiliation']
+
+    new_orgs = __replace(author_org_contributions_df['author'], overrides,
+                         default=author_org_contributions_df['organization'])
+
+    if dated.any():
+        if 'day' not in author_org_contributions_df.columns:
+            raise ValueError("dated affiliations need contributions by day")
+
+        __apply_dated(new_orgs, author_org_contributions_df,
+                      affiliations[dated])
+
+    return remap_orgs(pandas.DataFrame({
+        'organization': new_orgs,
+        'contributions': author_org_contributions_df['contributions'].values
+    }), affiliations)
+
+
+def __apply_dated(new_orgs, author_org_contributions_df, dated):
+    """Re-affiliates the contributions sent between the dates of an
+    override, updating `new_orgs` in place."""
+
+    rows = pandas.DataFrame({
+        'row': numpy.arange(len(author_org_contributions_df)),
+        'author': numpy.asarray(author_org_contributions_df['author'],
+                                dtype=object),
+        'day': author_org_contributions_df['day'].values
+    })
+    dated = dated.assign(priority=numpy.arange(len(dated)))
+
+    matches = rows.merge(dated[['author', 'affiliation', 'start', 'end',
+                                'priority']], on='author')
+
+    day = pandas.to_datetime(matches['day'], utc=True)
+    within = (matches['start'].isna() | (day >= matches['start'])) \
+        & (matches['end'].isna() | (day < matches['end']))
+
+    matches = matches[within]\
+        .sort_values(['row', 'priority'], kind='mergesort')\
+        .drop_duplicates('row', keep='last')
+
+    new_orgs[matches['row'].values] = matches['affiliation'].values
+
+
+def __dated(affiliations):
+    """Flags the author rows applying between dates only."""
+
+    return affiliations['author'].notna() \
+        & (affiliations['start'].notna() | affiliations['end'].notna())
+
+
+def __normalize(affiliations):
+    """Sets the columns of an override table and parses its dates."""
+
+    affiliations = affiliations.reindex(columns=AFFILIATION_COLUMNS)
+
+    for column in ['start', 'end']:
+        affiliations[column] = pandas.to_datetime(affiliations[column],
+                                                  utc=True)
+
+    return affiliations
+
+
+def __replace(values, mapping, default=None):
+    """Looks values up in a mapping.
+
+    The lookup is done once per distinct value, on the categories of
+    `values`, instead of once per row.
+
+    :param values: Pandas Series.
+    :param mapping: Pandas Series indexed by the values to replace.
+    :param default: Pandas Series with the values to use when there is no
+        replacement, `values` by default.
+    :returns: a NumPy array of objects.
+    """
+
+    values = values.astype('category')
+    categories = values.cat.categories
+
+    replacements = pandas.Series(categories).map(mapping).values
+    replaced = replacements[values.cat.codes]
+
+    if default is None:
+        default = values
+
+    return numpy.where(pandas.isna(replaced),
+                       numpy.asarray(default, dtype=object),
+                       replaced)
+
+
+def __sum_by_org(organizations, contributions):
+    """Adds up contributions by organization, sorted in descending order."""
+
+    sums = pandas.Series(contributions.values)\
+        .groupby(pandas.Categorical(organizations), observed=True).sum()
+
+    return pandas.DataFrame({
+        'organization': sums.index.astype(str),
+        'contributions': sums.values
+    }, columns=['organization', 'contributions']).sort_values(
+        'contributions', ascending=False, kind='mergesort', ignore_index=True)
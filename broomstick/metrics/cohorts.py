@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import collections
+
+import numpy
+import pandas
+
+import broomstick.metrics.general as gm
+
+from broomstick.data.es import common as com
+
+
+# Number of bits set in every byte value
+POPCOUNT = numpy.array([bin(i).count('1') for i in range(256)],
+                       dtype=numpy.uint8)
+
+# Authors active in each period, as a bitmap per period over an author
+# index. Authors are numbered in order of first activity, so each cohort
+# (authors first active in the same period) is a range of bits:
+# - `periods`: start of each period, as a `pandas.DatetimeIndex`.
+# - `authors`: `pandas.Index` of author ids, in bit order.
+# - `bits`: 2D `uint8` array with a row per period and a bit per author,
+#   most significant bit first (see `numpy.packbits`).
+# - `cohorts`: first bit of each cohort, plus the number of authors.
+AuthorBitmaps = collections.namedtuple(
+    'AuthorBitmaps', ['periods', 'authors', 'bits', 'cohorts'])
+
+# Supported ES date histogram intervals and their Pandas period frequency.
+# ES weeks start on Monday, like Pandas weeks ending on Sunday.
+INTERVAL_PERIODS = {
+    '1d': 'D',
+    'day': 'D',
+    '1w': 'W-SUN',
+    'week': 'W-SUN',
+    '1M': 'M',
+    'month': 'M',
+    '1q': 'Q',
+    'quarter': 'Q',
+    '1y': 'Y',
+    'year': 'Y'
+}
+
+
+def author_bitmaps(data_source,
+                   start_date,
+                   end_date=None,
+                   interval='1M',
+                   exclude_unknown=False,
+                   exclude_bots=False,
+                   exclude_merges=False,
+                   include_orgs=None,
+                   exclude_orgs=None):
+    """Fetches the authors active in each period, as bitmaps.
+
+    Authors are fetched once, so any number of cohort and retention
+    metrics can be computed from the result without querying ES again.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param interval: period length, as an ES date histogram interval (e.g.
+        `1w`, `1M`, `1q` or `1y`), monthly by default.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: `AuthorBitmaps`.
+    """
+
+    periods = period_starts(start_date, end_date, interval)
+
+    return encode_authors(gm.contributions_count_by_author_period(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        interval=interval,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs), periods=periods)
+
+
+def period_starts(start_date, end_date=None, interval='1M'):
+    """Lists the periods between two dates, as ES date histograms do.
+
+    :param start_date: date range start (exclusive).
+    :param end_date: date range end (inclusive). `None` by default, means
+        now.
+    :param interval: period length, one of the keys in `INTERVAL_PERIODS`.
+    :returns: the UTC start of every period overlapping the range, as a
+        `pandas.DatetimeIndex`.
+    """
+
+    if interval not in INTERVAL_PERIODS:
+        raise ValueError("Unknown interval '{}', expected one of {}"
+                         .format(interval, list(INTERVAL_PERIODS)))
+
+    start, end = (pandas.Timestamp(com.normalize_date(date)).tz_convert(None)
+                  for date in (start_date, end_date or 'now'))
+
+    return pandas.period_range(start, end, freq=INTERVAL_PERIODS[interval])\
+        .to_timestamp().tz_localize('UTC')
+
+
+def encode_authors(authors_df, periods=None):
+    """Encodes the authors active in each period as bitmaps.
+
+    :param authors_df: a Pandas DataFrame with `period` and `author`
+        columns, e.g. as returned by
+        `broomstick.metrics.general.contributions_count_by_author_period`.
+        Periods without authors are missing.
+    :param periods: optional start of every period (see `period_starts`),
+        so periods without authors are kept, with no bits set.
+    :returns: `AuthorBitmaps`.
+    """
+
+    periods_found = pandas.DatetimeIndex(authors_df['period'].unique())
+
+    if periods is None:
+        periods = periods_found.sort_values()
+    else:
+        periods = pandas.DatetimeIndex(periods).union(periods_found)
+
+    period_ids = periods.get_indexer(authors_df['period'])
+
+    authors = pandas.Categorical(authors_df['author'])
+    author_ids = authors.codes.astype(numpy.int64)
+
+    # Number authors by first period, then in category order
+    first = numpy.full(len(authors.categories), len(periods),
+                       dtype=numpy.int64)
+    numpy.minimum.at(first, author_ids, period_ids)
+
+    order = numpy.lexsort((numpy.arange(len(first)), first))
+    n_authors = int((first < len(periods)).sum())
+    order = order[:n_authors]
+
+    bit_ids = numpy.empty(len(first), dtype=numpy.int64)
+    bit_ids[order] = numpy.arange(n_authors)
+    bit_ids = bit_ids[author_ids]
+
+    bits = numpy.zeros((len(periods), (n_authors + 7) // 8),
+                       dtype=numpy.uint8)
+    numpy.bitwise_or.at(bits, (period_ids, bit_ids >> 3),
+                        (0x80 >> (bit_ids & 7)).astype(numpy.uint8))
+
+    cohorts = numpy.searchsorted(first[order], numpy.arange(len(periods) + 1))
+
+    return AuthorBitmaps(periods=periods,
+                         authors=pandas.Index(authors.categories[order]),
+                         bits=bits,
+                         cohorts=cohorts)
+
+
+def popcount(bits):
+    """Counts the bits set in bitmaps.
+
+    :param bits: array of bitmaps, one per row (or a single bitmap).
+    :returns: the number of bits set in each bitmap.
+    """
+
+    return POPCOUNT[bits].sum(axis=-1, dtype=numpy.int64)
+
+
+def range_mask(start, end, n_bytes):
+    """Builds a bitmap with a range of bits set.
+
+    :param start: first bit set.
+    :param end: first bit not set after `start`.
+    :param n_bytes: bitmap length, in bytes.
+    :returns: a `uint8` array.
+    """
+
+    mask = numpy.zeros(n_bytes * 8, dtype=bool)
+    mask[start:end] = True
+
+    return numpy.packbits(mask)
+
+
+def decode_authors(bitmaps, bits):
+    """Gets the authors whose bits are set in a bitmap.
+
+    :param bitmaps: `AuthorBitmaps` the bitmap refers to.
+    :param bits: a bitmap, e.g. a row of `bitmaps.bits` or the result of
+        operating with them.
+    :returns: a `pandas.Index` of author ids.
+    """
+
+    flags = numpy.unpackbits(bits)[:len(bitmaps.authors)]
+
+    return bitmaps.authors[numpy.flatnonzero(flags)]
+
+
+def retention_from_bitmaps(bitmaps):
+    """Classifies the authors active in each period.
+
+    - `new` authors are active for the first time.
+    - `returning` authors were active in any previous period.
+    - `retained` authors were active in the previous period too.
+    - `churned` authors were active in the previous period but not in this
+      one.
+
+    Authors active before the first period are new in the first period.
+
+    :param bitmaps: `AuthorBitmaps`.
+    :returns: a Pandas DataFrame with `period`, `active`, `new`,
+        `returning`, `retained` and `churned` counts, plus `retention`
+        (fraction of the authors active in the previous period that are
+        still active).
+    """
+
+    bits = bitmaps.bits
+    empty = numpy.zeros((1, bits.shape[1]), dtype=numpy.uint8)
+
+    previous = numpy.concatenate([empty, bits[:-1]])
+    seen = numpy.concatenate(
+        [empty, numpy.bitwise_or.accumulate(bits, axis=0)[:-1]])
+
+    active = popcount(bits)
+    retained = popcount(bits & previous)
+    previous_active = popcount(previous)
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        retention = numpy.where(previous_active > 0,
+                                retained / previous_active, numpy.nan)
+
+    return pandas.DataFrame({
+        'period': bitmaps.periods,
+        'active': active,
+        'new': popcount(bits & ~seen),
+        'returning': popcount(bits & seen),
+        'retained': retained,
+        'churned': popcount(previous & ~bits),
+        'retention': retention
+    })
+
+
+def cohorts_from_bitmaps(bitmaps, relative=False):
+    """Counts the authors of each cohort active in later periods.
+
+    A cohort is made of the authors first active in the same period.
+
+    :param bitmaps: `AuthorBitmaps`.
+    :param relative: whether or not to add the fraction of each cohort
+        still active, as a `retention` column.
+    :returns: a Pandas DataFrame with `cohort` (its first period),
+        `period`, `periods_since` (0 for the cohort period itself) and
+        `authors` columns, plus `retention` if `relative`.
+    """
+
+    bits = bitmaps.bits
+    n_periods = len(bitmaps.periods)
+
+    cohort_ids, period_ids, counts = [], [], []
+
+    for cohort in range(n_periods):
+        start, end = bitmaps.cohorts[cohort], bitmaps.cohorts[cohort + 1]
+
+        if start == end:
+            continue
+
+        # A single operation covers every later period
+        mask = range_mask(start, end, bits.shape[1])
+        counts.append(popcount(bits[cohort:] & mask))
+        cohort_ids.append(numpy.full(n_periods - cohort, cohort))
+        period_ids.append(numpy.arange(cohort, n_periods))
+
+    if counts:
+        cohort_ids = numpy.concatenate(cohort_ids)
+        period_ids = numpy.concatenate(period_ids)
+        counts = numpy.concatenate(counts)
+    else:
+        cohort_ids = period_ids = counts = numpy.array([], dtype=numpy.int64)
+
+    df = pandas.DataFrame({
+        'cohort': bitmaps.periods[cohort_ids],
+        'period': bitmaps.periods[period_ids],
+        'periods_since': period_ids - cohort_ids,
+        'authors': counts
+    })
+
+    if relative:
+        sizes = numpy.diff(bitmaps.cohorts)[cohort_ids]
+        df['retention'] = counts / numpy.maximum(sizes, 1)
+
+    return df
+
+
+def contributor_retention(data_source,
+                          start_date,
+                          end_date=None,
+                          interval='1M',
+                          exclude_unknown=False,
+                          exclude_bots=False,
+                          exclude_merges=False,
+                          include_orgs=None,
+                          exclude_orgs=None):
+    """Computes new, returning, retained and churned authors per period.
+
+    See `author_bitmaps` for the params and `retention_from_bitmaps` for
+    the result.
+    """
+
+    return retention_from_bitmaps(author_bitmaps(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        interval=interval,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs))
+
+
+def cohort_retention(data_source,
+                     start_date,
+                     end_date=None,
+                     interval='1M',
+                     exclude_unknown=False,
+                     exclude_bots=False,
+                     exclude_merges=False,
+                     include_orgs=None,
+                     exclude_orgs=None,
+                     relative=True):
+    """Computes how many authors of each cohort stay active over time.
+
+    See `author_bitmaps` for the params and `cohorts_from_bitmaps` for
+    `relative` and the result.
+    """
+
+    return cohorts_from_bitmaps(author_bitmaps(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        interval=interval,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs), relative=relative)
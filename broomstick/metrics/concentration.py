@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import numpy
+
+from broomstick import profiling as prof
+
+
+def sort_contributions(contributions):
+    """Returns contributions as a float array sorted in descending order.
+
+    :param contributions: sequence of numbers of contributions, one per
+        contributor (organization, author...).
+    :returns: a NumPy array.
+    """
+
+    return -numpy.sort(-numpy.asarray(contributions, dtype=numpy.float64))
+
+
+@prof.profiled()
+def factor(contributions, threshold=0.5, total=None):
+    """Computes the number of contributors needed to reach a threshold.
+
+    This is the building block of the Elephant Factor (organizations),
+    the Pony Factor and the Bus Factor (authors).
+
+    :param contributions: contributions per contributor, sorted in
+        descending order (see `sort_contributions`).
+    :param threshold: fraction of `total` to reach, 0.5 by default.
+    :param total: total number of contributions. The sum of
+        `contributions` by default.
+    :returns: the smallest number of contributors whose contributions add
+        up to `threshold * total`, or all of them if they don't.
+    """
+
+    cumsum = numpy.cumsum(contributions)
+
+    return __factor(cumsum, threshold, total)
+
+
+def gini(contributions):
+    """Computes the Gini coefficient of a contributions vector.
+
+    :param contributions: contributions per contributor, sorted in
+        descending order (see `sort_contributions`).
+    :returns: a value between 0 (contributions evenly spread) and
+        `1 - 1/n` (a single contributor makes them all).
+    """
+
+    return __gini(contributions, numpy.cumsum(contributions))
+
+
+def hhi(contributions):
+    """Computes the Herfindahl-Hirschman Index of a contributions vector.
+
+    :param contributions: contributions per contributor.
+    :returns: the sum of the squared shares of every contributor, between
+        `1/n` and 1.
+    """
+
+    contributions = numpy.asarray(contributions, dtype=numpy.float64)
+
+    return __hhi(contributions, contributions.sum())
+
+
+@prof.profiled()
+def concentration(contributions, threshold=0.5, total=None):
+    """Computes every concentration metric of a contributions vector.
+
+    The vector is sorted and accumulated only once, so adding metrics here
+    is cheap compared to fetching data again.
+
+    :param contributions: contributions per contributor, in any order.
+    :param threshold: fraction of contributions used to compute the factor.
+    :param total: total number of contributions used to compute the factor.
+        The sum of `contributions` by default.
+    :returns: a dict with:
+        - `contributors`: number of contributors.
+        - `contributions`: sum of contributions.
+        - `factor`: see `factor`.
+        - `gini`: see `gini`.
+        - `hhi`: see `hhi`.
+    """
+
+    contributions = sort_contributions(contributions)
+    cumsum = numpy.cumsum(contributions)
+    vector_total = cumsum[-1] if len(cumsum) else 0
+
+    return {
+        'contributors': len(contributions),
+        'contributions': float(vector_total),
+        'factor': __factor(cumsum, threshold, total),
+        'gini': __gini(contributions, cumsum),
+        'hhi': __hhi(contributions, vector_total)
+    }
+
+
+@prof.profiled()
+def row_factors(matrix, threshold=0.5):
+    """Computes the factor of every row of a contributions matrix.
+
+    :param matrix: 2D array with a row per contributions vector, e.g. one
+        row per time window and a column per organization. Rows don't need
+        to be sorted.
+    :param threshold: fraction of the row total to reach.
+    :returns: an integer array with the factor of each row, 0 for rows
+        without contributions.
+    """
+
+    matrix = numpy.asarray(matrix, dtype=numpy.float64)
+
+    if not matrix.shape[1]:
+        return numpy.zeros(matrix.shape[0], dtype=numpy.int64)
+
+    cumsum = numpy.cumsum(-numpy.sort(-matrix, axis=1), axis=1)
+    reached = cumsum >= threshold * cumsum[:, -1:]
+
+    factors = reached.argmax(axis=1) + 1
+    factors[cumsum[:, -1] == 0] = 0
+
+    return factors
+
+
+def __factor(cumsum, threshold, total):
+    """Computes the factor from the cumulative sum of contributions."""
+
+    if total is None:
+        total = cumsum[-1] if len(cumsum) else 0
+
+    # First position where the cumulative sum reaches the threshold
+    position = numpy.searchsorted(cumsum, threshold * total, side='left')
+
+    return int(min(position + 1, len(cumsum)))
+
+
+def __gini(contributions, cumsum):
+    """Computes the Gini coefficient from sorted contributions and their
+    cumulative sum."""
+
+    n = len(contributions)
+
+    if not n or not cumsum[-1]:
+        return numpy.nan
+
+    # Contributions are sorted in descending order, rank them ascending
+    ranks = numpy.arange(n, 0, -1)
+
+    weighted = 2 * numpy.dot(ranks, contributions) / (n * cumsum[-1])
+
+    return float(weighted - (n + 1) / n)
+
+
+def __hhi(contributions, total):
+    """Computes the Herfindahl-Hirschman Index given the total."""
+
+    if not total:
+        return numpy.nan
+
+    return float(numpy.square(contributions / total).sum())
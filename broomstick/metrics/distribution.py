@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import numpy
+import pandas
+
+import broomstick.metrics.general as gm
+
+from broomstick import profiling as prof
+from broomstick.data.es import common as com
+
+
+@prof.profiled()
+def histogram(contributions, bins=20, log=False):
+    """Bins a contributions vector into a compact histogram.
+
+    :param contributions: contributions per contributor.
+    :param bins: number of bins, or a sequence with the bin edges.
+    :param log: whether or not to use logarithmically spaced bins, which
+        suit the long tails of contributions. Ignored if `bins` is a
+        sequence.
+    :returns: a Pandas DataFrame with a row per bin and `bin_start`,
+        `bin_end` and `count` (number of contributors) columns. Bins are
+        closed on the left, except for the last one.
+    """
+
+    contributions = numpy.asarray(contributions, dtype=numpy.float64)
+
+    if log and numpy.ndim(bins) == 0 and len(contributions):
+        low = max(contributions.min(), 1)
+        high = max(contributions.max(), low + 1)
+        bins = numpy.geomspace(low, high, bins + 1)
+
+    counts, edges = numpy.histogram(contributions, bins=bins)
+
+    return pandas.DataFrame({
+        'bin_start': edges[:-1],
+        'bin_end': edges[1:],
+        'count': counts
+    }, columns=['bin_start', 'bin_end', 'count'])
+
+
+def contributions_distribution_by_org(data_source,
+                                      start_date,
+                                      end_date=None,
+                                      exclude_unknown=True,
+                                      exclude_bots=False,
+                                      exclude_merges=False,
+                                      include_orgs=None,
+                                      exclude_orgs=None,
+                                      bins=20,
+                                      log=False):
+    """Gets the distribution of contributions among organizations.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param bins: number of bins, or a sequence with the bin edges.
+    :param log: whether or not to use logarithmically spaced bins.
+    :returns: a Pandas DataFrame with `bin_start`, `bin_end` and `count`
+        columns, where `count` is the number of organizations (see
+        `histogram`).
+    """
+
+    org_contributions_df = gm.contributions_count_by_org(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
+
+    return histogram(org_contributions_df['contributions'], bins=bins,
+                     log=log)
+
+
+def contributions_percentiles_by_org(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     percents=(1, 5, 25, 50, 75, 95, 99)):
+    """Gets percentiles of the number of contributions per organization.
+
+    Percentiles are computed by ES, so only a few numbers are retrieved no
+    matter how many organizations there are.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param percents: percentiles to compute.
+    :returns: a Pandas DataFrame with `percent` and `contributions` columns.
+    """
+
+    return com.contributions_percentiles_by_org(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        percents=percents)
+
+
+def plot_histogram(bins_df, title='contributions Distribution',
+                   y_title='Organizations'):
+    """Plots a histogram frame in a notebook, using plotly and cufflinks.
+
+    :param bins_df: a frame as returned by `histogram`.
+    :param title: plot title.
+    :param y_title: title of the y axis.
+    """
+
+    # Plotting libraries are only needed in notebooks, don't make
+    # everybody else pay for importing them
+    import cufflinks
+
+    from plotly.offline import init_notebook_mode
+
+    # Use plotly + cufflinks in offline mode
+    cufflinks.go_offline(connected=True)
+    init_notebook_mode(connected=True)
+
+    labels = ['{:g}-{:g}'.format(start, end) for start, end
+              in zip(bins_df['bin_start'], bins_df['bin_end'])]
+
+    bins_df.assign(bin=labels).iplot(
+        kind='bar',
+        x='bin',
+        y='count',
+        xTitle='contributions',
+        yTitle=y_title,
+        title=title)
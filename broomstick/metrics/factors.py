@@ -19,19 +19,32 @@
 #     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
 #
 
-import cufflinks
+import numpy
 
-from plotly.offline import init_notebook_mode
+import broomstick.metrics.concentration as cm
+import broomstick.metrics.distribution as dist
+import broomstick.metrics.general as gm
 
 
-import broomstick.metrics.general as gm
+# Function returning the contributions vector of each concentration level
+CONCENTRATION_LEVELS = {
+    'org': 'contributions_count_by_org',
+    'author': 'contributions_count_by_author'
+}
 
 
 def elephant_factor(data_source,
                     start_date,
                     end_date=None,
                     exclude_unknown=True,
-                    print_dist=True):
+                    exclude_bots=False,
+                    exclude_merges=False,
+                    include_orgs=None,
+                    exclude_orgs=None,
+                    print_dist=True,
+                    threshold=0.5,
+                    affiliations=None,
+                    mode='exact'):
     """Computes the Elephant Factor.
 
     :param data_source: `broomstick.core.DataSource`
@@ -41,39 +54,253 @@ def elephant_factor(data_source,
         `None` by default, means count everything from `start_date`.
     :param exclude_unknown: whether or not to exclude contributions sent by
         people affiliated to 'Unknown' organization.
-    :returns: the number of organizations sending up to the 50% of
-        contributions.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param print_dist: whether or not to plot the distribution of
+        contributions by organization (see
+        `broomstick.metrics.distribution.plot_histogram`).
+    :param threshold: fraction of contributions to reach, 0.5 by default.
+    :param affiliations: optional affiliation override table (see
+        `broomstick.metrics.general.contributions_count_by_org`).
+    :param mode: `exact` (default) or `preview`, to estimate the factor from
+        a random sample of documents (see `broomstick.metrics.general.MODES`).
+    :returns: the number of organizations sending up to the 50% (or the
+        given `threshold`) of contributions. In `preview` mode, a dict with
+        the estimated `value` and its `error` (see `estimate_factor`), and
+        the number of documents `sampled` and in the `population`.
     """
 
+    if gm.check_mode(mode) == 'preview' or affiliations is not None:
+        # Remapped organizations, or estimated contributions, only exist in
+        # the frame, so totals come from it too
+        org_contributions_df = gm.contributions_count_by_org(
+            data_source=data_source,
+            start_date=start_date,
+            end_date=end_date,
+            exclude_unknown=exclude_unknown,
+            exclude_bots=exclude_bots,
+            exclude_merges=exclude_merges,
+            include_orgs=include_orgs,
+            exclude_orgs=exclude_orgs,
+            affiliations=affiliations,
+            mode=mode)
+
+        if print_dist:
+            dist.plot_histogram(
+                dist.histogram(org_contributions_df['contributions'].values))
+
+        if mode == 'preview':
+            return estimate_factor(org_contributions_df, threshold)
+
+        return cm.factor(org_contributions_df['contributions'].values,
+                         threshold=threshold)
+
     total_contributions = gm.contributions_count_total(
         data_source=data_source,
         start_date=start_date,
         end_date=end_date,
-        exclude_unknown=exclude_unknown)
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
+
+    if not print_dist:
+        # Organizations are streamed in descending order, so we can stop
+        # as soon as the threshold is reached
+        return elephant_factor_from_pages(
+            gm.contributions_count_by_org_pages(
+                data_source=data_source,
+                start_date=start_date,
+                end_date=end_date,
+                exclude_unknown=exclude_unknown,
+                exclude_bots=exclude_bots,
+                exclude_merges=exclude_merges,
+                include_orgs=include_orgs,
+                exclude_orgs=exclude_orgs),
+            total_contributions * threshold)
 
     org_contributions_df = gm.contributions_count_by_org(
         data_source=data_source,
         start_date=start_date,
         end_date=end_date,
-        exclude_unknown=exclude_unknown)
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
+
+    # Only the bins are handed to the renderer, not one row per organization
+    dist.plot_histogram(
+        dist.histogram(org_contributions_df['contributions'].values))
+
+    return cm.factor(org_contributions_df['contributions'].values,
+                     threshold=threshold,
+                     total=total_contributions)
+
+
+def estimate_factor(org_contributions_df, threshold=0.5):
+    """Computes the Elephant Factor from estimated contributions.
+
+    The factor is bounded by computing it with every organization at the
+    top of its error margin, which reaches the threshold sooner, and at the
+    bottom, which reaches it later. The error is half the distance between
+    both bounds.
+
+    :param org_contributions_df: a Pandas DataFrame with `contributions` and
+        `error` columns, sorted in descending order by number of
+        contributions, as returned in `preview` mode by
+        `broomstick.metrics.general.contributions_count_by_org`.
+    :param threshold: fraction of contributions to reach, 0.5 by default.
+    :returns: a dict with `value`, `error`, `sampled` and `population`
+        keys, like `contributions_count_total` in `preview` mode.
+    """
+
+    contributions = org_contributions_df['contributions'].values
+    error = org_contributions_df['error'].values
+    total = contributions.sum()
+
+    low = cm.factor(cm.sort_contributions(contributions + error),
+                    threshold=threshold, total=total)
+    high = cm.factor(cm.sort_contributions(
+        numpy.maximum(contributions - error, 0)),
+        threshold=threshold, total=total)
+
+    return {'value': cm.factor(contributions, threshold=threshold),
+            'error': (high - low) / 2,
+            'sampled': org_contributions_df.attrs.get('sampled', 0),
+            'population': org_contributions_df.attrs.get('population', 0)}
+
+
+def elephant_factor_from_pages(pages, threshold):
+    """Counts the organizations needed to reach a number of contributions.
+
+    Pages are consumed only until the threshold is reached.
+
+    :param pages: iterable of Pandas DataFrames with a `contributions`
+        column, sorted in descending order across pages.
+    :param threshold: number of contributions to reach.
+    :returns: the number of organizations whose contributions add up to
+        `threshold`, or the number of organizations read if they don't.
+    """
+
+    accumulated = 0
+    orgs = 0
+
+    for page in pages:
+        cumsum = page['contributions'].cumsum().add(accumulated)
+        reached = cumsum.ge(threshold).values
 
-    threshold = total_contributions * 0.5
+        if reached.any():
+            return orgs + int(reached.argmax()) + 1
 
-    threshold_org = org_contributions_df.at[
-        org_contributions_df['contributions']
-        .cumsum().sub(threshold).ge(0).idxmax(), 'organization']
+        accumulated = cumsum.iloc[-1]
+        orgs += len(page)
+
+    return orgs
+
+
+def pony_factor(data_source,
+                start_date,
+                end_date=None,
+                exclude_unknown=False,
+                exclude_bots=False,
+                exclude_merges=False,
+                include_orgs=None,
+                exclude_orgs=None,
+                threshold=0.5):
+    """Computes the Pony Factor.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization. Unlike organization
+        based metrics, `False` by default.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param threshold: fraction of contributions to reach, 0.5 by default.
+    :returns: the number of authors sending up to the 50% (or the given
+        `threshold`) of contributions.
+    """
+
+    return concentration_factors(data_source=data_source,
+                                 start_date=start_date,
+                                 end_date=end_date,
+                                 level='author',
+                                 exclude_unknown=exclude_unknown,
+                                 exclude_bots=exclude_bots,
+                                 exclude_merges=exclude_merges,
+                                 include_orgs=include_orgs,
+                                 exclude_orgs=exclude_orgs,
+                                 threshold=threshold)['factor']
+
+
+def concentration_factors(data_source,
+                          start_date,
+                          end_date=None,
+                          level='org',
+                          exclude_unknown=True,
+                          exclude_bots=False,
+                          exclude_merges=False,
+                          include_orgs=None,
+                          exclude_orgs=None,
+                          threshold=0.5):
+    """Computes every concentration metric from a single data fetch.
+
+    Contributions are aggregated once by organization or by author, then
+    the factor, Gini coefficient and Herfindahl-Hirschman Index are computed
+    from that vector (see `broomstick.metrics.concentration`).
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param level: `'org'` (Elephant Factor) or `'author'` (Pony Factor).
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param threshold: fraction of contributions used to compute the factor.
+    :returns: a dict with `contributors`, `contributions`, `factor`, `gini`
+        and `hhi` keys.
+    """
 
-    if print_dist:
+    if level not in CONCENTRATION_LEVELS:
+        raise ValueError("Unknown level '{}', expected one of {}"
+                         .format(level, sorted(CONCENTRATION_LEVELS)))
 
-        # Use plotly + cufflinks in offline mode
-        cufflinks.go_offline(connected=True)
-        init_notebook_mode(connected=True)
+    contributions_by = getattr(gm, CONCENTRATION_LEVELS[level])
 
-        org_contributions_df['contributions'].iplot(
-            kind='hist',
-            xTitle='contributions',
-            yTitle='Organizations',
-            title='contributions Distribution')
+    contributions_df = contributions_by(data_source=data_source,
+                                        start_date=start_date,
+                                        end_date=end_date,
+                                        exclude_unknown=exclude_unknown,
+                                        exclude_bots=exclude_bots,
+                                        exclude_merges=exclude_merges,
+                                        include_orgs=include_orgs,
+                                        exclude_orgs=exclude_orgs)
 
-    return org_contributions_df.index[
-        org_contributions_df['organization'] == threshold_org][0] + 1
+    return cm.concentration(contributions_df['contributions'].values,
+                            threshold=threshold)
@@ -19,13 +19,40 @@
 #     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
 #
 
+import broomstick.metrics.affiliations as af
+
 from broomstick.data.es import common as com
 
 
+# Ways of computing metrics: `exact` queries every document, `preview`
+# estimates results from a random sample of them
+MODES = ('exact', 'preview')
+
+
+def check_mode(mode):
+    """Checks the mode metrics are computed in is one of `MODES`.
+
+    :param mode: mode name.
+    :returns: the given mode.
+    :raises ValueError: if the mode is unknown.
+    """
+
+    if mode not in MODES:
+        raise ValueError("unknown mode '{}', expected one of {}"
+                         .format(mode, ', '.join(MODES)))
+
+    return mode
+
+
 def contributions_count_total(data_source,
                               start_date,
                               end_date=None,
-                              exclude_unknown=True):
+                              exclude_unknown=True,
+                              exclude_bots=False,
+                              exclude_merges=False,
+                              include_orgs=None,
+                              exclude_orgs=None,
+                              mode='exact'):
     """ Get total number of contributions
 
     :param data_source: `broomstick.core.DataSource`
@@ -35,18 +62,51 @@ def contributions_count_total(data_source,
         `None` by default, means count everything from `start_date`.
     :param exclude_unknown: whether or not to exclude contributions sent by
         people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param mode: `exact` (default) or `preview`, to estimate results from a
+        random sample of documents (see
+        `broomstick.data.es.common.add_preview_sampler`).
     :returns: the number of contributions sent to the specified data source.
+        In `preview` mode, a dict with the estimated `value`, its `error`
+        and the number of documents `sampled` out of the `population`.
     """
+
+    if check_mode(mode) == 'preview':
+        return com.contributions_count_total_preview(
+            data_source=data_source,
+            start_date=start_date,
+            end_date=end_date,
+            exclude_unknown=exclude_unknown,
+            exclude_bots=exclude_bots,
+            exclude_merges=exclude_merges,
+            include_orgs=include_orgs,
+            exclude_orgs=exclude_orgs)
+
     return com.contributions_count_total(
         data_source=data_source,
         start_date=start_date,
         end_date=end_date,
-        exclude_unknown=exclude_unknown)
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
 
 
 def contributions_count_unknown(data_source,
                                 start_date,
-                                end_date=None):
+                                end_date=None,
+                                exclude_bots=False,
+                                exclude_merges=False,
+                                include_orgs=None,
+                                exclude_orgs=None):
     """ Get total number of contributions performed by Unknown
 
     :param data_source: `broomstick.core.DataSource`
@@ -54,18 +114,34 @@ def contributions_count_unknown(data_source,
         (exclusive).
     :param end_date: date until we want to counts contributions to (inclusive).
         `None` by default, means count everything from `start_date`.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
     :returns: the number of contributions sent by people affiliated to
         'Unknown' to the specified data source.
     """
     return com.contributions_count_unknown(
         data_source=data_source,
         start_date=start_date,
-        end_date=end_date)
+        end_date=end_date,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
 
 
 def contributions_unknown_percentage(data_source,
                                      start_date,
-                                     end_date=None):
+                                     end_date=None,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None):
     """Compute the percentage of contributions sent by people affiliated to
         'Unknown'.
 
@@ -73,6 +149,14 @@ def contributions_unknown_percentage(data_source,
         (exclusive).
     :param end_date: date until we want to counts contributions to (inclusive).
         `None` by default, means count everything from `start_date`.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
     :returns: the percentage of contributions sent by people affiliated to
         'Unknown' to the specified data source.
     """
@@ -80,11 +164,19 @@ def contributions_unknown_percentage(data_source,
         data_source=data_source,
         start_date=start_date,
         end_date=end_date,
-        exclude_unknown=False)
+        exclude_unknown=False,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
     unknown_contributions = contributions_count_unknown(
         data_source=data_source,
         start_date=start_date,
-        end_date=end_date)
+        end_date=end_date,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
 
     return (unknown_contributions / total_contributions) * 100
 
@@ -92,7 +184,13 @@ def contributions_unknown_percentage(data_source,
 def contributions_count_by_org(data_source,
                                start_date,
                                end_date=None,
-                               exclude_unknown=True):
+                               exclude_unknown=True,
+                               exclude_bots=False,
+                               exclude_merges=False,
+                               include_orgs=None,
+                               exclude_orgs=None,
+                               affiliations=None,
+                               mode='exact'):
     """ Gets number of contributions of each organization.
 
     :param data_source: `broomstick.core.DataSource`
@@ -102,11 +200,305 @@ def contributions_count_by_org(data_source,
         `None` by default, means count everything from `start_date`.
     :param exclude_unknown: whether or not to exclude contributions sent by
         people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param affiliations: optional affiliation override table, as a Pandas
+        DataFrame or a path (see `broomstick.metrics.affiliations`),
+        applied to the results instead of re-enriching ES data. Not
+        supported in `preview` mode.
+    :param mode: `exact` (default) or `preview`, to estimate results from a
+        random sample of documents (see
+        `broomstick.data.es.common.add_preview_sampler`).
     :returns: the number of contributions sent to the specified data source.
+        In `preview` mode, estimated contributions come with an `error`
+        column.
+    """
+
+    if check_mode(mode) == 'preview':
+        if affiliations is not None:
+            raise ValueError("affiliations are not supported in preview mode")
+
+        return com.contributions_count_by_org_preview(
+            data_source=data_source,
+            start_date=start_date,
+            end_date=end_date,
+            exclude_unknown=exclude_unknown,
+            exclude_bots=exclude_bots,
+            exclude_merges=exclude_merges,
+            include_orgs=include_orgs,
+            exclude_orgs=exclude_orgs)
+
+    if affiliations is None:
+        return com.contributions_count_by_org(
+            data_source=data_source,
+            start_date=start_date,
+            end_date=end_date,
+            exclude_unknown=exclude_unknown,
+            exclude_bots=exclude_bots,
+            exclude_merges=exclude_merges,
+            include_orgs=include_orgs,
+            exclude_orgs=exclude_orgs)
+
+    affiliations = af.resolve_affiliations(affiliations)
+
+    # Overrides may give 'Unknown' contributions an organization, so they
+    # are only excluded after remapping
+    if af.has_author_overrides(affiliations):
+        # Dated overrides depend on when contributions were sent
+        if af.has_dated_overrides(affiliations):
+            count_by_author_org = com.contributions_count_by_author_org_daily
+        else:
+            count_by_author_org = com.contributions_count_by_author_org
+
+        org_contributions_df = af.remap_author_orgs(
+            count_by_author_org(
+                data_source=data_source,
+                start_date=start_date,
+                end_date=end_date,
+                exclude_unknown=False,
+                exclude_bots=exclude_bots,
+                exclude_merges=exclude_merges,
+                include_orgs=include_orgs,
+                exclude_orgs=exclude_orgs),
+            affiliations)
+    else:
+        org_contributions_df = af.remap_orgs(
+            com.contributions_count_by_org(
+                data_source=data_source,
+                start_date=start_date,
+                end_date=end_date,
+                exclude_unknown=False,
+                exclude_bots=exclude_bots,
+                exclude_merges=exclude_merges,
+                include_orgs=include_orgs,
+                exclude_orgs=exclude_orgs),
+            affiliations)
+
+    if exclude_unknown:
+        unknown = org_contributions_df['organization'] == com.UNKNOWN_ORG_NAME
+        org_contributions_df = org_contributions_df[~unknown]\
+            .reset_index(drop=True)
+
+    return org_contributions_df
+
+
+def contributions_count_by_org_pages(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     page_size=10):
+    """ Iterates over organizations sorted by number of contributions.
+
+    Pages are fetched lazily, so consumers only pay for the organizations
+    they actually read.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param page_size: number of organizations in the first page.
+    :returns: a generator of Pandas DataFrames with `organization` and
+        `contributions` columns.
+    """
+
+    return com.contributions_count_by_org_pages(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        page_size=page_size)
+
+
+def contributions_count_by_author(data_source,
+                                  start_date,
+                                  end_date=None,
+                                  exclude_unknown=False,
+                                  exclude_bots=False,
+                                  exclude_merges=False,
+                                  include_orgs=None,
+                                  exclude_orgs=None):
+    """ Gets number of contributions of each author.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `author` and `contributions` columns,
+        sorted in descending order by number of contributions. Authors are
+        stored as categories to keep large communities in memory.
+    """
+
+    return com.contributions_count_by_author(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
+
+
+def contributions_count_by_author_org(data_source,
+                                      start_date,
+                                      end_date=None,
+                                      exclude_unknown=False,
+                                      exclude_bots=False,
+                                      exclude_merges=False,
+                                      include_orgs=None,
+                                      exclude_orgs=None):
+    """ Gets number of contributions of each author and organization.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `author`, `organization` and
+        `contributions` columns, sorted in descending order by number of
+        contributions.
+    """
+
+    return com.contributions_count_by_author_org(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
+
+
+def contributions_count_by_org_daily(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     days=None):
+    """ Gets number of contributions of each organization per day.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param days: optional UTC days to count contributions of, within the
+        date range.
+    :returns: a Pandas DataFrame with `day`, `organization` and
+        `contributions` columns, sorted by day.
+    """
+
+    return com.contributions_count_by_org_daily(
+        data_source=data_source,
+        start_date=start_date,
+        end_date=end_date,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs,
+        days=days)
+
+
+def contributions_count_by_author_period(data_source,
+                                         start_date,
+                                         end_date=None,
+                                         interval='1M',
+                                         exclude_unknown=False,
+                                         exclude_bots=False,
+                                         exclude_merges=False,
+                                         include_orgs=None,
+                                         exclude_orgs=None):
+    """ Gets number of contributions of each author per period.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param interval: period length, as an ES date histogram interval (e.g.
+        `1w`, `1M`, `1q` or `1y`), monthly by default.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `period`, `author` and
+        `contributions` columns, sorted by period.
     """
 
-    return com.contributions_count_by_org(
+    return com.contributions_count_by_author_period(
         data_source=data_source,
         start_date=start_date,
         end_date=end_date,
-        exclude_unknown=exclude_unknown)
+        interval=interval,
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
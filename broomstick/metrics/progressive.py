@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import pandas
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import broomstick.metrics.concentration as cm
+import broomstick.metrics.general as gm
+
+from broomstick.data.es import common as com
+
+
+def time_slices(start_date, end_date=None, slices=8):
+    """Splits a date range into contiguous slices of the same length.
+
+    :param start_date: date range start (exclusive).
+    :param end_date: date range end (inclusive), now by default.
+    :param slices: number of slices.
+    :returns: a list of `(start_date, end_date)` tuples, formatted
+        according to `broomstick.data.es.common.DATE_FORMAT`. Each slice
+        starts where the previous one ends.
+    """
+
+    start_date = pandas.Timestamp(com.normalize_date(start_date))
+    end_date = pandas.Timestamp(com.normalize_date(end_date or 'now'))
+
+    bounds = pandas.date_range(start_date, end_date, periods=slices + 1)\
+        .floor('S').drop_duplicates().strftime(com.DATE_FORMAT)
+
+    if len(bounds) < 2:
+        # Empty range, still worth a (empty) result
+        return [(bounds[0], bounds[0])]
+
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def progressive_contributions_by_org(data_source,
+                                     start_date,
+                                     end_date=None,
+                                     exclude_unknown=True,
+                                     exclude_bots=False,
+                                     exclude_merges=False,
+                                     include_orgs=None,
+                                     exclude_orgs=None,
+                                     slices=8,
+                                     max_workers=4):
+    """Counts contributions by organization, refining results as they come.
+
+    The date range is split into time slices that are queried
+    concurrently. Every time a slice completes, the running per-org table
+    is updated with its counts and yielded.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param slices: number of time slices.
+    :param max_workers: max number of slices queried at the same time.
+    :returns: a generator of `(progress, df)` tuples, where `progress` is
+        the fraction of slices completed and `df` a Pandas DataFrame with
+        `organization` and `contributions` columns, sorted in descending
+        order by number of contributions. The last one is the final result.
+    """
+
+    ranges = time_slices(start_date, end_date, slices)
+    running = pandas.Series(dtype='int64')
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = []
+
+    try:
+        futures += [executor.submit(gm.contributions_count_by_org,
+                                    data_source=data_source,
+                                    start_date=slice_start,
+                                    end_date=slice_end,
+                                    exclude_unknown=exclude_unknown,
+                                    exclude_bots=exclude_bots,
+                                    exclude_merges=exclude_merges,
+                                    include_orgs=include_orgs,
+                                    exclude_orgs=exclude_orgs)
+                    for slice_start, slice_end in ranges]
+
+        for completed, future in enumerate(as_completed(futures), start=1):
+            slice_df = future.result()
+            running = running.add(
+                slice_df.set_index('organization')['contributions'],
+                fill_value=0).astype('int64')
+
+            yield completed / len(futures), pandas.DataFrame({
+                'organization': running.index.astype(str),
+                'contributions': running.values
+            }, columns=['organization', 'contributions']).sort_values(
+                'contributions', ascending=False, kind='mergesort',
+                ignore_index=True)
+    finally:
+        # Consumers may stop early, don't wait for pending slices then.
+        # `cancel_futures` is not available before Python 3.9.
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def progressive_elephant_factor(data_source,
+                                start_date,
+                                end_date=None,
+                                exclude_unknown=True,
+                                exclude_bots=False,
+                                exclude_merges=False,
+                                include_orgs=None,
+                                exclude_orgs=None,
+                                threshold=0.5,
+                                slices=8,
+                                max_workers=4):
+    """Computes the Elephant Factor, refining it as time slices complete.
+
+    See `progressive_contributions_by_org` for how the date range is
+    split. Every intermediate value is the Elephant Factor of the slices
+    completed so far.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+        `None` by default, means count everything from `start_date`.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param threshold: fraction of contributions to reach, 0.5 by default.
+    :param slices: number of time slices.
+    :param max_workers: max number of slices queried at the same time.
+    :returns: a generator of `(progress, factor)` tuples, where `progress`
+        is the fraction of slices completed. The last one is the final
+        result.
+    """
+
+    for progress, org_contributions_df in progressive_contributions_by_org(
+            data_source=data_source,
+            start_date=start_date,
+            end_date=end_date,
+            exclude_unknown=exclude_unknown,
+            exclude_bots=exclude_bots,
+            exclude_merges=exclude_merges,
+            include_orgs=include_orgs,
+            exclude_orgs=exclude_orgs,
+            slices=slices,
+            max_workers=max_workers):
+        yield progress, cm.factor(org_contributions_df['contributions'].values,
+                                  threshold=threshold)
+
+
+def refine_preview(metric, **kwargs):
+    """Yields a metric estimated in `preview` mode, then its exact value.
+
+    The exact metric is computed in background while the preview is
+    computed and consumed, so it is ready as soon as possible.
+
+    :param metric: metric function accepting a `mode` param (see
+        `broomstick.metrics.general.MODES`).
+    :param kwargs: params of the metric, except `mode`.
+    :returns: a generator of `(mode, result)` tuples, first for `preview`
+        and then for `exact` mode.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    exact = executor.submit(metric, mode='exact', **kwargs)
+
+    try:
+        yield 'preview', metric(mode='preview', **kwargs)
+        yield 'exact', exact.result()
+    finally:
+        # Consumers may only want the preview, don't wait for the exact
+        # value then
+        exact.cancel()
+        executor.shutdown(wait=False)
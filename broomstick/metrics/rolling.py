@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import numpy
+import pandas
+
+import broomstick.metrics.concentration as cm
+import broomstick.metrics.general as gm
+
+
+def rolling_contributions_by_org(data_source,
+                                 start_date,
+                                 end_date=None,
+                                 windows=(90, 365),
+                                 step='7D',
+                                 exclude_unknown=True,
+                                 exclude_bots=False,
+                                 exclude_merges=False,
+                                 include_orgs=None,
+                                 exclude_orgs=None):
+    """Computes contributions by organization over trailing windows.
+
+    Windows are evaluated every `step` from `start_date` to `end_date`.
+    A window of `w` days evaluated at date `t` covers the `w` whole days
+    before `t`. See `rolling_windows` for how windows are computed.
+
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: first evaluation date.
+    :param end_date: last evaluation date, today by default.
+    :param windows: window lengths, in days.
+    :param step: Pandas frequency between evaluation dates, weekly by
+        default.
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :returns: a Pandas DataFrame with `date`, `window`, `organization` and
+        `contributions` columns, only for organizations with contributions.
+    """
+
+    dates, orgs, sums = rolling_windows(data_source=data_source,
+                                        start_date=start_date,
+                                        end_date=end_date,
+                                        windows=windows,
+                                        step=step,
+                                        exclude_unknown=exclude_unknown,
+                                        exclude_bots=exclude_bots,
+                                        exclude_merges=exclude_merges,
+                                        include_orgs=include_orgs,
+                                        exclude_orgs=exclude_orgs)
+
+    # sums[window, date, org] -> rows for non-empty cells only
+    window_idx, date_idx, org_idx = numpy.nonzero(sums)
+
+    return pandas.DataFrame({
+        'date': dates[date_idx],
+        'window': numpy.asarray(windows)[window_idx],
+        'organization': pandas.Categorical.from_codes(org_idx, orgs),
+        'contributions': sums[window_idx, date_idx, org_idx]
+    }).sort_values(['date', 'window', 'contributions'],
+                   ascending=[True, True, False],
+                   ignore_index=True)
+
+
+def rolling_contributions_count_total(data_source,
+                                      start_date,
+                                      end_date=None,
+                                      windows=(90, 365),
+                                      step='7D',
+                                      exclude_unknown=True,
+                                      exclude_bots=False,
+                                      exclude_merges=False,
+                                      include_orgs=None,
+                                      exclude_orgs=None):
+    """Computes the total number of contributions over trailing windows.
+
+    See `rolling_contributions_by_org` for the meaning of the params.
+
+    :returns: a Pandas DataFrame with `date`, `window` and `contributions`
+        columns.
+    """
+
+    dates, _, sums = rolling_windows(data_source=data_source,
+                                     start_date=start_date,
+                                     end_date=end_date,
+                                     windows=windows,
+                                     step=step,
+                                     exclude_unknown=exclude_unknown,
+                                     exclude_bots=exclude_bots,
+                                     exclude_merges=exclude_merges,
+                                     include_orgs=include_orgs,
+                                     exclude_orgs=exclude_orgs)
+
+    return __by_date_and_window(dates, windows, 'contributions',
+                                sums.sum(axis=2))
+
+
+def rolling_elephant_factor(data_source,
+                            start_date,
+                            end_date=None,
+                            windows=(90, 365),
+                            step='7D',
+                            exclude_unknown=True,
+                            exclude_bots=False,
+                            exclude_merges=False,
+                            include_orgs=None,
+                            exclude_orgs=None,
+                            threshold=0.5):
+    """Computes the Elephant Factor over trailing windows.
+
+    See `rolling_contributions_by_org` for the meaning of the params.
+
+    :param threshold: fraction of contributions to reach, 0.5 by default.
+    :returns: a Pandas DataFrame with `date`, `window` and `elephant_factor`
+        columns.
+    """
+
+    dates, _, sums = rolling_windows(data_source=data_source,
+                                     start_date=start_date,
+                                     end_date=end_date,
+                                     windows=windows,
+                                     step=step,
+                                     exclude_unknown=exclude_unknown,
+                                     exclude_bots=exclude_bots,
+                                     exclude_merges=exclude_merges,
+                                     include_orgs=include_orgs,
+                                     exclude_orgs=exclude_orgs)
+
+    factors = cm.row_factors(sums.reshape(-1, sums.shape[2]),
+                             threshold=threshold)
+
+    return __by_date_and_window(dates, windows, 'elephant_factor',
+                                factors.reshape(sums.shape[:2]))
+
+
+def rolling_windows(data_source,
+                    start_date,
+                    end_date=None,
+                    windows=(90, 365),
+                    step='7D',
+                    exclude_unknown=True,
+                    exclude_bots=False,
+                    exclude_merges=False,
+                    include_orgs=None,
+                    exclude_orgs=None):
+    """Computes contributions by organization for every window and date.
+
+    Daily contributions by organization are fetched once, covering from
+    the start of the longest window to the last evaluation date. Every
+    contribution belongs to a single day, so window sums are exact: they
+    are obtained from a running sum over days, adding the day entering the
+    window and removing the one leaving it.
+
+    See `rolling_contributions_by_org` for the meaning of the params.
+
+    :returns: a tuple with:
+        - the evaluation dates, as a `pandas.DatetimeIndex`.
+        - the organization names.
+        - an array of contributions with shape (windows, dates, orgs).
+    """
+
+    if end_date is None:
+        end_date = pandas.Timestamp.now(tz='UTC')
+
+    dates = pandas.date_range(start=__utc_day(start_date),
+                              end=__utc_day(end_date),
+                              freq=step)
+    origin = dates[0] - pandas.Timedelta(days=max(windows))
+
+    # Start date is exclusive, fetch one more day to get the whole origin
+    # day. Days out of range are dropped below.
+    daily_df = gm.contributions_count_by_org_daily(
+        data_source=data_source,
+        start_date=(origin - pandas.Timedelta(days=1)).isoformat(),
+        end_date=dates[-1].isoformat(),
+        exclude_unknown=exclude_unknown,
+        exclude_bots=exclude_bots,
+        exclude_merges=exclude_merges,
+        include_orgs=include_orgs,
+        exclude_orgs=exclude_orgs)
+
+    ndays = (dates[-1] - origin).days
+    organization = pandas.Categorical(daily_df['organization'])
+    orgs = list(organization.categories)
+
+    day_idx = numpy.asarray((daily_df['day'] - origin).dt.days)
+    in_range = (day_idx >= 0) & (day_idx < ndays)
+
+    daily = numpy.zeros((ndays, len(orgs)), dtype=numpy.int64)
+    numpy.add.at(daily,
+                 (day_idx[in_range], organization.codes[in_range]),
+                 numpy.asarray(daily_df['contributions'])[in_range])
+
+    # running[k] holds the contributions of the k days after origin
+    running = numpy.zeros((ndays + 1, len(orgs)), dtype=numpy.int64)
+    numpy.cumsum(daily, axis=0, out=running[1:])
+
+    ends = numpy.asarray((dates - origin).days)
+    sums = numpy.stack([running[ends] - running[ends - window]
+                        for window in windows])
+
+    return dates, orgs, sums
+
+
+def __utc_day(date):
+    """Converts a date into a UTC midnight timestamp."""
+
+    ts = pandas.Timestamp(date)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+    return ts.normalize()
+
+
+def __by_date_and_window(dates, windows, name, values):
+    """Builds a tidy frame from an array with shape (windows, dates)."""
+
+    return pandas.DataFrame({
+        'date': numpy.tile(dates, len(windows)),
+        'window': numpy.repeat(windows, len(dates)),
+        name: values.ravel()
+    }).sort_values(['date', 'window'], ignore_index=True)
@@ -0,0 +1,321 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import contextlib
+import cProfile
+import functools
+import json
+import threading
+import time
+import tracemalloc
+
+from collections import namedtuple
+
+
+# A stage run: `path` joins the names of the stages it is nested in with
+# '/', times are in seconds and `peak` is the max memory, in bytes,
+# allocated by the stage on top of what was allocated when it started
+Record = namedtuple('Record', ['thread', 'path', 'start', 'end', 'cpu',
+                               'peak'])
+
+SUMMARY_COLUMNS = ['stage', 'calls', 'wall', 'cpu', 'peak_memory']
+
+SPEEDSCOPE_SCHEMA = 'https://www.speedscope.app/file-format-schema.json'
+
+__active = None
+
+# Memory traced before the last time traces were cleared, see
+# `__reset_peak`
+__memory_offset = 0
+
+
+class Profiler:
+    """Collects the stages run while profiling.
+
+    Stages may run in any thread. Memory is traced globally, so peaks of
+    stages running concurrently include each other's allocations.
+    """
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.records = []
+        self.started = time.perf_counter()
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def stack(self):
+        """Returns the stages open in the current thread, as a list of
+        `[name, start_memory, peak_memory]` lists."""
+
+        if not hasattr(self.__local, 'stack'):
+            self.__local.stack = []
+
+        return self.__local.stack
+
+    def add(self, record):
+        with self.__lock:
+            self.records.append(record)
+
+    def summary(self):
+        """Aggregates the stages run by path.
+
+        :returns: a Pandas DataFrame with `stage`, `calls`, `wall` and `cpu`
+            (total seconds) and `peak_memory` (max bytes) columns, sorted
+            in descending order by wall time.
+        """
+
+        import pandas
+
+        if not self.records:
+            return pandas.DataFrame(columns=SUMMARY_COLUMNS)
+
+        df = pandas.DataFrame.from_records(self.records,
+                                           columns=Record._fields)
+        df['wall'] = df['end'] - df['start']
+
+        df = df.groupby('path', sort=False).agg(
+            calls=('wall', 'size'),
+            wall=('wall', 'sum'),
+            cpu=('cpu', 'sum'),
+            peak_memory=('peak', 'max'))\
+            .rename_axis('stage').reset_index()
+
+        return df[SUMMARY_COLUMNS]\
+            .sort_values('wall', ascending=False, kind='mergesort',
+                         ignore_index=True)
+
+    def speedscope(self):
+        """Converts the stages run into a speedscope profile, with a timeline
+        per thread.
+
+        :returns: a dict following `SPEEDSCOPE_SCHEMA`.
+        """
+
+        frames = []
+        frame_ids = {}
+        profiles = []
+
+        records = sorted(self.records, key=lambda r: (r.thread, r.start))
+        threads = sorted({r.thread for r in records})
+
+        for thread in threads:
+            events = []
+            for r in records:
+                if r.thread != thread:
+                    continue
+
+                name = r.path.rsplit('/', 1)[-1]
+                if name not in frame_ids:
+                    frame_ids[name] = len(frames)
+                    frames.append({'name': name})
+
+                events.append((r.start - self.started, 'O', frame_ids[name],
+                               -r.end))
+                events.append((r.end - self.started, 'C', frame_ids[name],
+                               -r.start))
+
+            # Stages are nested, so at the same instant closing comes
+            # first and inner stages close before outer ones
+            events.sort(key=lambda e: (e[0], e[1] == 'O', e[3]))
+
+            profiles.append({
+                'type': 'evented',
+                'name': 'Thread {}'.format(thread),
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': max(e[0] for e in events),
+                'events': [{'type': t, 'frame': f, 'at': at}
+                           for at, t, f, _ in events]
+            })
+
+        return {'$schema': SPEEDSCOPE_SCHEMA,
+                'shared': {'frames': frames},
+                'profiles': profiles,
+                'exporter': 'broomstick'}
+
+
+@contextlib.contextmanager
+def profile(memory=True, cprofile=None, speedscope=None):
+    """Profiles the stages run inside the context.
+
+    Stages (see `stage`) record their wall and CPU time and, if `memory` is
+    set, their peak of allocated memory using `tracemalloc`, which slows
+    down allocations while enabled.
+
+        with broomstick.profile() as profiler:
+            elephant_factor(DataSource.GIT, '2019-01-01', print_dist=False)
+
+        print(profiler.summary())
+
+    :param memory: whether or not to trace memory peaks.
+    :param cprofile: optional path to dump `cProfile` stats of the calling
+        thread to, readable with `pstats` or `snakeviz`.
+    :param speedscope: optional path to write the stages timeline to, in
+        speedscope JSON format.
+    :returns: a context manager yielding the `Profiler`.
+    """
+    global __active, __memory_offset
+
+    if __active is not None:
+        raise RuntimeError("Profiling is already enabled")
+
+    __memory_offset = 0
+
+    profiler = Profiler(memory=memory)
+    tracing = memory and not tracemalloc.is_tracing()
+    stats = cProfile.Profile() if cprofile else None
+
+    if tracing:
+        tracemalloc.start()
+
+    __active = profiler
+
+    if stats:
+        stats.enable()
+
+    try:
+        yield profiler
+    finally:
+        if stats:
+            stats.disable()
+            stats.dump_stats(cprofile)
+
+        __active = None
+
+        if tracing:
+            tracemalloc.stop()
+
+        if speedscope:
+            with open(speedscope, 'w') as f:
+                json.dump(profiler.speedscope(), f)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Records a stage when profiling, does nothing otherwise.
+
+    :param name: stage name, e.g. `http`.
+    :returns: a context manager.
+    """
+
+    profiler = __active
+
+    if profiler is None:
+        yield
+        return
+
+    stack = profiler.stack()
+    start_memory = __enter_memory(profiler, stack)
+    path = '/'.join([s[0] for s in stack] + [name])
+
+    stack.append([name, start_memory, start_memory])
+    start = time.perf_counter()
+    start_cpu = time.thread_time()
+
+    try:
+        yield
+    finally:
+        cpu = time.thread_time() - start_cpu
+        end = time.perf_counter()
+
+        _, start_memory, peak = stack.pop()
+        peak = __exit_memory(profiler, stack, peak) - start_memory
+
+        profiler.add(Record(threading.get_ident(), path, start, end, cpu,
+                            max(peak, 0)))
+
+
+def profiled(name=None):
+    """Decorates a function so every call is a stage.
+
+    :param name: stage name, the function name by default.
+    :returns: the decorator.
+    """
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(stage_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def __enter_memory(profiler, stack):
+    """Returns the memory allocated when a stage starts, keeping the peak
+    reached so far by the stage it is nested in."""
+
+    if not profiler.memory or not tracemalloc.is_tracing():
+        return 0
+
+    current, peak = __traced_memory()
+
+    if stack:
+        stack[-1][2] = max(stack[-1][2], peak)
+
+    __reset_peak()
+
+    return current
+
+
+def __exit_memory(profiler, stack, peak):
+    """Returns the memory peak of a stage, passing it to the stage it is
+    nested in."""
+
+    if not profiler.memory or not tracemalloc.is_tracing():
+        return 0
+
+    peak = max(peak, __traced_memory()[1])
+
+    if stack:
+        stack[-1][2] = max(stack[-1][2], peak)
+
+    return peak
+
+
+def __traced_memory():
+    """Returns the current and peak memory traced, in bytes."""
+
+    current, peak = tracemalloc.get_traced_memory()
+
+    return __memory_offset + current, __memory_offset + peak
+
+
+def __reset_peak():
+    """Makes the traced memory peak start again from the current memory.
+
+    `tracemalloc.reset_peak` is not available before Python 3.9, where
+    traces are cleared instead, keeping the memory traced so far as an
+    offset. Blocks allocated before are not traced anymore, so freeing
+    them is not noticed and later peaks may be a bit higher.
+    """
+    global __memory_offset
+
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+        return
+
+    __memory_offset += tracemalloc.get_traced_memory()[0]
+    tracemalloc.clear_traces()
@@ -0,0 +1,437 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import time
+
+from broomstick import jobs, runner
+from broomstick.lazy import lazy_import
+
+cm = lazy_import('broomstick.metrics.concentration')
+com = lazy_import('broomstick.data.es.common')
+gm = lazy_import('broomstick.metrics.general')
+pandas = lazy_import('pandas')
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds re-read before the last checkpoint on every refresh. Documents
+# become searchable a while after being enriched, so those enriched just
+# before the checkpoint may not have been found yet
+LAG = 300
+
+# Seconds between refreshes when following an index
+INTERVAL = 60
+
+# Seconds to wait for other processes to release the database
+DB_TIMEOUT = 60
+
+# Format of the days stored in the database
+DAY_FORMAT = '%Y-%m-%d'
+
+# Contributions by organization per day (`daily`), and their sum over
+# every cached day (`totals`), of each set of params (`aggregates`).
+# `checkpoint` is the last enrichment time seen, in milliseconds
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS aggregates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    checkpoint INTEGER,
+    refreshed REAL
+);
+CREATE TABLE IF NOT EXISTS daily (
+    aggregate INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    organization TEXT NOT NULL,
+    contributions INTEGER NOT NULL,
+    PRIMARY KEY (aggregate, day, organization)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (
+    aggregate INTEGER NOT NULL,
+    organization TEXT NOT NULL,
+    contributions INTEGER NOT NULL,
+    PRIMARY KEY (aggregate, organization)
+) WITHOUT ROWID;
+CREATE TEMP TABLE IF NOT EXISTS changed (day TEXT PRIMARY KEY);
+"""
+
+
+def connect(path):
+    """Opens a cache of aggregates, creating it if needed.
+
+    :param path: path to the SQLite database.
+    :returns: a `sqlite3.Connection`, in autocommit mode (see
+        `broomstick.jobs.transaction`).
+    """
+
+    conn = sqlite3.connect(path, timeout=DB_TIMEOUT, isolation_level=None)
+    conn.executescript(SCHEMA)
+
+    return conn
+
+
+def aggregate_key(data_source,
+                  start_date,
+                  exclude_unknown=True,
+                  exclude_bots=False,
+                  exclude_merges=False,
+                  include_orgs=None,
+                  exclude_orgs=None):
+    """Identifies the aggregates of a set of params.
+
+    The index queried for the data source is part of the key, so indexes
+    are refreshed and checkpointed independently.
+
+    :returns: a string, see `refresh` for the params.
+    """
+
+    return json.dumps({
+        'index': com.DS_INDEX[data_source],
+        'start_date': start_date,
+        'exclude_unknown': exclude_unknown,
+        'exclude_bots': exclude_bots,
+        'exclude_merges': exclude_merges,
+        'include_orgs': include_orgs,
+        'exclude_orgs': exclude_orgs
+    }, sort_keys=True)
+
+
+def refresh(conn,
+            data_source,
+            start_date,
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None,
+            lag=LAG,
+            full=False):
+    """Brings the contributions by organization per day up to date.
+
+    The first refresh counts every contribution since `start_date`. Later
+    ones only look for the documents enriched since the last checkpoint
+    (minus `lag`), and count again the contributions of the days those
+    documents belong to. Days are replaced as a whole, so reading the same
+    documents twice does no harm, and organization totals are updated with
+    the difference.
+
+    Documents deleted from the index, or moved to another day, still count
+    in the days they were in until a `full` refresh.
+
+    :param conn: cache connection.
+    :param data_source: `broomstick.core.DataSource`
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param exclude_unknown: whether or not to exclude contributions sent by
+        people affiliated to 'Unknown' organization.
+    :param exclude_bots: whether or not to exclude contributions sent by
+        bots.
+    :param exclude_merges: whether or not to exclude merge commits.
+    :param include_orgs: optional list of organizations to count
+        contributions from, or a terms lookup (see
+        `broomstick.data.es.common.terms_lookup`).
+    :param exclude_orgs: optional list of organizations whose contributions
+        are not counted, or a terms lookup.
+    :param lag: seconds re-read before the checkpoint.
+    :param full: whether or not to count every contribution again.
+    :returns: a dict with the `aggregate` id, the new `checkpoint`, the
+        number of `days` counted again and whether the refresh was `full`.
+    """
+
+    params = {
+        'start_date': start_date,
+        'exclude_unknown': exclude_unknown,
+        'exclude_bots': exclude_bots,
+        'exclude_merges': exclude_merges,
+        'include_orgs': include_orgs,
+        'exclude_orgs': exclude_orgs
+    }
+
+    key = aggregate_key(data_source, **params)
+
+    with jobs.transaction(conn):
+        conn.execute("INSERT OR IGNORE INTO aggregates (key) VALUES (?)",
+                     (key,))
+        aggregate, checkpoint = conn.execute(
+            "SELECT id, checkpoint FROM aggregates WHERE key = ?",
+            (key,)).fetchone()
+
+    # Taken before counting, so documents enriched meanwhile are found by
+    # the next refresh
+    until = com.last_enriched(data_source)
+
+    full = full or checkpoint is None
+
+    if full:
+        daily_dfs = [gm.contributions_count_by_org_daily(
+            data_source=data_source, **params)]
+        days = pandas.DatetimeIndex(daily_dfs[0]['day'].unique())
+    else:
+        days = com.enriched_days(data_source,
+                                 since=checkpoint - int(lag * 1000),
+                                 until=until)
+        days = days[days >= __utc_day(start_date)]
+        daily_dfs = [gm.contributions_count_by_org_daily(
+            data_source=data_source, days=batch, **params)
+            for batch in __day_batches(days)]
+
+    with jobs.transaction(conn):
+        if full:
+            conn.execute("DELETE FROM daily WHERE aggregate = ?",
+                         (aggregate,))
+            conn.execute("DELETE FROM totals WHERE aggregate = ?",
+                         (aggregate,))
+        else:
+            __remove_days(conn, aggregate, days)
+
+        for daily_df in daily_dfs:
+            __add_days(conn, aggregate, daily_df)
+
+        conn.execute("UPDATE aggregates SET checkpoint = ?, refreshed = ? "
+                     "WHERE id = ?",
+                     (until if until is not None else checkpoint,
+                      time.time(), aggregate))
+
+    logger.info("Aggregate %s: %d days counted again", aggregate, len(days))
+
+    return {'aggregate': aggregate,
+            'checkpoint': until,
+            'days': len(days),
+            'full': full}
+
+
+def contributions_by_org(conn, aggregate, start_date=None, end_date=None):
+    """Gets cached contributions by organization.
+
+    Without dates, organization totals are read as they are, otherwise
+    they are added up from the cached days. Dates are whole days.
+
+    :param conn: cache connection.
+    :param aggregate: aggregate id, as returned by `refresh`.
+    :param start_date: optional day from which we want to start counting
+        contributions (exclusive).
+    :param end_date: optional day until we want to count contributions to
+        (inclusive).
+    :returns: a Pandas DataFrame with `organization` and `contributions`
+        columns, sorted by contributions in descending order.
+    """
+
+    if start_date is None and end_date is None:
+        query = ("SELECT organization, contributions FROM totals "
+                 "WHERE aggregate = ?")
+        params = (aggregate,)
+    else:
+        query = ("SELECT organization, SUM(contributions) AS contributions "
+                 "FROM daily WHERE aggregate = ? AND day > ? AND day <= ? "
+                 "GROUP BY organization")
+        params = (aggregate,
+                  __format_day(start_date) if start_date else '',
+                  __format_day(end_date) if end_date else '9999')
+
+    df = pandas.read_sql_query(query + " ORDER BY contributions DESC, "
+                                       "organization", conn, params=params)
+
+    return df[df['contributions'] > 0].reset_index(drop=True)
+
+
+def elephant_factor(conn, aggregate, start_date=None, end_date=None,
+                    threshold=0.5):
+    """Computes the Elephant Factor from cached contributions.
+
+    See `contributions_by_org` for the params.
+
+    :param threshold: fraction of contributions to reach, 0.5 by default.
+    :returns: the number of organizations sending up to the 50% (or the
+        given `threshold`) of contributions.
+    """
+
+    df = contributions_by_org(conn, aggregate,
+                              start_date=start_date, end_date=end_date)
+
+    return cm.factor(df['contributions'].values, threshold=threshold)
+
+
+def create_parser():
+    """Creates the command line parser."""
+
+    parser = argparse.ArgumentParser(
+        prog='broomstick-refresh',
+        description="Keep contributions by organization up to date, "
+                    "counting again only the days with new documents.")
+    parser.add_argument('-d', '--database', default='broomstick-cache.sqlite',
+                        help="cache database (default: %(default)s)")
+    parser.add_argument('-s', '--data-source', dest='data_sources',
+                        action='append', required=True,
+                        help="data source to refresh, can be repeated")
+    parser.add_argument('--start-date', required=True,
+                        help="date from which contributions are counted "
+                             "(exclusive)")
+    parser.add_argument('-c', '--config', default='.settings',
+                        help="ElasticSearch settings file "
+                             "(default: %(default)s)")
+    parser.add_argument('--include-unknown', action='store_true',
+                        help="count contributions from 'Unknown' "
+                             "organization")
+    parser.add_argument('--exclude-bots', action='store_true',
+                        help="exclude contributions sent by bots")
+    parser.add_argument('--exclude-merges', action='store_true',
+                        help="exclude merge commits")
+    parser.add_argument('--lag', type=float, default=LAG,
+                        help="seconds re-read before the last checkpoint "
+                             "(default: %(default)s)")
+    parser.add_argument('--full', action='store_true',
+                        help="count every contribution again")
+    parser.add_argument('--follow', action='store_true',
+                        help="keep refreshing every --interval seconds")
+    parser.add_argument('--interval', type=float, default=INTERVAL,
+                        help="seconds between refreshes when following "
+                             "(default: %(default)s)")
+
+    return parser
+
+
+def main(argv=None):
+    """Entry point for the `broomstick-refresh` console script."""
+
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        data_sources = [runner.parse_data_source(ds)
+                        for ds in args.data_sources]
+    except ValueError as e:
+        parser.error(str(e))
+
+    com.create_es_connection(config_file=args.config)
+
+    conn = connect(args.database)
+    full = args.full
+
+    try:
+        while True:
+            for data_source in data_sources:
+                summary = refresh(conn, data_source, args.start_date,
+                                  exclude_unknown=not args.include_unknown,
+                                  exclude_bots=args.exclude_bots,
+                                  exclude_merges=args.exclude_merges,
+                                  lag=args.lag,
+                                  full=full)
+                summary['data_source'] = data_source.name.lower()
+                summary['elephant_factor'] = elephant_factor(
+                    conn, summary['aggregate'])
+                sys.stdout.write(json.dumps(summary) + '\n')
+                sys.stdout.flush()
+
+            if not args.follow:
+                return 0
+
+            full = False
+            time.sleep(args.interval)
+    finally:
+        conn.close()
+
+
+def __utc_day(date):
+    """Converts a date into a UTC midnight timestamp."""
+
+    ts = pandas.Timestamp(date)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+
+    return ts.normalize()
+
+
+def __format_day(date):
+    """Formats a date as a stored day."""
+
+    return __utc_day(date).strftime(DAY_FORMAT)
+
+
+def __day_batches(days):
+    """Splits days so each batch can be queried at once."""
+
+    ranges = com.day_ranges(days)
+
+    for i in range(0, len(ranges), com.MAX_DAY_RANGES):
+        yield [day
+               for start, end in ranges[i:i + com.MAX_DAY_RANGES]
+               for day in pandas.date_range(
+                   start, end - pandas.Timedelta(days=1), freq='D')]
+
+
+def __remove_days(conn, aggregate, days):
+    """Removes the given days from the cache, and from the totals."""
+
+    conn.execute("DELETE FROM changed")
+    conn.executemany("INSERT OR IGNORE INTO changed VALUES (?)",
+                     [(day.strftime(DAY_FORMAT),) for day in days])
+
+    removed = conn.execute(
+        "SELECT organization, SUM(contributions) FROM daily "
+        "WHERE aggregate = ? AND day IN (SELECT day FROM changed) "
+        "GROUP BY organization", (aggregate,)).fetchall()
+
+    __add_totals(conn, aggregate,
+                 [(org, -contributions) for org, contributions in removed])
+
+    conn.execute("DELETE FROM daily "
+                 "WHERE aggregate = ? AND day IN (SELECT day FROM changed)",
+                 (aggregate,))
+
+
+def __add_days(conn, aggregate, daily_df):
+    """Adds days to the cache, and to the totals."""
+
+    if daily_df.empty:
+        return
+
+    days = daily_df['day'].dt.strftime(DAY_FORMAT)
+    orgs = daily_df['organization'].astype(str)
+    contributions = daily_df['contributions'].astype(int)
+
+    conn.executemany("INSERT INTO daily VALUES (?, ?, ?, ?)",
+                     zip([aggregate] * len(daily_df), days, orgs,
+                         map(int, contributions)))
+
+    added = contributions.groupby(orgs.values).sum()
+
+    __add_totals(conn, aggregate,
+                 [(org, int(value)) for org, value in added.items()])
+
+
+def __add_totals(conn, aggregate, contributions):
+    """Adds `(organization, contributions)` pairs to the totals."""
+
+    conn.executemany(
+        "INSERT INTO totals VALUES (?, ?, ?) "
+        "ON CONFLICT (aggregate, organization) "
+        "DO UPDATE SET contributions = contributions + excluded.contributions",
+        [(aggregate, org, value) for org, value in contributions])
+
+    conn.execute("DELETE FROM totals WHERE aggregate = ? "
+                 "AND contributions = 0", (aggregate,))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import argparse
+import collections
+import inspect
+import itertools
+import json
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+from broomstick import cli, runner
+
+
+# Max number of searches sent in a single `_msearch` request
+MSEARCH_BATCH_SIZE = 50
+
+# Params changing the ES query of metrics computed from an organization
+# summary (see `broomstick.data.es.common.org_summary_search`)
+SUMMARY_QUERY_PARAMS = ('exclude_bots', 'exclude_merges', 'include_orgs',
+                        'exclude_orgs')
+
+# Metrics computed from an organization summary, and the params they
+# support on top of `SUMMARY_QUERY_PARAMS`
+SUMMARY_METRICS = {
+    'contributions_count_total': ('exclude_unknown',),
+    'contributions_count_unknown': (),
+    'contributions_unknown_percentage': (),
+    'contributions_count_by_org': ('exclude_unknown',),
+    'contributions_distribution_by_org': ('exclude_unknown', 'bins', 'log'),
+    'elephant_factor': ('exclude_unknown', 'threshold', 'print_dist'),
+    'concentration_factors': ('exclude_unknown', 'threshold', 'level')
+}
+
+# A metric to compute for a data source and a date window
+Task = collections.namedtuple(
+    'Task', ['metric', 'data_source', 'start_date', 'end_date', 'params'])
+
+# Tasks grouped by the search they share, and tasks run on their own
+Plan = collections.namedtuple('Plan', ['summaries', 'standalone'])
+
+
+def load_spec(path):
+    """Loads a report specification from a YAML or JSON file.
+
+    A specification lists the metrics, data sources and date windows of
+    a report, plus optional params for every metric:
+
+        data_sources: [git, all]
+        windows:
+          - 2019-01-01:2020-01-01
+          - {start: 2020-01-01, end: 2021-01-01}
+        params:
+          exclude_bots: true
+        metrics:
+          - contributions_count_total
+          - name: elephant_factor
+            params: {threshold: 0.8}
+
+    Every metric is computed for every data source and window. Reading
+    YAML files requires `PyYAML`.
+
+    :param path: path to the specification, YAML unless it ends in `.json`.
+    :returns: the specification, as a dict.
+    """
+
+    with open(path) as f:
+        if path.endswith('.json'):
+            return json.load(f)
+
+        import yaml
+
+        return yaml.safe_load(f)
+
+
+def compile_spec(spec):
+    """Compiles a report specification into an execution plan.
+
+    Metrics that can be computed from an organization summary share a
+    single search per data source, window and query params, no matter
+    how many of them are requested. The rest of metrics are run on their
+    own.
+
+    :param spec: report specification (see `load_spec`).
+    :returns: a `Plan`, whose `summaries` is a dict of summary search
+        params to the tasks computed from it, and `standalone` a list of
+        tasks.
+    """
+
+    common_params = spec.get('params', {})
+    summaries = collections.OrderedDict()
+    standalone = []
+
+    for metric_spec, data_source, window in itertools.product(
+            spec['metrics'], spec['data_sources'], spec['windows']):
+
+        if isinstance(metric_spec, str):
+            metric_spec = {'name': metric_spec}
+
+        metric = metric_spec['name']
+        params = dict(common_params)
+        params.update(metric_spec.get('params', {}))
+
+        # Same params `runner.run_metric` would pass to the metric
+        accepted = inspect.signature(runner.get_metric(metric)).parameters
+        params = {k: v for k, v in params.items() if k in accepted}
+
+        start_date, end_date = parse_window(window)
+
+        task = Task(metric=metric,
+                    data_source=runner.parse_data_source(data_source),
+                    start_date=start_date,
+                    end_date=end_date,
+                    params=params)
+
+        if is_summary_task(task):
+            key = (task.data_source, task.start_date, task.end_date,
+                   summary_query_params(params))
+            summaries.setdefault(key, []).append(task)
+        else:
+            standalone.append(task)
+
+    return Plan(summaries=summaries, standalone=standalone)
+
+
+def parse_window(window):
+    """Parses a window of a report specification.
+
+    :param window: a `START[:END]` string or a dict with `start` and
+        optional `end` keys.
+    :returns: a tuple with start and end dates, as strings.
+    """
+
+    if isinstance(window, dict):
+        start_date, end_date = window['start'], window.get('end')
+    else:
+        start_date, _, end_date = str(window).partition(':')
+
+    # YAML loads unquoted dates as `datetime.date`
+    return str(start_date), str(end_date) if end_date else None
+
+
+def summary_query_params(params):
+    """Gets the params of a task changing its summary search.
+
+    :param params: task params.
+    :returns: the params set to something other than their default value,
+        as a JSON string, so tasks sharing a search can be grouped.
+    """
+
+    return json.dumps({name: params[name] for name in SUMMARY_QUERY_PARAMS
+                       if params.get(name) not in (None, False)},
+                      sort_keys=True)
+
+
+def is_summary_task(task):
+    """Checks whether a task can be computed from an organization summary.
+
+    :param task: a `Task`.
+    """
+
+    if task.metric not in SUMMARY_METRICS:
+        return False
+
+    if task.params.get('level', 'org') != 'org':
+        return False
+
+    supported = SUMMARY_QUERY_PARAMS + SUMMARY_METRICS[task.metric]
+
+    return all(param in supported for param in task.params)
+
+
+def run_plan(plan, jobs=4):
+    """Runs an execution plan.
+
+    Summary searches are sent in batches of up to `MSEARCH_BATCH_SIZE`
+    searches per `_msearch` request. Batches and standalone tasks run in
+    parallel.
+
+    :param plan: a `Plan`, see `compile_spec`.
+    :param jobs: number of requests run in parallel.
+    :returns: a list of records (see `broomstick.runner.to_records`),
+        summary metrics first.
+    """
+
+    keys = list(plan.summaries)
+    batches = [keys[i:i + MSEARCH_BATCH_SIZE]
+               for i in range(0, len(keys), MSEARCH_BATCH_SIZE)]
+
+    def run_batch(batch):
+        from broomstick.data.es import common as com
+
+        searches = [com.org_summary_search(data_source=data_source,
+                                           start_date=start_date,
+                                           end_date=end_date,
+                                           **json.loads(query_params))
+                    for data_source, start_date, end_date, query_params
+                    in batch]
+
+        records = []
+        for key, response in zip(batch, com.multi_search(searches)):
+            for task in plan.summaries[key]:
+                records.extend(run_summary_task(task, response))
+
+        return records
+
+    def run_standalone(task):
+        return runner.run_metric(task.metric, task.data_source,
+                                 task.start_date, task.end_date,
+                                 **task.params)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Submit every task before waiting for any of them
+        batch_results = executor.map(run_batch, batches)
+        standalone_results = executor.map(run_standalone, plan.standalone)
+
+        results = list(batch_results) + list(standalone_results)
+
+    return list(itertools.chain.from_iterable(results))
+
+
+def run_summary_task(task, response):
+    """Computes a metric from an organization summary search response.
+
+    :param task: a `Task`, see `is_summary_task`.
+    :param response: the `org_summary_search` response, as a dict.
+    :returns: a list of records (see `broomstick.runner.to_records`).
+    """
+
+    from broomstick.data.es import common as com
+    from broomstick.metrics import concentration as cm
+    from broomstick.metrics import distribution as dist
+
+    params = task.params
+    summary = com.org_summary(
+        response, exclude_unknown=params.get('exclude_unknown', True))
+    contributions = summary['by_org']['contributions'].values
+
+    if task.metric == 'contributions_count_total':
+        result = summary['total']
+    elif task.metric == 'contributions_count_unknown':
+        result = summary['unknown']
+    elif task.metric == 'contributions_unknown_percentage':
+        total = com.org_summary(response, exclude_unknown=False)['total']
+        result = (summary['unknown'] / total) * 100
+    elif task.metric == 'contributions_count_by_org':
+        result = summary['by_org']
+    elif task.metric == 'contributions_distribution_by_org':
+        result = dist.histogram(contributions,
+                                bins=params.get('bins', 20),
+                                log=params.get('log', False))
+    elif task.metric == 'elephant_factor':
+        result = cm.factor(contributions,
+                           threshold=params.get('threshold', 0.5),
+                           total=summary['total'])
+    else:
+        result = cm.concentration(contributions,
+                                  threshold=params.get('threshold', 0.5))
+
+    return runner.to_records(result,
+                             metric=task.metric,
+                             data_source=task.data_source.name.lower(),
+                             start_date=task.start_date,
+                             end_date=task.end_date)
+
+
+def run_report(spec, jobs=4):
+    """Computes every metric of a report specification.
+
+    :param spec: report specification, or the path to it (see
+        `load_spec`).
+    :param jobs: number of requests run in parallel.
+    :returns: a Pandas DataFrame with a row per record (see
+        `broomstick.runner.to_records`): `metric`, `data_source`,
+        `start_date` and `end_date` columns plus the columns of every
+        metric result.
+    """
+
+    import pandas
+
+    if isinstance(spec, str):
+        spec = load_spec(spec)
+
+    return pandas.DataFrame.from_records(run_plan(compile_spec(spec),
+                                                  jobs=jobs))
+
+
+def create_parser():
+    """Creates the command line parser."""
+
+    parser = argparse.ArgumentParser(
+        prog='broomstick-report',
+        description="Compute a Broomstick report from its specification.")
+
+    parser.add_argument('spec',
+                        help="report specification, YAML or JSON")
+    parser.add_argument('-c', '--config', default='.settings',
+                        help="ElasticSearch settings file "
+                             "(default: %(default)s)")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file, `-` for stdout "
+                             "(default: %(default)s)")
+    parser.add_argument('-f', '--format', default='jsonl',
+                        choices=cli.OUTPUT_FORMATS,
+                        help="output format (default: %(default)s)")
+    parser.add_argument('--project',
+                        help="project the report is computed for, "
+                             "required by `dataset` output")
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help="number of requests run in parallel "
+                             "(default: %(default)s)")
+
+    return parser
+
+
+def main(argv=None):
+    """Entry point for the `broomstick-report` console script."""
+
+    from broomstick.data.es import common as com
+
+    args = create_parser().parse_args(argv)
+
+    spec = load_spec(args.spec)
+
+    # Create the shared connection before spawning threads
+    com.create_es_connection(config_file=args.config)
+
+    records = run_plan(compile_spec(spec), jobs=args.jobs)
+
+    cli.write_output(records, args.output, args.format, project=args.project)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import importlib
+import inspect
+
+from broomstick import profiling as prof
+from broomstick.core import DataSource
+
+
+# Metrics that can be run by name, as (module, function). Modules are only
+# imported when the metric is run, so importing this module stays cheap.
+METRICS = {
+    'contributions_count_total':
+        ('broomstick.metrics.general', 'contributions_count_total'),
+    'contributions_count_unknown':
+        ('broomstick.metrics.general', 'contributions_count_unknown'),
+    'contributions_unknown_percentage':
+        ('broomstick.metrics.general', 'contributions_unknown_percentage'),
+    'contributions_count_by_org':
+        ('broomstick.metrics.general', 'contributions_count_by_org'),
+    'contributions_count_by_author':
+        ('broomstick.metrics.general', 'contributions_count_by_author'),
+    'contributions_count_by_author_org':
+        ('broomstick.metrics.general', 'contributions_count_by_author_org'),
+    'contributions_distribution_by_org':
+        ('broomstick.metrics.distribution',
+         'contributions_distribution_by_org'),
+    'contributions_percentiles_by_org':
+        ('broomstick.metrics.distribution',
+         'contributions_percentiles_by_org'),
+    'elephant_factor':
+        ('broomstick.metrics.factors', 'elephant_factor'),
+    'pony_factor':
+        ('broomstick.metrics.factors', 'pony_factor'),
+    'concentration_factors':
+        ('broomstick.metrics.factors', 'concentration_factors'),
+    'rolling_contributions_by_org':
+        ('broomstick.metrics.rolling', 'rolling_contributions_by_org'),
+    'rolling_contributions_count_total':
+        ('broomstick.metrics.rolling', 'rolling_contributions_count_total'),
+    'rolling_elephant_factor':
+        ('broomstick.metrics.rolling', 'rolling_elephant_factor'),
+    'contributor_retention':
+        ('broomstick.metrics.cohorts', 'contributor_retention'),
+    'cohort_retention':
+        ('broomstick.metrics.cohorts', 'cohort_retention')
+}
+
+# Params always used when running a metric without a front-end
+METRIC_DEFAULTS = {
+    'elephant_factor': {'print_dist': False}
+}
+
+
+def get_metric(name):
+    """Returns the function implementing the given metric.
+
+    :param name: metric name, one of the keys in `METRICS`.
+    :returns: the metric function.
+    """
+
+    if name not in METRICS:
+        raise ValueError("Unknown metric '{}', expected one of {}"
+                         .format(name, sorted(METRICS)))
+
+    module_name, function_name = METRICS[name]
+    module = importlib.import_module(module_name)
+
+    return getattr(module, function_name)
+
+
+def parse_data_source(name):
+    """Returns the `broomstick.core.DataSource` matching a name.
+
+    :param name: data source name, case insensitive (e.g. `git`).
+    :returns: the corresponding `broomstick.core.DataSource`.
+    """
+
+    if isinstance(name, DataSource):
+        return name
+
+    try:
+        return DataSource[name.upper()]
+    except KeyError:
+        raise ValueError("Unknown data source '{}', expected one of {}"
+                         .format(name, [ds.name.lower() for ds in DataSource]))
+
+
+def supports_mode(metric, mode):
+    """Checks whether a metric can be computed in the given mode.
+
+    Only metrics with a `mode` param support modes other than `exact`
+    (see `broomstick.metrics.general.MODES`).
+
+    :param metric: metric name, one of the keys in `METRICS`.
+    :param mode: mode name.
+    """
+
+    return mode == 'exact' \
+        or 'mode' in inspect.signature(get_metric(metric)).parameters
+
+
+def run_metric(metric, data_source, start_date, end_date=None, **params):
+    """Runs a metric and returns its result as a list of flat records.
+
+    Params not accepted by the metric function are silently ignored, so
+    the same set of options can be used for every metric, except `mode`:
+    metrics not supporting it (see `supports_mode`) are not computed.
+
+    :param metric: metric name, one of the keys in `METRICS`.
+    :param data_source: `broomstick.core.DataSource` or its name.
+    :param start_date: date from which we want to start counting contributions
+        (exclusive).
+    :param end_date: date until we want to counts contributions to (inclusive).
+    :param params: any other param for the metric function.
+    :returns: a list of records (see `to_records`).
+    :raises ValueError: if the metric doesn't support the given `mode`.
+    """
+
+    data_source = parse_data_source(data_source)
+    func = get_metric(metric)
+
+    mode = params.get('mode', 'exact')
+    if not supports_mode(metric, mode):
+        raise ValueError("Metric '{}' can't be computed in {} mode"
+                         .format(metric, mode))
+
+    accepted = inspect.signature(func).parameters
+    kwargs = {k: v for k, v in params.items() if k in accepted}
+    kwargs.update(METRIC_DEFAULTS.get(metric, {}))
+
+    with prof.stage(metric):
+        result = func(data_source=data_source,
+                      start_date=start_date,
+                      end_date=end_date,
+                      **kwargs)
+
+    return to_records(result,
+                      metric=metric,
+                      data_source=data_source.name.lower(),
+                      start_date=start_date,
+                      end_date=end_date)
+
+
+def to_records(result, **fields):
+    """Converts a metric result into a list of flat records.
+
+    Scalar results produce a single record with a `value` key. Dicts
+    produce a single record with their keys. Data frames produce one record
+    per row, with a key per column.
+
+    :param result: the value returned by a metric function.
+    :param fields: common fields added to every record.
+    :returns: a list of dicts.
+    """
+
+    if hasattr(result, 'to_dict') and hasattr(result, 'columns'):
+        rows = result.to_dict(orient='records')
+    elif isinstance(result, dict):
+        rows = [result]
+    else:
+        rows = [{'value': result}]
+
+    records = []
+    for row in rows:
+        record = dict(fields)
+        record.update({k: __to_builtin(v) for k, v in row.items()})
+        records.append(record)
+
+    return records
+
+
+def __to_builtin(value):
+    """Converts NumPy scalars into Python built-in types."""
+
+    return value.item() if hasattr(value, 'item') else value
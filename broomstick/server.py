@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import argparse
+import asyncio
+import inspect
+import json
+import sys
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlsplit
+
+from broomstick import runner
+
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error'
+}
+
+# Query params used to locate the data, the rest are passed to the metric
+QUERY_FIELDS = ['data_source', 'start_date', 'end_date']
+
+# Params holding comma separated lists
+LIST_PARAMS = ['include_orgs', 'exclude_orgs']
+
+# Metric params that can be set over HTTP. Others, like `affiliations`
+# (a local path), are only for trusted callers.
+HTTP_PARAMS = ['exclude_unknown', 'exclude_bots', 'exclude_merges',
+               'include_orgs', 'exclude_orgs', 'threshold', 'bins', 'log',
+               'percents', 'windows', 'step', 'interval', 'level',
+               'relative', 'mode']
+
+
+class TTLCache:
+    """Simple in-memory cache whose entries expire after `ttl` seconds.
+
+    When `maxsize` entries are stored, the oldest one is evicted.
+
+    :param ttl: time to live of every entry, in seconds.
+    :param maxsize: maximum number of entries.
+    """
+
+    def __init__(self, ttl=300, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.__entries = OrderedDict()
+
+    def get(self, key):
+        """Returns the value stored for `key`, or `None` if missing or
+        expired."""
+
+        entry = self.__entries.get(key)
+
+        if entry is None:
+            return None
+
+        expires, value = entry
+
+        if expires < time.monotonic():
+            del self.__entries[key]
+            return None
+
+        return value
+
+    def set(self, key, value):
+        """Stores `value` for `key`, evicting the oldest entry if full."""
+
+        self.__entries.pop(key, None)
+        self.__entries[key] = (time.monotonic() + self.ttl, value)
+
+        while len(self.__entries) > self.maxsize:
+            self.__entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class MetricsService:
+    """Computes metrics coalescing identical concurrent requests.
+
+    Only one computation per distinct request is in flight at any time,
+    every other caller asking for the same metric awaits its result
+    (single-flight). Results are kept in a shared `TTLCache`.
+
+    :param ttl: seconds results are served from cache.
+    :param maxsize: maximum number of cached results.
+    :param max_workers: maximum number of metrics computed in parallel.
+    """
+
+    def __init__(self, ttl=300, maxsize=1024, max_workers=8):
+        self.cache = TTLCache(ttl=ttl, maxsize=maxsize)
+        self.__in_flight = {}
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    async def get(self, metric, data_source, start_date, end_date=None,
+                  **params):
+        """Returns the records of a metric, see `broomstick.runner`.
+
+        :param metric: metric name.
+        :param data_source: `broomstick.core.DataSource` or its name.
+        :param start_date: date range start (exclusive).
+        :param end_date: date range end (inclusive).
+        :param params: any other param for the metric.
+        :returns: the list of records computed for the metric.
+        """
+
+        data_source = runner.parse_data_source(data_source)
+        key = (metric, data_source, start_date, end_date,
+               tuple(sorted(params.items())))
+
+        records = self.cache.get(key)
+        if records is not None:
+            return records
+
+        future = self.__in_flight.get(key)
+
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.__executor,
+                lambda: runner.run_metric(metric, data_source,
+                                          start_date, end_date, **params))
+            self.__in_flight[key] = future
+            future.add_done_callback(
+                lambda f: self.__computation_done(key, f))
+
+        # Don't let a cancelled caller cancel everybody else's computation
+        return await asyncio.shield(future)
+
+    def __computation_done(self, key, future):
+        """Caches the result of a finished computation."""
+
+        del self.__in_flight[key]
+
+        if not future.cancelled() and future.exception() is None:
+            self.cache.set(key, future.result())
+
+    def close(self):
+        """Shuts down the worker threads."""
+
+        self.__executor.shutdown(wait=False)
+
+
+def parse_param(name, value, default=None):
+    """Converts a query string param into the type the metric expects.
+
+    The type is taken from the default value of the param: booleans,
+    numbers and tuples of numbers are converted, e.g. `threshold=0.8` or
+    `windows=30,90`. Lists are converted into tuples, so they can be part
+    of cache keys. Params without a typed default keep their string value,
+    unless they are booleans.
+
+    :param name: param name.
+    :param value: param value, as found in the query string.
+    :param default: default value of the param in the metric signature.
+    :returns: the converted value.
+    :raises ValueError: if the value cannot be converted.
+    """
+
+    if name in LIST_PARAMS:
+        return tuple(item for item in value.split(',') if item)
+
+    try:
+        if isinstance(default, (tuple, list)):
+            item_type = type(default[0]) if default else str
+            return tuple(__convert(item, item_type)
+                         for item in value.split(',') if item)
+
+        if default is not None:
+            return __convert(value, type(default))
+    except ValueError:
+        raise ValueError("Invalid value '{}' for param '{}'"
+                         .format(value, name))
+
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+
+    return value
+
+
+def __convert(value, to_type):
+    """Converts a string into a boolean, number or string."""
+
+    if to_type is bool:
+        if value.lower() not in ('true', 'false'):
+            raise ValueError(value)
+        return value.lower() == 'true'
+
+    if to_type in (int, float):
+        return to_type(value)
+
+    return value
+
+
+def metric_defaults(metric):
+    """Gets the default value of every param of a metric.
+
+    :param metric: metric name, one of the keys in `broomstick.runner.METRICS`.
+    :returns: a dict with the default value of each param, `None` for
+        params without a default.
+    """
+
+    params = inspect.signature(runner.get_metric(metric)).parameters
+
+    return {name: None if param.default is param.empty else param.default
+            for name, param in params.items()}
+
+
+async def handle_request(service, method, target):
+    """Handles an HTTP request and returns its status and JSON body.
+
+    Routes:
+        - `GET /metrics`: list of available metrics.
+        - `GET /metrics/<name>?data_source=...&start_date=...[&end_date=...]`:
+          records of the given metric. Other query params in
+          `HTTP_PARAMS` are passed to the metric, e.g. `exclude_bots=true`,
+          `threshold=0.8` or `exclude_orgs=Lled,Marble` (see
+          `parse_param`). Params the metric doesn't accept are ignored.
+
+    :param service: the `MetricsService` computing the metrics.
+    :param method: HTTP method.
+    :param target: request target (path and query string).
+    :returns: a tuple with the HTTP status code and the response body.
+    """
+
+    if method != 'GET':
+        return 405, {'error': "Only GET is supported"}
+
+    url = urlsplit(target)
+    parts = [part for part in url.path.split('/') if part]
+
+    if parts == ['metrics']:
+        return 200, {'metrics': sorted(runner.METRICS)}
+
+    if len(parts) != 2 or parts[0] != 'metrics':
+        return 404, {'error': "Not found: {}".format(url.path)}
+
+    metric = parts[1]
+    if metric not in runner.METRICS:
+        return 404, {'error': "Unknown metric '{}'".format(metric)}
+
+    args = parse_qsl(url.query)
+    unsupported = sorted({k for k, _ in args
+                          if k not in QUERY_FIELDS and k not in HTTP_PARAMS})
+
+    if unsupported:
+        return 400, {'error': "Unsupported params: {}"
+                     .format(', '.join(unsupported))}
+
+    # Ignored params are left out, so they don't split the cache
+    defaults = metric_defaults(metric)
+
+    try:
+        params = {k: parse_param(k, v, defaults.get(k))
+                  for k, v in args
+                  if k in defaults or k in QUERY_FIELDS}
+    except ValueError as e:
+        return 400, {'error': str(e)}
+
+    query = {field: params.pop(field, None) for field in QUERY_FIELDS}
+
+    if not query['data_source'] or not query['start_date']:
+        return 400, {'error': "`data_source` and `start_date` are required"}
+
+    try:
+        records = await service.get(metric, **query, **params)
+    except ValueError as e:
+        return 400, {'error': str(e)}
+    except Exception as e:
+        return 500, {'error': str(e)}
+
+    return 200, {'results': records}
+
+
+async def handle_connection(service, reader, writer):
+    """Reads a single HTTP request from the connection and answers it."""
+
+    try:
+        request_line = (await reader.readline()).decode('latin-1').split()
+
+        # Skip headers, requests have no body
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+
+        if len(request_line) != 3:
+            status, body = 400, {'error': "Malformed request"}
+        else:
+            method, target, _ = request_line
+            status, body = await handle_request(service, method, target)
+
+        payload = json.dumps(body, default=str).encode('utf-8')
+        writer.write('HTTP/1.1 {} {}\r\n'
+                     'Content-Type: application/json\r\n'
+                     'Content-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'
+                     .format(status, HTTP_REASONS[status], len(payload))
+                     .encode('latin-1'))
+        writer.write(payload)
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def start_server(service, host='127.0.0.1', port=8000):
+    """Starts serving the metrics computed by `service`.
+
+    :returns: the `asyncio` server.
+    """
+
+    return await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer),
+        host=host, port=port)
+
+
+def main(argv=None):
+    """Entry point for the `broomstick-server` console script."""
+
+    parser = argparse.ArgumentParser(
+        prog='broomstick-server',
+        description="Serve Broomstick metrics over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=8000,
+                        help="port to listen on (default: %(default)s)")
+    parser.add_argument('-c', '--config', default='.settings',
+                        help="ElasticSearch settings file "
+                             "(default: %(default)s)")
+    parser.add_argument('--ttl', type=float, default=300,
+                        help="seconds results are cached "
+                             "(default: %(default)s)")
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help="number of metrics computed in parallel "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    from broomstick.data.es import common as com
+
+    com.create_es_connection(config_file=args.config)
+
+    service = MetricsService(ttl=args.ttl, max_workers=args.jobs)
+
+    async def serve():
+        server = await start_server(service, host=args.host, port=args.port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
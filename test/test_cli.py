@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import argparse
+import io
+import json
+import numpy
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import cli
+from broomstick.core import DataSource
+
+
+class TestCli(TestCase):
+
+    def test_parse_window(self):
+        """Test date windows parsing.
+        """
+
+        self.assertEqual(cli.parse_window('2018-01-01:2020-01-01'),
+                         ('2018-01-01', '2020-01-01'))
+        self.assertEqual(cli.parse_window('2018-01-01:'),
+                         ('2018-01-01', None))
+        self.assertEqual(cli.parse_window('2018-01-01'),
+                         ('2018-01-01', None))
+
+        with self.assertRaises(argparse.ArgumentTypeError):
+            cli.parse_window(':2020-01-01')
+
+    @mock.patch('broomstick.cli.runner.run_metric')
+    def test_run(self, run_metric_mock):
+        """Test every combination of metrics, sources and windows is run.
+        """
+
+        run_metric_mock.side_effect = \
+            lambda metric, ds, start, end, **params: [(metric, ds, start)]
+
+        windows = [('2018-01-01', '2019-01-01'), ('2019-01-01', None)]
+        records = cli.run(['contributions_count_total', 'elephant_factor'],
+                          [DataSource.GIT],
+                          windows,
+                          jobs=2,
+                          exclude_bots=True)
+
+        self.assertEqual(records, [
+            ('contributions_count_total', DataSource.GIT, '2018-01-01'),
+            ('contributions_count_total', DataSource.GIT, '2019-01-01'),
+            ('elephant_factor', DataSource.GIT, '2018-01-01'),
+            ('elephant_factor', DataSource.GIT, '2019-01-01')
+        ])
+        run_metric_mock.assert_any_call('elephant_factor', DataSource.GIT,
+                                        '2019-01-01', None,
+                                        exclude_bots=True)
+
+    @mock.patch('broomstick.data.es.common.set_search_preference')
+    @mock.patch('broomstick.data.es.common.create_es_connection')
+    @mock.patch('broomstick.cli.run')
+    def test_main_jsonl(self, run_mock, create_es_connection_mock,
+                        set_search_preference_mock):
+        """Test the console script writes JSON Lines.
+        """
+
+        run_mock.return_value = [{'metric': 'elephant_factor', 'value': 2},
+                                 {'metric': 'elephant_factor', 'value': 3}]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'out.jsonl')
+
+            result = cli.main(['elephant_factor',
+                               '-s', 'git', '-s', 'all',
+                               '-w', '2018-01-01:2019-01-01',
+                               '-c', 'test.settings',
+                               '-o', output,
+                               '--exclude-merges',
+                               '--exclude-org', 'Lled',
+                               '--exclude-org', 'Marble',
+                               '--preference', 'nightly',
+                               '--preview'])
+
+            with open(output) as f:
+                lines = [json.loads(line) for line in f]
+
+        self.assertEqual(result, 0)
+        self.assertEqual(lines, run_mock.return_value)
+        create_es_connection_mock.assert_called_with(
+            config_file='test.settings')
+        set_search_preference_mock.assert_called_with(preference='nightly')
+        run_mock.assert_called_with(['elephant_factor'],
+                                    [DataSource.GIT, DataSource.ALL],
+                                    [('2018-01-01', '2019-01-01')],
+                                    jobs=4,
+                                    exclude_unknown=True,
+                                    exclude_bots=False,
+                                    exclude_merges=True,
+                                    include_orgs=None,
+                                    exclude_orgs=['Lled', 'Marble'],
+                                    affiliations=None,
+                                    mode='preview')
+
+    def test_write_jsonl_not_finite(self):
+        """Test NaN and infinite values are written as null.
+        """
+
+        records = [{'metric': 'pony_factor', 'value': float('nan')},
+                   {'metric': 'percentiles',
+                    'value': {'50.0': numpy.float64('inf'), '99.0': 3.5}}]
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+            cli.write_jsonl(records, '-')
+
+        self.assertEqual(
+            [json.loads(line) for line in out.getvalue().splitlines()],
+            [{'metric': 'pony_factor', 'value': None},
+             {'metric': 'percentiles',
+              'value': {'50.0': None, '99.0': 3.5}}])
+        self.assertNotIn('NaN', out.getvalue())
+
+    @mock.patch('broomstick.data.es.common.set_search_preference')
+    @mock.patch('broomstick.data.es.common.create_es_connection')
+    @mock.patch('broomstick.cli.run')
+    def test_main_profile(self, run_mock, create_es_connection_mock,
+                          set_search_preference_mock):
+        """Test stages are profiled and summarized on demand.
+        """
+
+        def run(*args, **kwargs):
+            with cli.runner.prof.stage('elephant_factor'):
+                return []
+
+        run_mock.side_effect = run
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            speedscope = os.path.join(tmp_dir, 'out.json')
+
+            with mock.patch('sys.stderr', new_callable=io.StringIO) as err:
+                result = cli.main(['elephant_factor',
+                                   '-s', 'git', '-w', '2018-01-01',
+                                   '-o', os.path.join(tmp_dir, 'out.jsonl'),
+                                   '--speedscope', speedscope])
+
+            self.assertTrue(os.path.exists(speedscope))
+
+        self.assertEqual(result, 0)
+        self.assertIn('elephant_factor', err.getvalue())
+        self.assertIn('peak_memory', err.getvalue())
+
+    def test_main_invalid_data_source(self):
+        """Test unknown data sources are reported as usage errors.
+        """
+
+        with mock.patch('sys.stderr', new_callable=io.StringIO):
+            with self.assertRaises(SystemExit):
+                cli.main(['elephant_factor', '-s', 'jira',
+                          '-w', '2018-01-01'])
+
+    @mock.patch('broomstick.cli.run')
+    def test_main_preview_unsupported(self, run_mock):
+        """Test previews of metrics not supporting them are usage errors.
+        """
+
+        with mock.patch('sys.stderr', new_callable=io.StringIO) as err:
+            with self.assertRaises(SystemExit):
+                cli.main(['elephant_factor', 'pony_factor', '-s', 'git',
+                          '-w', '2018-01-01', '--preview'])
+
+        self.assertIn('pony_factor', err.getvalue())
+        run_mock.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
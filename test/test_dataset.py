@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import TestCase
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import cli
+from broomstick import dataset as ds
+
+
+HAS_PYARROW = importlib.util.find_spec('pyarrow') is not None
+
+RECORDS = [
+    {'metric': 'elephant_factor', 'data_source': 'git',
+     'start_date': '2019-01-01', 'end_date': '2020-01-01', 'value': 2},
+    {'metric': 'contributions_count_by_org', 'data_source': 'git',
+     'start_date': '2019-01-01', 'end_date': '2020-01-01',
+     'organization': 'Lled', 'contributions': 150},
+    {'metric': 'concentration_factors', 'data_source': 'all',
+     'start_date': '2020-01-01', 'end_date': '2021-01-01',
+     'contributors': 3, 'gini': None}
+]
+
+
+class TestDataset(TestCase):
+
+    def test_records_to_frame(self):
+        """Test records are converted into rows of the same schema.
+        """
+
+        df = ds.records_to_frame(RECORDS, 'grimoirelab',
+                                 computed_at='2021-02-01')
+
+        self.assertEqual(list(df.columns), ds.RESULT_COLUMNS)
+        self.assertEqual(list(df['field']),
+                         ['value', 'contributions', 'contributors', 'gini'])
+        self.assertEqual(list(df['date']),
+                         ['2020-01-01', '2020-01-01', '2021-01-01',
+                          '2021-01-01'])
+        self.assertEqual(json.loads(df['labels'][1]),
+                         {'organization': 'Lled'})
+        self.assertEqual(df['labels'][0], '{}')
+        self.assertEqual(df['value'][1], 150)
+        self.assertTrue(df['value'].isna()[3])
+        self.assertTrue((df['project'] == 'grimoirelab').all())
+
+        # Windows without end are dated when computed
+        df = ds.records_to_frame([dict(RECORDS[0], end_date=None)],
+                                 'grimoirelab', computed_at='2021-02-01')
+
+        self.assertEqual(df['date'][0], '2021-02-01')
+
+    @unittest.skipUnless(HAS_PYARROW, "requires pyarrow")
+    def test_write_read_results(self):
+        """Test results are appended and read back filtered.
+        """
+
+        with tempfile.TemporaryDirectory() as root:
+            self.assertEqual(ds.write_results(RECORDS, root, 'grimoirelab',
+                                              computed_at='2021-02-01'), 4)
+            ds.write_results(RECORDS[:1], root, 'grimoirelab',
+                             computed_at='2021-03-01')
+            ds.write_results(RECORDS[:1], root, 'perceval',
+                             computed_at='2021-03-01')
+
+            self.assertTrue(os.path.isdir(os.path.join(
+                root, 'project=grimoirelab', 'data_source=git',
+                'date=2020-01-01')))
+
+            df = ds.read_results(root)
+
+            self.assertEqual(list(df.columns), ds.RESULT_COLUMNS)
+            self.assertEqual(len(df), 6)
+
+            df = ds.read_results(root, project='grimoirelab',
+                                 metric='elephant_factor')
+
+            self.assertEqual(len(df), 2)
+            self.assertEqual(set(df['project']), {'grimoirelab'})
+
+            df = ds.read_results(root, project='grimoirelab',
+                                 metric='elephant_factor', latest=True)
+
+            self.assertEqual(len(df), 1)
+            self.assertEqual(str(df['computed_at'][0].date()), '2021-03-01')
+
+            df = ds.read_results(root,
+                                 filters=[('date', '>=', '2021-01-01')],
+                                 columns=['metric', 'field', 'value'])
+
+            self.assertEqual(list(df.columns), ['metric', 'field', 'value'])
+            self.assertEqual(list(df['field']), ['contributors', 'gini'])
+
+            df = ds.read_results(root, data_source=['git', 'all'],
+                                 project='perceval')
+
+            self.assertEqual(len(df), 1)
+
+    def test_read_results_invalid_filters(self):
+        """Test filters are checked before reading.
+        """
+
+        with self.assertRaises(ValueError):
+            ds.read_results('results', filters=[('size', '>', 1)])
+
+        with self.assertRaises(ValueError):
+            ds.read_results('results', filters=[('date', 'like', '2019')])
+
+    @unittest.skipUnless(HAS_PYARROW, "requires pyarrow")
+    def test_write_output(self):
+        """Test records are written as a dataset from the command line.
+        """
+
+        with tempfile.TemporaryDirectory() as root:
+            cli.write_output(RECORDS, root, 'dataset', project='grimoirelab')
+
+            self.assertEqual(len(ds.read_results(root)), 4)
+
+        with self.assertRaises(ValueError):
+            cli.write_output(RECORDS, '-', 'dataset', project='grimoirelab')
+
+        with self.assertRaises(ValueError):
+            cli.write_output(RECORDS, 'results', 'dataset')
+
+
+if __name__ == '__main__':
+    unittest.main()
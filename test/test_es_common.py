@@ -20,6 +20,7 @@
 #
 
 import certifi
+import datetime
 import os
 import pandas
 import sys
@@ -37,6 +38,7 @@ sys.path.insert(0, '..')
 import broomstick.data.es.common as esc
 
 from broomstick.core import DataSource
+from broomstick.data.es.replay import ReplayConnection
 
 
 class TestESCommon(TestCase):
@@ -44,7 +46,7 @@ class TestESCommon(TestCase):
     def setUp(self):
         self.__data_dir = os.path.dirname(os.path.realpath(__file__))
 
-    @mock.patch('broomstick.data.es.common.Elasticsearch',
+    @mock.patch('broomstick.data.es.common.es.Elasticsearch',
                 return_value='test_es_conn')
     def test_create_es_connection(self, es_mock):
         """Test create an es connection from a given .settings file.
@@ -62,10 +64,97 @@ class TestESCommon(TestCase):
                                    connection_class=RequestsHttpConnection,
                                    ca_cert=certifi.where(),
                                    scroll='300m',
-                                   timeout=1000)
+                                   timeout=1000,
+                                   max_retries=0,
+                                   headers=esc.COMPRESSION_HEADERS)
 
         self.assertEqual(es_conn, 'test_es_conn')
 
+    @mock.patch('broomstick.data.es.common.__es_conn', None)
+    def test_create_es_connection_compressed(self):
+        """Test compressed responses are asked for in session headers.
+        """
+
+        config_file = os.path.join(self.__data_dir, 'data/settings.test')
+        es_conn = esc.create_es_connection(config_file=config_file)
+
+        connection = es_conn.transport.get_connection()
+
+        self.assertIsInstance(connection, RequestsHttpConnection)
+        self.assertEqual(connection.session.headers['accept-encoding'],
+                         'gzip,deflate')
+
+    @mock.patch.dict('broomstick.data.es.common.DS_INDEX')
+    @mock.patch('broomstick.data.es.common.__es_conn', None)
+    @mock.patch('broomstick.data.es.common.es.Elasticsearch',
+                return_value='test_es_conn')
+    def test_create_es_connection_indexes(self, es_mock):
+        """Test indexes and field resolution can be configured.
+        """
+
+        config_file = os.path.join(self.__data_dir,
+                                   'data/settings_indexes.test')
+
+        try:
+            esc.create_es_connection(config_file=config_file)
+
+            self.assertEqual(esc.DS_INDEX[DataSource.GIT], 'git_aliased')
+            self.assertEqual(esc.DS_INDEX[DataSource.ALL], 'all_enriched*')
+            self.assertNotIn('headers', es_mock.call_args[1])
+
+            with mock.patch(
+                    'broomstick.data.es.common.fc.aggregatable_field',
+                    return_value='author_org_name.keyword') as field_mock:
+                self.assertEqual(
+                    esc.agg_field(DataSource.GIT, esc.ORG_FIELD),
+                    'author_org_name.keyword')
+
+            field_mock.assert_called_with('test_es_conn', 'git_aliased',
+                                          esc.ORG_FIELD)
+        finally:
+            esc.set_field_resolution(False)
+
+        # Fields are used as they are by default
+        self.assertEqual(esc.agg_field(DataSource.GIT, esc.ORG_FIELD),
+                         esc.ORG_FIELD)
+
+    @mock.patch('broomstick.data.es.common.__es_conn', None)
+    @mock.patch('broomstick.data.es.common.es.Elasticsearch',
+                return_value='test_es_conn')
+    def test_create_es_connection_replay(self, es_mock):
+        """Test connections can replay recorded responses.
+        """
+
+        config_file = os.path.join(self.__data_dir,
+                                   'data/settings_replay.test')
+        es_conn = esc.create_es_connection(config_file=config_file)
+
+        es_mock.assert_called_with(
+            connection_class=ReplayConnection,
+            recording='recordings/report.jsonl.gz',
+            latency='0.5',
+            max_retries=0)
+
+        self.assertEqual(es_conn, 'test_es_conn')
+
+    @mock.patch('broomstick.data.es.common.__es_conn', 'test_es_conn')
+    @mock.patch('broomstick.data.es.common.fc.aggregatable_field',
+                side_effect=lambda es, index, field: field + '.keyword')
+    def test_check_fields(self, aggregatable_field_mock):
+        """Test every aggregated field is checked.
+        """
+
+        result = esc.check_fields(DataSource.GIT)
+
+        self.assertEqual(result, {
+            'hash': 'hash.keyword',
+            'author_uuid': 'author_uuid.keyword',
+            'author_org_name': 'author_org_name.keyword',
+            'grimoire_creation_date': 'grimoire_creation_date.keyword'
+        })
+        aggregatable_field_mock.assert_called_with('test_es_conn', 'git',
+                                                   esc.DATE_FIELD)
+
     def test_add_date_filter_min_date(self):
         """Test add filter calls with `start_date`.
         """
@@ -78,7 +167,7 @@ class TestESCommon(TestCase):
 
         s.filter.assert_called_with(
             'range',
-            grimoire_creation_date={'gt': min_date})
+            grimoire_creation_date={'gt': '2018-01-01T00:00:00Z'})
         self.assertEqual(result, 'test')
 
     def test_add_date_filter_max_date(self):
@@ -95,10 +184,147 @@ class TestESCommon(TestCase):
 
         s.filter.assert_called_with(
             'range',
-            grimoire_creation_date={"gt": start_date, "lte": end_date})
+            grimoire_creation_date={"gt": '2018-01-01T00:00:00Z',
+                                    "lte": '2020-01-01T00:00:00Z'})
+        self.assertEqual(result, 'test')
+
+    def test_add_date_filter_rounding(self):
+        """Test add filter calls with dates rounded to the day.
+        """
+
+        s = Search()
+        s.filter = MagicMock(return_value='test')
+
+        start_date = '2018-01-01T12:10:00+02:00'
+        end_date = '2020-01-01T23:59:59'
+        result = esc.add_date_filter(s, start_date=start_date,
+                                     end_date=end_date, round_to='day')
+
+        s.filter.assert_called_with(
+            'range',
+            grimoire_creation_date={"gt": '2018-01-01T00:00:00Z',
+                                    "lte": '2020-01-01T00:00:00Z'})
         self.assertEqual(result, 'test')
 
-    @mock.patch('broomstick.data.es.common.Search',
+    def test_normalize_date(self):
+        """Test dates are converted to canonical UTC strings.
+        """
+
+        self.assertEqual(esc.normalize_date('2018-01-01'),
+                         '2018-01-01T00:00:00Z')
+        self.assertEqual(esc.normalize_date('2018-01-01T10:11:12.345+02:00'),
+                         '2018-01-01T08:11:12Z')
+        self.assertEqual(esc.normalize_date(datetime.datetime(2019, 5, 4, 3)),
+                         '2019-05-04T03:00:00Z')
+        self.assertEqual(esc.normalize_date('2018-01-01T10:11:12',
+                                            round_to='hour'),
+                         '2018-01-01T10:00:00Z')
+        self.assertEqual(esc.normalize_date('2018-01-01T10:11:12',
+                                            round_to='day'),
+                         '2018-01-01T00:00:00Z')
+
+        # Epoch milliseconds, as accepted by ES
+        self.assertEqual(esc.normalize_date(1514764800000),
+                         '2018-01-01T00:00:00Z')
+        self.assertEqual(esc.normalize_date('1514768400000'),
+                         '2018-01-01T01:00:00Z')
+
+        with self.assertRaises(ValueError):
+            esc.normalize_date('2018-01-01', round_to='week')
+
+    def test_normalize_date_math(self):
+        """Test `now`-relative dates are resolved and rounded.
+        """
+
+        now = pandas.Timestamp.now(tz='UTC')
+        today = now.normalize()
+
+        self.assertEqual(esc.normalize_date('now/d'),
+                         today.strftime(esc.DATE_FORMAT))
+        self.assertEqual(
+            esc.normalize_date('now-90d/d'),
+            (today - pandas.Timedelta(days=90)).strftime(esc.DATE_FORMAT))
+        self.assertEqual(
+            esc.normalize_date('now-1M/M'),
+            (today - pandas.DateOffset(months=1)).replace(day=1)
+            .strftime(esc.DATE_FORMAT))
+        self.assertEqual(esc.normalize_date('now+1d', round_to='day'),
+                         (today + pandas.Timedelta(days=1))
+                         .strftime(esc.DATE_FORMAT))
+
+        # `now` is rounded by default, so repeated calls match
+        self.assertEqual(esc.normalize_date('now'),
+                         now.floor('H').strftime(esc.DATE_FORMAT))
+        self.assertEqual(esc.normalize_date('now-1d'),
+                         (now - pandas.Timedelta(days=1)).floor('H')
+                         .strftime(esc.DATE_FORMAT))
+
+    def test_normalize_date_math_anchor(self):
+        """Test dates anchored with `||` are resolved.
+        """
+
+        self.assertEqual(esc.normalize_date('2020-01-01||+1M'),
+                         '2020-02-01T00:00:00Z')
+        self.assertEqual(esc.normalize_date('2020-01-15T10:00:00||-1d/d'),
+                         '2020-01-14T00:00:00Z')
+        self.assertEqual(esc.normalize_date('2020-01-31||/M'),
+                         '2020-01-01T00:00:00Z')
+        self.assertEqual(esc.normalize_date('1577836800000||+1d'),
+                         '2020-01-02T00:00:00Z')
+
+    def test_set_date_rounding(self):
+        """Test the date rounding setting is validated.
+        """
+
+        esc.set_date_rounding('hour')
+        esc.set_date_rounding(None)
+
+        with self.assertRaises(ValueError):
+            esc.set_date_rounding('minute')
+
+    def test_add_search_hints(self):
+        """Test shard preference and routing are set as search params.
+        """
+
+        s = esc.add_search_hints(Search(), preference='report-1')
+
+        self.assertEqual(s._params, {'preference': 'report-1'})
+
+        s = esc.add_search_hints(Search(), routing=['a', 'b'])
+
+        self.assertEqual(s._params, {'routing': 'a,b'})
+
+    @mock.patch('broomstick.data.es.common.__es_conn')
+    def test_search_preference(self, es_conn_mock):
+        """Test every search in a context gets the same preference.
+        """
+
+        with esc.search_preference('report-1', routing='git'):
+            s = esc.create_search(DataSource.GIT, '2018-01-01')
+
+            self.assertEqual(s._params,
+                             {'preference': 'report-1', 'routing': 'git'})
+
+        s = esc.create_search(DataSource.GIT, '2018-01-01')
+
+        self.assertEqual(s._params, {})
+
+        esc.set_search_preference('session-2')
+        s = esc.create_search(DataSource.GIT, '2018-01-01')
+        esc.set_search_preference()
+
+        self.assertEqual(s._params, {'preference': 'session-2'})
+
+    def test_aggregations_only(self):
+        """Test searches returning only aggregations use the request cache.
+        """
+
+        s = esc.aggregations_only(Search())
+
+        self.assertEqual(s.to_dict(), {'from': 0, 'size': 0})
+        self.assertEqual(s._params, {'request_cache': True})
+
+    @mock.patch('broomstick.data.es.common.dsl.Search',
                 return_value='test_search')
     @mock.patch('broomstick.data.es.common.add_date_filter',
                 return_value='search_with_filters')
@@ -120,10 +346,11 @@ class TestESCommon(TestCase):
             using=es_conn_mock,
             index=esc.DS_INDEX[DataSource.GIT])
         add_date_filter_mock.assert_called_with('test_search',
-                                                start_date, end_date)
+                                                start_date, end_date,
+                                                round_to=None)
         self.assertEqual(s, 'search_with_filters')
 
-    @mock.patch('broomstick.data.es.common.Search',
+    @mock.patch('broomstick.data.es.common.dsl.Search',
                 return_value='test_search')
     @mock.patch('broomstick.data.es.common.add_date_filter',
                 return_value='search_with_filters')
@@ -145,7 +372,8 @@ class TestESCommon(TestCase):
         add_date_filter_mock.assert_called_with(
             'test_search',
             start_date,
-            None)
+            None,
+            round_to=None)
         self.assertEqual(s, 'search_with_filters')
 
     def test_exclude_org(self):
@@ -176,6 +404,131 @@ class TestESCommon(TestCase):
             author_org_name=esc.UNKNOWN_ORG_NAME)
         self.assertEqual(result, 'test')
 
+    def test_add_org_filters(self):
+        """Test sets of organizations become a single terms filter each.
+        """
+
+        s = esc.add_org_filters(Search(),
+                                include_orgs=['Marble', 'Lled', 'Marble'],
+                                exclude_orgs=['Unknown'])
+
+        # Exclusions stay in filter context too
+        self.assertEqual(s.to_dict()['query'], {
+            'bool': {
+                'filter': [
+                    {'terms': {'author_org_name': ['Lled', 'Marble']}},
+                    {'bool': {'must_not': [
+                        {'terms': {'author_org_name': ['Unknown']}}]}}
+                ]
+            }
+        })
+
+        # No filters by default
+        self.assertEqual(esc.add_org_filters(Search()).to_dict(), {})
+
+    def test_orgs_terms_lookup(self):
+        """Test long lists of organizations can be looked up in ES.
+        """
+
+        lookup = esc.terms_lookup('lists', 'staff', 'orgs')
+        s = esc.add_org_filters(Search(), exclude_orgs=lookup)
+
+        self.assertEqual(s.to_dict()['query']['bool']['filter'], [
+            {'bool': {'must_not': [
+                {'terms': {'author_org_name': {'index': 'lists',
+                                               'type': '_doc',
+                                               'id': 'staff',
+                                               'path': 'orgs'}}}]}}
+        ])
+
+        with mock.patch('broomstick.data.es.common.MAX_TERMS', 2):
+            with self.assertRaises(ValueError):
+                esc.orgs_query(['Lled', 'Marble', 'Nanosoft'])
+
+    @mock.patch('broomstick.data.es.common.__es_conn')
+    def test_create_search_with_orgs(self, es_conn_mock):
+        """Test create search function with organization filters.
+        """
+
+        s = esc.create_search(DataSource.GIT, '2018-01-01',
+                              include_orgs=['Lled'],
+                              exclude_orgs=['Marble'])
+
+        query = s.to_dict()['query']['bool']
+
+        self.assertIn({'terms': {'author_org_name': ['Lled']}},
+                      query['filter'])
+        self.assertIn({'bool': {'must_not': [
+            {'terms': {'author_org_name': ['Marble']}}]}}, query['filter'])
+
+    def test_exclude_bot_authors(self):
+        """Test add bot authors exclusion filter.
+        """
+
+        s = Search()
+        s.exclude = MagicMock(return_value='test')
+
+        result = esc.exclude_bot_authors(s)
+
+        s.exclude.assert_called_with('term', author_bot=True)
+        self.assertEqual(result, 'test')
+
+    def test_exclude_merge_commits(self):
+        """Test add merge commits exclusion filter.
+        """
+
+        s = Search()
+        s.exclude = MagicMock(return_value='test')
+
+        result = esc.exclude_merge_commits(s)
+
+        s.exclude.assert_called_with('term', merge=True)
+        self.assertEqual(result, 'test')
+
+    def test_exclusion_filters_in_filter_context(self):
+        """Test bot and merge exclusions end up in filter context.
+        """
+
+        s = esc.exclude_merge_commits(esc.exclude_bot_authors(Search()))
+
+        query = s.to_dict()['query']
+        self.assertNotIn('must', query['bool'])
+        self.assertEqual(
+            query['bool']['filter'],
+            [{'bool': {'must_not': [{'term': {'author_bot': True}}]}},
+             {'bool': {'must_not': [{'term': {'merge': True}}]}}])
+
+    @mock.patch('broomstick.data.es.common.dsl.Search',
+                return_value='test_search')
+    @mock.patch('broomstick.data.es.common.add_date_filter',
+                return_value='search_with_filters')
+    @mock.patch('broomstick.data.es.common.exclude_bot_authors',
+                return_value='search_without_bots')
+    @mock.patch('broomstick.data.es.common.exclude_merge_commits',
+                return_value='search_without_merges')
+    @mock.patch('broomstick.data.es.common.__es_conn',
+                return_value='bar')
+    def test_create_search_with_exclusions(self,
+                                           es_conn_mock,
+                                           exclude_merges_mock,
+                                           exclude_bots_mock,
+                                           add_date_filter_mock,
+                                           search_mock):
+        """Test create search function excluding bots and merges.
+        """
+
+        start_date = '2018-01-01'
+
+        s = esc.create_search(DataSource.GIT, start_date,
+                              exclude_bots=True, exclude_merges=True)
+
+        add_date_filter_mock.assert_called_with('test_search',
+                                                start_date, None,
+                                                round_to=None)
+        exclude_bots_mock.assert_called_with('search_with_filters')
+        exclude_merges_mock.assert_called_with('search_without_bots')
+        self.assertEqual(s, 'search_without_merges')
+
     @mock.patch('broomstick.data.es.common.create_search')
     @mock.patch('broomstick.data.es.common.exclude_org')
     def test_contributions_count_total(self,
@@ -211,7 +564,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_called_with(
             s=s,
             org_name=esc.UNKNOWN_ORG_NAME
@@ -244,7 +601,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_called_with(
             s=s,
             org_name=esc.UNKNOWN_ORG_NAME
@@ -282,7 +643,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.ALL,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_not_called()
         s.aggs.metric.assert_called_with(
             'total_contribs',
@@ -316,7 +681,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_not_called()
         s.aggs.metric.assert_called_with(
             'total_contribs',
@@ -361,7 +730,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         filter_org_mock.assert_called_with(
             s=s,
             org_name=esc.UNKNOWN_ORG_NAME
@@ -394,7 +767,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.ALL,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         filter_org_mock.assert_called_with(
             s=s,
             org_name=esc.UNKNOWN_ORG_NAME
@@ -475,7 +852,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_called_with(
             s=s,
             org_name=esc.UNKNOWN_ORG_NAME)
@@ -504,7 +885,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.ALL,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_called_with(
             s=s,
             org_name=esc.UNKNOWN_ORG_NAME
@@ -539,7 +924,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_not_called()
 
         s.aggs.bucket.assert_called_with(
@@ -570,7 +959,11 @@ class TestESCommon(TestCase):
         create_search_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         exclude_org_mock.assert_not_called()
 
         s.aggs.bucket.assert_called_with(
@@ -587,10 +980,803 @@ class TestESCommon(TestCase):
 
         assert_frame_equal(result, expected_df)
 
+    @mock.patch('broomstick.data.es.common.create_search')
+    @mock.patch('broomstick.data.es.common.exclude_org')
+    def test_contributions_count_by_org_page(self,
+                                             exclude_org_mock,
+                                             create_search_mock):
+        """Test get a page of organizations sorted by contributions.
+        """
+        response = {
+            'aggregations': {
+                'organizations': {
+                    'buckets': [
+                        {
+                            'key': 'Marble',
+                            'doc_count': 130,
+                            'total_contribs': {
+                                'value': 125
+                            }
+                        }
+                    ]
+                }
+            }
+        }
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+        exclude_org_mock.return_value = s
+
+        result = esc.contributions_count_by_org_page(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            offset=1,
+            size=1)
+
+        s.aggs.bucket.assert_called_with(
+            'organizations',
+            'terms',
+            field='author_org_name',
+            order={'total_contribs': 'desc'},
+            size=2)
+        s.aggs.bucket().metric().pipeline.assert_called_with(
+            'page',
+            'bucket_sort',
+            size=1,
+            **{'from': 1})
+
+        expected_df = pandas.DataFrame(
+            {'organization': ['Marble'], 'contributions': [125]},
+            columns=['organization', 'contributions'])
+        assert_frame_equal(result, expected_df)
+
+        # Pages out of range are empty
+        r.to_dict = MagicMock(
+            return_value={'aggregations': {'organizations': {'buckets': []}}})
+
+        result = esc.contributions_count_by_org_page(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            offset=10)
+
+        self.assertTrue(result.empty)
+        self.assertEqual(list(result.columns),
+                         ['organization', 'contributions'])
+
+    @mock.patch('broomstick.data.es.common.contributions_count_by_org_page')
+    def test_contributions_count_by_org_pages(self, page_mock):
+        """Test pages are requested lazily with growing sizes.
+        """
+
+        def page(offset, size, **kwargs):
+            contribs = list(range(25, 0, -1))[offset:offset + size]
+            return pandas.DataFrame({
+                'organization': ['org' + str(c) for c in contribs],
+                'contributions': contribs
+            })
+
+        page_mock.side_effect = page
+
+        pages = esc.contributions_count_by_org_pages(
+            DataSource.GIT, start_date='2018-01-01', page_size=5)
+
+        first = next(pages)
+        self.assertEqual(list(first['contributions']), [25, 24, 23, 22, 21])
+        self.assertEqual(page_mock.call_count, 1)
+
+        rest = list(pages)
+        self.assertEqual([len(p) for p in rest], [10, 10])
+        self.assertEqual(
+            [(c[1]['offset'], c[1]['size']) for c in page_mock.call_args_list],
+            [(0, 5), (5, 10), (15, 20)])
+
+        # Organizations are never read beyond `MAX_ORGS`
+        with mock.patch('broomstick.data.es.common.MAX_ORGS', 12):
+            page_mock.reset_mock()
+            pages = list(esc.contributions_count_by_org_pages(
+                DataSource.GIT, start_date='2018-01-01', page_size=5))
+
+        self.assertEqual([len(p) for p in pages], [5, 7])
+        self.assertEqual(
+            [(c[1]['offset'], c[1]['size']) for c in page_mock.call_args_list],
+            [(0, 5), (5, 7)])
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    @mock.patch('broomstick.data.es.common.exclude_org')
+    def test_contributions_percentiles_by_org(self,
+                                              exclude_org_mock,
+                                              create_search_mock):
+        """Test percentiles of contributions per organization.
+        """
+        response = {
+            'aggregations': {
+                'contribs_percentiles': {
+                    'values': {
+                        '50.0': 30.0,
+                        '99.0': 175.0
+                    }
+                }
+            }
+        }
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+        exclude_org_mock.return_value = s
+
+        result = esc.contributions_percentiles_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            percents=(50, 99))
+
+        s.aggs.pipeline.assert_called_with(
+            'contribs_percentiles',
+            'percentiles_bucket',
+            buckets_path='organizations>total_contribs',
+            percents=[50, 99])
+        s.params.assert_any_call(filter_path=esc.ENVELOPE_PATHS + [
+            'aggregations.contribs_percentiles.values'])
+
+        expected_df = pandas.DataFrame(
+            {'percent': [50.0, 99.0], 'contributions': [30.0, 175.0]},
+            columns=['percent', 'contributions'])
+        assert_frame_equal(result, expected_df)
+
+        # Without organizations, ES trims the whole response
+        r.to_dict = MagicMock(return_value={})
+
+        result = esc.contributions_percentiles_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            percents=(50, 99))
+
+        self.assertTrue(result['contributions'].isnull().all())
+
+    @mock.patch('broomstick.data.es.common.__es_conn')
+    def test_org_summary_search(self, es_conn_mock):
+        """Test a single search gets totals and contributions by org.
+        """
+
+        s = esc.org_summary_search(DataSource.GIT, '2018-01-01',
+                                   exclude_merges=True,
+                                   include_orgs=None,
+                                   exclude_orgs=None)
+
+        aggs = s.to_dict()['aggs']
+
+        self.assertEqual(s.to_dict()['size'], 0)
+        self.assertEqual(aggs['total_contribs'],
+                         {'cardinality': {'field': 'hash',
+                                          'precision_threshold': 40000}})
+        self.assertEqual(aggs['unknown']['filter'],
+                         {'term': {'author_org_name': 'Unknown'}})
+        self.assertEqual(aggs['organizations']['terms']['field'],
+                         'author_org_name')
+
+    def test_org_summary(self):
+        """Test organization metrics are extracted from a summary.
+        """
+
+        response = {
+            'aggregations': {
+                'total_contribs': {'value': 300},
+                'unknown': {'unknown_contribs': {'value': 100}},
+                'organizations': {
+                    'buckets': [
+                        {'key': 'Marble', 'doc_count': 190,
+                         'total_contribs': {'value': 180}},
+                        {'key': 'Unknown', 'doc_count': 100,
+                         'total_contribs': {'value': 100}},
+                        {'key': 'Lled', 'doc_count': 20,
+                         'total_contribs': {'value': 20}}
+                    ]
+                }
+            }
+        }
+
+        result = esc.org_summary(response)
+
+        self.assertEqual(result['total'], 200)
+        self.assertEqual(result['unknown'], 100)
+        assert_frame_equal(result['by_org'], pandas.DataFrame(
+            {'organization': ['Marble', 'Lled'], 'contributions': [180, 20]}))
+
+        result = esc.org_summary(response, exclude_unknown=False)
+
+        self.assertEqual(result['total'], 300)
+        self.assertEqual(len(result['by_org']), 3)
+
+    @mock.patch('broomstick.data.es.common.__es_conn', 'test_es_conn')
+    @mock.patch('broomstick.data.es.common.rs.execute')
+    def test_multi_search(self, execute_mock):
+        """Test searches are sent in a single request.
+        """
+
+        execute_mock.return_value = [{'hits': {}}, {'hits': {}}]
+
+        result = esc.multi_search([Search(index='git'),
+                                   Search(index='all_enriched')])
+
+        ms = execute_mock.call_args[0][0]
+
+        self.assertEqual(len(ms._searches), 2)
+        self.assertEqual(ms._using, 'test_es_conn')
+        self.assertEqual(result, execute_mock.return_value)
+
+    @mock.patch('broomstick.data.es.common.__es_conn', 'test_es_conn')
+    @mock.patch('broomstick.data.es.common.rs.execute')
+    def test_multi_search_trimmed(self, execute_mock):
+        """Test multi searches are trimmed if all their searches are.
+        """
+
+        first = esc.trim_response(Search(index='git'), 'aggregations.a')
+        second = esc.trim_response(Search(index='git'), 'aggregations.b')
+
+        esc.multi_search([first, second])
+
+        ms = execute_mock.call_args[0][0]
+        paths = ms._params['filter_path']
+
+        self.assertIn('responses.error', paths)
+        self.assertIn('responses._shards.failed', paths)
+        self.assertIn('responses.aggregations.a', paths)
+        self.assertIn('responses.aggregations.b', paths)
+        self.assertEqual(len(paths), len(set(paths)))
+
+        # ES rejects filter_path in the header of each search
+        for header in ms.to_dict()[::2]:
+            self.assertNotIn('filter_path', header)
+
+        self.assertIn('filter_path', first._params)
+
+        esc.multi_search([first, Search(index='git')])
+
+        ms = execute_mock.call_args[0][0]
+
+        self.assertNotIn('filter_path', ms._params)
+
+    def test_trim_response(self):
+        """Test responses are trimmed to the given paths and shard info.
+        """
+
+        s = esc.trim_response(Search(index='git'),
+                              *esc.org_bucket_paths('aggregations.orgs'))
+
+        self.assertEqual(s._params['filter_path'], esc.ENVELOPE_PATHS + [
+            'aggregations.orgs.buckets.key',
+            'aggregations.orgs.buckets.total_contribs.value'])
+
+    def test_response_value(self):
+        """Test values are read from trimmed responses.
+        """
+
+        response = {'aggregations': {'total_contribs': {'value': 10}}}
+
+        self.assertEqual(
+            esc.response_value(response, 'aggregations.total_contribs.value'),
+            10)
+        self.assertEqual(
+            esc.response_value(response, 'aggregations.unknown.value', 0), 0)
+        self.assertEqual(
+            esc.response_value(response,
+                               'aggregations.total_contribs.value.x', 0), 0)
+        self.assertEqual(esc.response_value({}, 'aggregations.orgs.buckets',
+                                            default=[]), [])
+
+    @mock.patch('broomstick.data.es.common.rs.execute')
+    def test_composite_buckets_trimmed(self, execute_mock):
+        """Test composite pages are trimmed and read when empty.
+        """
+
+        # Trimmed responses don't include empty aggregations
+        execute_mock.return_value = {'_shards': {'total': 1, 'failed': 0}}
+
+        buckets = list(esc.composite_buckets(
+            Search(index='git'),
+            [{'author': {'terms': {'field': esc.AUTHOR_FIELD}}}],
+            DataSource.GIT))
+
+        self.assertEqual(buckets, [])
+
+        paths = execute_mock.call_args[0][0]._params['filter_path']
+
+        self.assertIn('aggregations.composite_contribs.after_key', paths)
+        self.assertIn('aggregations.composite_contribs.buckets.key', paths)
+
+    def test_add_preview_sampler(self):
+        """Test documents are sampled at random with a fixed seed.
+        """
+
+        s, sample = esc.add_preview_sampler(Search(index='git'),
+                                            shard_size=100)
+        sample.metric('total_contribs', 'value_count', field='hash')
+
+        query = s.to_dict()
+
+        self.assertEqual(query['query']['function_score'], {
+            'functions': [{'random_score': {'seed': esc.PREVIEW_SEED,
+                                            'field': '_seq_no'}}],
+            'boost_mode': 'replace'})
+        self.assertEqual(query['aggs']['sample']['sampler'],
+                         {'shard_size': 100})
+        self.assertIs(query['track_total_hits'], True)
+        self.assertIn('total_contribs', query['aggs']['sample']['aggs'])
+
+    def test_scale_sample(self):
+        """Test sampled counts are scaled with their errors.
+        """
+
+        value, error = esc.scale_sample([10, 50], 100, 1000)
+
+        self.assertEqual(list(value), [100, 500])
+        self.assertAlmostEqual(error[0], 55.81, places=2)
+        self.assertAlmostEqual(error[1], 93.02, places=2)
+
+        # Nothing to estimate when every document was sampled
+        value, error = esc.scale_sample(10, 1000, 1000)
+
+        self.assertEqual(value, 10)
+        self.assertEqual(error, 0)
+
+        value, error = esc.scale_sample(0, 0, 0)
+
+        self.assertEqual(value, 0)
+        self.assertEqual(error, 0)
+
+    @mock.patch('broomstick.data.es.common.rs.execute')
+    @mock.patch('broomstick.data.es.common.create_search')
+    def test_contributions_count_total_preview(self,
+                                               create_search_mock,
+                                               execute_mock):
+        """Test total contributions are estimated from a sample.
+        """
+
+        create_search_mock.return_value = Search(index='git')
+        execute_mock.return_value = {
+            'hits': {'total': {'value': 1000, 'relation': 'eq'}},
+            'aggregations': {
+                'sample': {'doc_count': 100,
+                           'total_contribs': {'value': 100}}}
+        }
+
+        result = esc.contributions_count_total_preview(
+            DataSource.GIT, start_date='2018-01-01')
+
+        self.assertEqual(result, {'value': 1000, 'error': 0.0,
+                                  'sampled': 100, 'population': 1000})
+
+        s = execute_mock.call_args[0][0].to_dict()
+
+        self.assertEqual(s['size'], 0)
+        self.assertEqual(
+            s['aggs']['sample']['aggs']['total_contribs']['cardinality'],
+            {'field': 'hash', 'precision_threshold': 40000})
+
+    @mock.patch('broomstick.data.es.common.rs.execute')
+    @mock.patch('broomstick.data.es.common.create_search')
+    def test_contributions_count_by_org_preview(self,
+                                                create_search_mock,
+                                                execute_mock):
+        """Test contributions by organization are estimated from a sample.
+        """
+
+        create_search_mock.return_value = Search(index='git')
+        execute_mock.return_value = {
+            'hits': {'total': 1000},
+            'aggregations': {
+                'sample': {
+                    'doc_count': 100,
+                    'organizations': {
+                        'buckets': [
+                            {'key': 'Lled', 'doc_count': 10,
+                             'total_contribs': {'value': 10}},
+                            {'key': 'Marble', 'doc_count': 50,
+                             'total_contribs': {'value': 50}}
+                        ]
+                    }
+                }
+            }
+        }
+
+        result = esc.contributions_count_by_org_preview(
+            DataSource.GIT, start_date='2018-01-01', exclude_unknown=False)
+
+        self.assertEqual(list(result['organization']), ['Marble', 'Lled'])
+        self.assertEqual(list(result['contributions']), [500, 100])
+        self.assertAlmostEqual(result['error'][0], 93.02, places=2)
+        self.assertEqual(result.attrs, {'sampled': 100, 'population': 1000})
+
+        s = execute_mock.call_args[0][0].to_dict()
+
+        self.assertEqual(
+            s['aggs']['sample']['aggs']['organizations']['terms']['field'],
+            'author_org_name')
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    @mock.patch('broomstick.data.es.common.exclude_org')
+    def test_contributions_count_by_author(self,
+                                           exclude_org_mock,
+                                           create_search_mock):
+        """Test count contributions by author method.
+        """
+        responses = [
+            {
+                'aggregations': {
+                    'composite_contribs': {
+                        'after_key': {'author': 'c3d4'},
+                        'buckets': [
+                            {
+                                'key': {'author': 'a1b2'},
+                                'doc_count': 3,
+                                'total_contribs': {'value': 3}
+                            },
+                            {
+                                'key': {'author': 'c3d4'},
+                                'doc_count': 20,
+                                'total_contribs': {'value': 18}
+                            }
+                        ]
+                    }
+                }
+            },
+            {
+                'aggregations': {
+                    'composite_contribs': {
+                        'after_key': {'author': 'e5f6'},
+                        'buckets': [
+                            {
+                                'key': {'author': 'e5f6'},
+                                'doc_count': 7,
+                                'total_contribs': {'value': 7}
+                            }
+                        ]
+                    }
+                }
+            },
+            {
+                'aggregations': {
+                    'composite_contribs': {
+                        'buckets': []
+                    }
+                }
+            }
+        ]
+
+        s, r = self.__create_mocked_search(None, create_search_mock)
+        r.to_dict = MagicMock(side_effect=responses)
+        exclude_org_mock.return_value = s
+
+        result = esc.contributions_count_by_author(
+            DataSource.GIT,
+            start_date='2018-01-01')
+
+        exclude_org_mock.assert_not_called()
+        self.assertEqual(s.execute.call_count, 3)
+        s.aggs.bucket.assert_called_with(
+            'composite_contribs',
+            'composite',
+            sources=[{'author': {'terms': {'field': 'author_uuid'}}}],
+            size=esc.COMPOSITE_PAGE_SIZE,
+            after={'author': 'e5f6'})
+        s.aggs.bucket().metric.assert_called_with(
+            'total_contribs',
+            'cardinality',
+            field='hash',
+            precision_threshold=40000)
+
+        self.assertEqual(list(result['author']), ['c3d4', 'e5f6', 'a1b2'])
+        self.assertEqual(list(result['contributions']), [18, 7, 3])
+        self.assertEqual(result['author'].dtype.name, 'category')
+        self.assertEqual(result['contributions'].dtype.name, 'uint8')
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    @mock.patch('broomstick.data.es.common.exclude_org')
+    def test_contributions_count_by_author_org(self,
+                                               exclude_org_mock,
+                                               create_search_mock):
+        """Test count contributions by author and organization method.
+        """
+        response = {
+            'aggregations': {
+                'composite_contribs': {
+                    'buckets': [
+                        {
+                            'key': {'author': 'a1b2', 'organization': 'Lled'},
+                            'doc_count': 3,
+                            'total_contribs': {'value': 3}
+                        },
+                        {
+                            'key': {'author': 'a1b2',
+                                    'organization': 'Marble'},
+                            'doc_count': 300,
+                            'total_contribs': {'value': 300}
+                        }
+                    ]
+                }
+            }
+        }
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+        exclude_org_mock.return_value = s
+
+        result = esc.contributions_count_by_author_org(
+            DataSource.ALL,
+            start_date='2018-01-01',
+            exclude_unknown=True)
+
+        exclude_org_mock.assert_called_with(s=s,
+                                            org_name=esc.UNKNOWN_ORG_NAME)
+        self.assertEqual(s.execute.call_count, 1)
+        s.aggs.bucket.assert_called_with(
+            'composite_contribs',
+            'composite',
+            sources=[
+                {'author': {'terms': {'field': 'author_uuid'}}},
+                {'organization': {'terms': {'field': 'author_org_name'}}}
+            ],
+            size=esc.COMPOSITE_PAGE_SIZE)
+
+        self.assertEqual(list(result.columns),
+                         ['author', 'organization', 'contributions'])
+        self.assertEqual(list(result['organization']), ['Marble', 'Lled'])
+        self.assertEqual(result['organization'].dtype.name, 'category')
+        self.assertEqual(result['contributions'].dtype.name, 'uint16')
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    @mock.patch('broomstick.data.es.common.exclude_org')
+    def test_contributions_count_by_org_daily(self,
+                                              exclude_org_mock,
+                                              create_search_mock):
+        """Test count contributions by organization and day method.
+        """
+        response = {
+            'aggregations': {
+                'composite_contribs': {
+                    'buckets': [
+                        {
+                            'key': {'day': 1577836800000,
+                                    'organization': 'Lled'},
+                            'doc_count': 3,
+                            'total_contribs': {'value': 3}
+                        },
+                        {
+                            'key': {'day': 1577923200000,
+                                    'organization': 'Marble'},
+                            'doc_count': 5,
+                            'total_contribs': {'value': 4}
+                        }
+                    ]
+                }
+            }
+        }
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+        exclude_org_mock.return_value = s
+
+        result = esc.contributions_count_by_org_daily(
+            DataSource.GIT,
+            start_date='2019-12-31',
+            end_date='2020-01-02')
+
+        exclude_org_mock.assert_called_with(s=s,
+                                            org_name=esc.UNKNOWN_ORG_NAME)
+        s.aggs.bucket.assert_called_with(
+            'composite_contribs',
+            'composite',
+            sources=[
+                {'day': {'date_histogram': {
+                    'field': 'grimoire_creation_date',
+                    'interval': '1d'}}},
+                {'organization': {'terms': {'field': 'author_org_name'}}}
+            ],
+            size=esc.COMPOSITE_PAGE_SIZE)
+
+        self.assertEqual(list(result['day']),
+                         [pandas.Timestamp('2020-01-01', tz='UTC'),
+                          pandas.Timestamp('2020-01-02', tz='UTC')])
+        self.assertEqual(list(result['organization']), ['Lled', 'Marble'])
+        self.assertEqual(list(result['contributions']), [3, 4])
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    def test_contributions_count_by_author_period(self, create_search_mock):
+        """Test count contributions by author and period method.
+        """
+        response = {
+            'aggregations': {
+                'composite_contribs': {
+                    'buckets': [
+                        {
+                            'key': {'period': 1577836800000,
+                                    'author': 'uuid1'},
+                            'doc_count': 3,
+                            'total_contribs': {'value': 3}
+                        },
+                        {
+                            'key': {'period': 1580515200000,
+                                    'author': 'uuid2'},
+                            'doc_count': 5,
+                            'total_contribs': {'value': 4}
+                        }
+                    ]
+                }
+            }
+        }
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+
+        result = esc.contributions_count_by_author_period(
+            DataSource.GIT,
+            start_date='2019-12-31',
+            interval='1M')
+
+        s.aggs.bucket.assert_called_with(
+            'composite_contribs',
+            'composite',
+            sources=[
+                {'period': {'date_histogram': {
+                    'field': 'grimoire_creation_date',
+                    'interval': '1M'}}},
+                {'author': {'terms': {'field': 'author_uuid'}}}
+            ],
+            size=esc.COMPOSITE_PAGE_SIZE)
+
+        self.assertEqual(list(result['period']),
+                         [pandas.Timestamp('2020-01-01', tz='UTC'),
+                          pandas.Timestamp('2020-02-01', tz='UTC')])
+        self.assertEqual(list(result['author']), ['uuid1', 'uuid2'])
+        self.assertEqual(result['author'].dtype.name, 'category')
+        self.assertEqual(list(result['contributions']), [3, 4])
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    @mock.patch('broomstick.data.es.common.exclude_org')
+    @mock.patch('broomstick.data.es.common.add_days_filter')
+    def test_contributions_count_by_org_daily_days(self,
+                                                   add_days_filter_mock,
+                                                   exclude_org_mock,
+                                                   create_search_mock):
+        """Test daily contributions are only counted for the given days.
+        """
+        s, r = self.__create_mocked_search({}, create_search_mock)
+        exclude_org_mock.return_value = s
+        add_days_filter_mock.return_value = s
+
+        days = pandas.to_datetime(['2020-01-02', '2020-01-05'], utc=True)
+
+        result = esc.contributions_count_by_org_daily(
+            DataSource.GIT,
+            start_date='2019-12-31',
+            days=days)
+
+        add_days_filter_mock.assert_called_once_with(s, days)
+        self.assertEqual(len(result), 0)
+
+    def test_day_ranges(self):
+        """Test consecutive days are grouped into ranges.
+        """
+
+        days = pandas.to_datetime(['2020-01-05', '2020-01-01', '2020-01-02',
+                                   '2020-01-05', '2020-01-03'], utc=True)
+
+        self.assertEqual(esc.day_ranges(days), [
+            (pandas.Timestamp('2020-01-01', tz='UTC'),
+             pandas.Timestamp('2020-01-04', tz='UTC')),
+            (pandas.Timestamp('2020-01-05', tz='UTC'),
+             pandas.Timestamp('2020-01-06', tz='UTC'))
+        ])
+        self.assertEqual(esc.day_ranges([]), [])
+
+    def test_add_days_filter(self):
+        """Test a range filter is added for every range of days.
+        """
+
+        days = pandas.to_datetime(['2020-01-01', '2020-01-02', '2020-01-05'],
+                                  utc=True)
+
+        result = esc.add_days_filter(Search(), days)
+
+        self.assertEqual(result.to_dict()['query'], {
+            'bool': {'filter': [{'bool': {
+                'minimum_should_match': 1,
+                'should': [
+                    {'range': {'grimoire_creation_date': {
+                        'gte': '2020-01-01T00:00:00Z',
+                        'lt': '2020-01-03T00:00:00Z'}}},
+                    {'range': {'grimoire_creation_date': {
+                        'gte': '2020-01-05T00:00:00Z',
+                        'lt': '2020-01-06T00:00:00Z'}}}
+                ]}}]}
+        })
+
+    def test_add_days_filter_limit(self):
+        """Test too many ranges of days are rejected.
+        """
+
+        days = pandas.date_range('2020-01-01', freq='2D', tz='UTC',
+                                 periods=esc.MAX_DAY_RANGES + 1)
+
+        with self.assertRaises(ValueError):
+            esc.add_days_filter(Search(), days)
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    def test_last_enriched(self, create_search_mock):
+        """Test the last enrichment time is read from a max aggregation.
+        """
+        response = {'aggregations': {'last_enriched': {
+            'value': 1577880000000.0,
+            'value_as_string': '2020-01-01T12:00:00.000Z'}}}
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+
+        result = esc.last_enriched(DataSource.GIT)
+
+        s.aggs.metric.assert_called_with('last_enriched', 'max',
+                                         field=esc.ENRICHED_FIELD)
+        self.assertEqual(result, 1577880000000)
+
+        r.to_dict.return_value = {'aggregations': {'last_enriched': {
+            'value': None}}}
+
+        self.assertIsNone(esc.last_enriched(DataSource.GIT))
+
+    @mock.patch('broomstick.data.es.common.create_search')
+    def test_enriched_days(self, create_search_mock):
+        """Test days of documents enriched within a period.
+        """
+        response = {
+            'aggregations': {
+                'composite_contribs': {
+                    'buckets': [
+                        {'key': {'day': 1577836800000},
+                         'total_contribs': {'value': 3}},
+                        {'key': {'day': 1578182400000},
+                         'total_contribs': {'value': 1}}
+                    ]
+                }
+            }
+        }
+
+        s, r = self.__create_mocked_search(response, create_search_mock)
+        s.filter = MagicMock(return_value=s)
+
+        result = esc.enriched_days(DataSource.GIT,
+                                   since=1577836800000,
+                                   until=1578268800000)
+
+        s.filter.assert_called_once_with('range', metadata__enriched_on={
+            'format': 'epoch_millis',
+            'gte': 1577836800000,
+            'lte': 1578268800000})
+        s.aggs.bucket.assert_called_with(
+            'composite_contribs',
+            'composite',
+            sources=[{'day': {'date_histogram': {
+                'field': 'grimoire_creation_date',
+                'interval': '1d'}}}],
+            size=esc.COMPOSITE_PAGE_SIZE)
+        self.assertEqual(list(result),
+                         [pandas.Timestamp('2020-01-01', tz='UTC'),
+                          pandas.Timestamp('2020-01-05', tz='UTC')])
+
+    def test_compact_frame(self):
+        """Test frames use categories and downcast integers.
+        """
+
+        df = esc.compact_frame({'organization': ['Lled', 'Lled', 'Marble'],
+                                'contributions': [1, 70000, 3]},
+                               categorical=['organization'])
+
+        self.assertEqual(df['organization'].dtype.name, 'category')
+        self.assertEqual(list(df['organization'].cat.categories),
+                         ['Lled', 'Marble'])
+        self.assertEqual(df['contributions'].dtype.name, 'uint32')
+
+        df = esc.compact_frame({'author': [], 'contributions': []},
+                               categorical=['author'])
+        self.assertTrue(df.empty)
+        self.assertEqual(list(df.columns), ['author', 'contributions'])
+
     def __create_mocked_search(self, response, create_search_mock):
         # Create a mocked Search
         s = MagicMock()
         s.__getitem__ = MagicMock(return_value=s)
+        s.params = MagicMock(return_value=s)
         # Create a mocked `Response` for the `Search` object
         r = MagicMock()
         r.to_dict = MagicMock(return_value=response)
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import sys
+import unittest
+
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.data.es import fields as fc
+
+
+FIELD_CAPS = {
+    'fields': {
+        'hash': {
+            'keyword': {'searchable': True, 'aggregatable': True}
+        },
+        'author_org_name': {
+            'text': {'searchable': True, 'aggregatable': True}
+        },
+        'author_org_name.keyword': {
+            'keyword': {'searchable': True, 'aggregatable': True}
+        },
+        'title': {
+            'text': {'searchable': True, 'aggregatable': True}
+        },
+        'message': {
+            'text': {'searchable': True, 'aggregatable': False}
+        },
+        'painless_unique_id': {
+            'keyword': {'searchable': True, 'aggregatable': True,
+                        'non_aggregatable_indices': ['old_index']},
+            'text': {'searchable': True, 'aggregatable': False,
+                     'indices': ['old_index']}
+        }
+    }
+}
+
+
+class TestEsFields(TestCase):
+
+    def setUp(self):
+        fc.clear_cache()
+
+        self.es = MagicMock()
+        self.es.field_caps = MagicMock(return_value=FIELD_CAPS)
+
+    def test_field_caps_cached(self):
+        """Test field capabilities are retrieved once per index.
+        """
+
+        fc.field_caps(self.es, 'git')
+        result = fc.field_caps(self.es, 'git')
+
+        self.es.field_caps.assert_called_once_with(index='git', fields='*')
+        self.assertEqual(result, FIELD_CAPS['fields'])
+
+        fc.field_caps(self.es, 'all_enriched*')
+
+        self.assertEqual(self.es.field_caps.call_count, 2)
+
+    def test_aggregatable_field(self):
+        """Test the cheapest aggregatable variant of a field is picked.
+        """
+
+        self.assertEqual(fc.aggregatable_field(self.es, 'git', 'hash'),
+                         'hash')
+        self.assertEqual(
+            fc.aggregatable_field(self.es, 'git', 'author_org_name'),
+            'author_org_name.keyword')
+
+        # Fielddata is the last resort
+        with self.assertLogs('broomstick.data.es.fields', level='WARNING'):
+            self.assertEqual(fc.aggregatable_field(self.es, 'git', 'title'),
+                             'title')
+
+    def test_aggregatable_field_errors(self):
+        """Test fields that can't be aggregated fail early.
+        """
+
+        with self.assertRaisesRegex(ValueError, 'not found'):
+            fc.aggregatable_field(self.es, 'git', 'author_uuid')
+
+        with self.assertRaisesRegex(ValueError, 'not aggregatable'):
+            fc.aggregatable_field(self.es, 'git', 'message')
+
+        # Fields must be aggregatable in every index of a pattern
+        with self.assertRaisesRegex(ValueError, 'not aggregatable'):
+            fc.aggregatable_field(self.es, 'git*', 'painless_unique_id')
+
+
+if __name__ == '__main__':
+    unittest.main()
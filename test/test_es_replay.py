@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from elasticsearch import Elasticsearch
+from elasticsearch.exceptions import TransportError
+from elasticsearch_dsl import Search
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.data.es import replay as rp
+
+
+RESPONSE = {
+    'hits': {'total': 3, 'hits': []},
+    'aggregations': {'total_contribs': {'value': 3}}
+}
+
+
+def create_search(es):
+    s = Search(using=es, index='git').params(request_timeout=10)
+    s.aggs.metric('total_contribs', 'cardinality', field='hash')
+    return s[0:0]
+
+
+class TestEsReplay(TestCase):
+
+    def setUp(self):
+        self.__tmp_dir = tempfile.TemporaryDirectory()
+        self.recording = os.path.join(self.__tmp_dir.name,
+                                      'recording.jsonl.gz')
+
+    def tearDown(self):
+        self.__tmp_dir.cleanup()
+
+    def test_request_key(self):
+        """Test requests are identified by their content.
+        """
+
+        self.assertEqual(
+            rp.request_key('GET', '/git/_search', {'request_timeout': 5},
+                           '{"size": 0, "aggs": {}}'),
+            rp.request_key('GET', '/git/_search', {},
+                           b'{"aggs": {}, "size": 0}'))
+        self.assertNotEqual(
+            rp.request_key('GET', '/git/_search', {}, '{"size": 0}'),
+            rp.request_key('GET', '/all_enriched/_search', {}, '{"size": 0}'))
+
+    @mock.patch('broomstick.data.es.replay.RequestsHttpConnection.'
+                'perform_request')
+    def test_record_and_replay(self, perform_request_mock):
+        """Test recorded responses are served in replay mode.
+        """
+
+        perform_request_mock.return_value = (
+            200, {'content-type': 'application/json'}, json.dumps(RESPONSE))
+
+        es = Elasticsearch(connection_class=rp.RecordingConnection,
+                           recording=self.recording)
+
+        recorded = create_search(es).execute().to_dict()
+
+        self.assertEqual(recorded, RESPONSE)
+        perform_request_mock.assert_called_once()
+
+        es = Elasticsearch(connection_class=rp.ReplayConnection,
+                           recording=self.recording)
+
+        replayed = create_search(es).execute().to_dict()
+
+        self.assertEqual(replayed, RESPONSE)
+        perform_request_mock.assert_called_once()
+
+        # Requests not recorded fail
+        with self.assertRaises(TransportError):
+            Search(using=es, index='git').execute()
+
+    @mock.patch('broomstick.data.es.replay.time.sleep')
+    def test_replay_order_and_latency(self, sleep_mock):
+        """Test identical requests are answered in the recorded order.
+        """
+
+        key = rp.request_key('GET', '/git/_search', None, '{"size": 0}')
+
+        with rp.gzip.open(self.recording, 'wt') as f:
+            for value in (1, 2):
+                f.write(json.dumps({
+                    'request': key,
+                    'status': 200,
+                    'headers': {},
+                    'response': str(value)
+                }) + '\n')
+
+        connection = rp.ReplayConnection(recording=self.recording,
+                                         latency='0.25')
+
+        answers = [connection.perform_request('GET', '/git/_search',
+                                              body='{"size": 0}')[2]
+                   for _ in range(3)]
+
+        self.assertEqual(answers, ['1', '2', '2'])
+        sleep_mock.assert_called_with(0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import jobs
+from broomstick.core import DataSource
+
+
+SPEC = {
+    'data_sources': ['git'],
+    'windows': ['2019-01-01:2020-01-01', '2020-01-01:2021-01-01'],
+    'params': {'exclude_bots': True},
+    'metrics': ['contributions_count_total', 'elephant_factor',
+                'pony_factor']
+}
+
+RESPONSE = {
+    'aggregations': {
+        'total_contribs': {'value': 300},
+        'unknown': {'unknown_contribs': {'value': 100}},
+        'organizations': {
+            'buckets': [
+                {'key': 'Lled', 'total_contribs': {'value': 150}},
+                {'key': 'Unknown', 'total_contribs': {'value': 100}},
+                {'key': 'Marble', 'total_contribs': {'value': 50}}
+            ]
+        }
+    }
+}
+
+
+def run_metric(metric, data_source, start_date, end_date, **params):
+    return [{'metric': metric, 'data_source': data_source.name.lower(),
+             'start_date': start_date, 'end_date': end_date, 'value': 2}]
+
+
+class TestJobs(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'jobs.sqlite')
+        self.conn = jobs.connect(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_submit_spec(self):
+        """Test reports are split into jobs, added only once.
+        """
+
+        self.assertEqual(jobs.submit_spec(self.conn, SPEC), 4)
+        self.assertEqual(jobs.submit_spec(self.conn, SPEC), 0)
+
+        kinds = [kind for kind, in self.conn.execute(
+            'SELECT kind FROM jobs ORDER BY id')]
+
+        # A summary job per window, plus the Pony Factor of each window
+        self.assertEqual(kinds, ['summary', 'summary', 'metric', 'metric'])
+        self.assertEqual(jobs.count_states(self.conn),
+                         {'pending': 4, 'running': 0, 'done': 0,
+                          'failed': 0})
+
+    def test_claim(self):
+        """Test jobs are claimed once, until their lease expires.
+        """
+
+        jobs.submit_spec(self.conn, SPEC)
+
+        job = jobs.claim(self.conn, 'w1')
+
+        self.assertEqual(job.id, 1)
+        self.assertEqual(job.kind, 'summary')
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual([t.metric for t in job.tasks],
+                         ['contributions_count_total', 'elephant_factor'])
+        self.assertEqual(job.tasks[0].data_source, DataSource.GIT)
+        self.assertEqual(job.tasks[0].params, {'exclude_bots': True})
+
+        self.assertEqual(jobs.claim(self.conn, 'w2').id, 2)
+
+        # Worker `w1` dies and its lease expires
+        with mock.patch('broomstick.jobs.time.time',
+                        return_value=jobs.time.time() + jobs.LEASE + 1):
+            job = jobs.claim(self.conn, 'w3')
+
+        self.assertEqual(job.id, 1)
+        self.assertEqual(job.attempts, 2)
+
+        # Only the current owner saves the results
+        self.assertFalse(jobs.complete(self.conn, job, 'w1', []))
+        self.assertFalse(jobs.renew(self.conn, job, 'w1'))
+        self.assertTrue(jobs.renew(self.conn, job, 'w3'))
+        self.assertTrue(jobs.complete(self.conn, job, 'w3', [{'value': 1}]))
+
+        self.assertEqual(jobs.results(self.conn), [{'value': 1}])
+
+    def test_claim_expired(self):
+        """Test jobs expiring too many times fail.
+        """
+
+        jobs.submit_spec(self.conn, SPEC)
+
+        for _ in range(jobs.MAX_ATTEMPTS):
+            jobs.claim(self.conn, 'w1', lease=-1)
+
+        self.assertEqual(jobs.claim(self.conn, 'w1', lease=-1).id, 2)
+
+        row = self.conn.execute(
+            'SELECT state, error FROM jobs WHERE id = 1').fetchone()
+
+        self.assertEqual(row, ('failed', 'lease expired'))
+
+    def test_fail(self):
+        """Test failed jobs are retried until out of attempts.
+        """
+
+        jobs.submit_spec(self.conn, SPEC)
+
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            job = jobs.claim(self.conn, 'w1')
+
+            self.assertEqual((job.id, job.attempts), (1, attempt))
+
+            state = jobs.fail(self.conn, job, 'w1', 'boom')
+
+        self.assertEqual(state, 'failed')
+        self.assertEqual(jobs.claim(self.conn, 'w1').id, 2)
+
+    @mock.patch('broomstick.data.es.common.rs.execute',
+                return_value=RESPONSE)
+    @mock.patch('broomstick.data.es.common.org_summary_search')
+    @mock.patch('broomstick.jobs.runner.run_metric', side_effect=run_metric)
+    def test_work(self, run_metric_mock, org_summary_search_mock,
+                  execute_mock):
+        """Test workers run every job and resume interrupted runs.
+        """
+
+        jobs.submit_spec(self.conn, SPEC)
+
+        # A previous run completed the first job
+        job = jobs.claim(self.conn, 'old')
+        jobs.complete(self.conn, job, 'old', [{'metric': 'done before'}])
+
+        self.assertEqual(jobs.work(self.path, worker='w1'), 3)
+
+        org_summary_search_mock.assert_called_once_with(
+            data_source=DataSource.GIT,
+            start_date='2020-01-01',
+            end_date='2021-01-01',
+            exclude_bots=True)
+        self.assertEqual(run_metric_mock.call_count, 2)
+        run_metric_mock.assert_any_call('pony_factor', DataSource.GIT,
+                                        '2019-01-01', '2020-01-01',
+                                        exclude_bots=True)
+
+        records = jobs.results(self.conn)
+
+        self.assertEqual([r['metric'] for r in records],
+                         ['done before', 'contributions_count_total',
+                          'elephant_factor', 'pony_factor', 'pony_factor'])
+        self.assertEqual(records[1]['value'], 200)
+        self.assertEqual(records[2]['value'], 1)
+        self.assertEqual(jobs.count_states(self.conn)['done'], 4)
+
+    @mock.patch('broomstick.jobs.runner.run_metric',
+                side_effect=ValueError('boom'))
+    def test_work_failures(self, run_metric_mock):
+        """Test failing jobs are retried and then given up.
+        """
+
+        jobs.submit_plan(self.conn, jobs.report.compile_spec(
+            dict(SPEC, metrics=['pony_factor'])))
+
+        with mock.patch('broomstick.jobs.logger'):
+            self.assertEqual(jobs.work(self.path, worker='w1'), 0)
+
+        self.assertEqual(run_metric_mock.call_count, 2 * jobs.MAX_ATTEMPTS)
+        self.assertEqual(jobs.count_states(self.conn)['failed'], 2)
+
+        error, = self.conn.execute(
+            'SELECT error FROM jobs WHERE id = 1').fetchone()
+
+        self.assertIn('boom', error)
+
+        self.assertEqual(jobs.retry_failed(self.conn), 2)
+        self.assertEqual(jobs.count_states(self.conn)['pending'], 2)
+        self.assertEqual(jobs.claim(self.conn, 'w1').attempts, 1)
+
+    def test_main(self):
+        """Test jobs are submitted and results written from the CLI.
+        """
+
+        spec_path = os.path.join(self.tmp_dir.name, 'spec.json')
+        output = os.path.join(self.tmp_dir.name, 'out.jsonl')
+
+        with open(spec_path, 'w') as f:
+            json.dump(SPEC, f)
+
+        with mock.patch('sys.stderr', new_callable=io.StringIO):
+            self.assertEqual(jobs.main(['-q', self.path, 'submit',
+                                        spec_path]), 0)
+
+        job = jobs.claim(self.conn, 'w1')
+        jobs.complete(self.conn, job, 'w1', [{'value': 1}])
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as out:
+            jobs.main(['-q', self.path, 'status'])
+
+        self.assertEqual(json.loads(out.getvalue()),
+                         {'pending': 3, 'running': 0, 'done': 1,
+                          'failed': 0})
+
+        jobs.main(['-q', self.path, 'results', '-o', output])
+
+        with open(output) as f:
+            self.assertEqual([json.loads(line) for line in f],
+                             [{'value': 1}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import os
+import subprocess
+import sys
+import unittest
+
+from unittest import TestCase
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import lazy
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules short-lived workers import, and the dependencies they must not
+# pay for until they query ES or build data frames
+LIGHT_MODULES = ['broomstick.data.es.common', 'broomstick.metrics.general',
+                 'broomstick.cli', 'broomstick.report', 'broomstick.server',
+                 'broomstick.jobs', 'broomstick.dataset',
+                 'broomstick.refresh']
+HEAVY_MODULES = ['elasticsearch', 'elasticsearch_dsl', 'numpy', 'pandas',
+                 'urllib3']
+
+# Target time to import each light module, in microseconds, and how much
+# slower imports may be before failing, as wall times vary between runs.
+# Slow CI machines can raise the tolerance with the environment variable.
+IMPORT_BUDGET = 100000
+IMPORT_TOLERANCE = float(os.environ.get('BROOMSTICK_IMPORT_TOLERANCE', 2))
+
+
+def import_times(module):
+    """Imports a module in a new interpreter.
+
+    :returns: a dict with the cumulative import time, in microseconds, of
+        every module imported.
+    """
+
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             'import ' + module],
+                            env=env, cwd=ROOT_DIR, check=True,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    return times
+
+
+class TestLazy(TestCase):
+
+    def test_lazy_import(self):
+        """Test modules are imported on first attribute access.
+        """
+
+        sys.modules.pop('colorsys', None)
+
+        colorsys = lazy.lazy_import('colorsys')
+
+        self.assertNotIn('colorsys', sys.modules)
+        self.assertIn('not loaded', repr(colorsys))
+
+        self.assertEqual(colorsys.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+        self.assertIn('colorsys', sys.modules)
+        self.assertIs(colorsys.load(), sys.modules['colorsys'])
+
+    def test_lazy_attributes(self):
+        """Test module attributes are resolved and cached on first access.
+        """
+
+        module_globals = {'__name__': 'test_module'}
+        getattr_ = lazy.lazy_attributes(module_globals, {
+            'path': 'os.path',
+            'join': 'os.path:join'
+        })
+
+        self.assertIs(getattr_('join'), os.path.join)
+        self.assertIs(getattr_('path'), os.path)
+        self.assertIs(module_globals['join'], os.path.join)
+
+        with self.assertRaises(AttributeError):
+            getattr_('split')
+
+    def test_common_compatibility(self):
+        """Test names formerly imported by the data layer are available.
+        """
+
+        from broomstick.data.es import common as com
+        from elasticsearch_dsl import Search
+
+        self.assertIs(com.Search, Search)
+
+        with self.assertRaises(AttributeError):
+            com.Unknown
+
+    def test_import_time(self):
+        """Test light modules don't import heavy dependencies.
+        """
+
+        for module in LIGHT_MODULES:
+            times = import_times(module)
+
+            self.assertEqual([m for m in HEAVY_MODULES if m in times], [],
+                             module)
+            self.assertLess(times[module], IMPORT_BUDGET * IMPORT_TOLERANCE,
+                            module)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import json
+import os
+import pandas
+import sys
+import tempfile
+import unittest
+
+from pandas.testing import assert_frame_equal
+from unittest import TestCase
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.metrics import affiliations as af
+
+
+AFFILIATIONS = pandas.DataFrame({
+    'author': [None, None, 'a3'],
+    'organization': ['Lled Inc', 'Nano', None],
+    'affiliation': ['Lled', 'Nanosoft', 'Marble']
+})
+
+
+class TestMetricsAffiliations(TestCase):
+
+    def test_load_affiliations(self):
+        """Test override tables are loaded from CSV and SortingHat files.
+        """
+
+        export = {
+            'uidentities': {
+                'a1': {
+                    'enrollments': [
+                        {'organization': 'Marble',
+                         'start': '2010-01-01T00:00:00',
+                         'end': '2015-01-01T00:00:00'},
+                        {'organization': 'Lled',
+                         'start': '2015-01-01T00:00:00',
+                         'end': '2100-01-01T00:00:00'}
+                    ]
+                },
+                'a2': {'enrollments': []}
+            }
+        }
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            csv_path = os.path.join(tmp_dir, 'affiliations.csv')
+            with open(csv_path, 'w') as f:
+                f.write("organization,affiliation\n"
+                        "Lled Inc,Lled\n")
+
+            json_path = os.path.join(tmp_dir, 'sortinghat.json')
+            with open(json_path, 'w') as f:
+                json.dump(export, f)
+
+            result = af.load_affiliations(csv_path)
+
+            self.assertEqual(list(result.columns), af.AFFILIATION_COLUMNS)
+            self.assertEqual(result['affiliation'].tolist(), ['Lled'])
+            self.assertTrue(result['author'].isna().all())
+
+            # Tables are copies, and reloaded when the file changes
+            result['affiliation'] = 'Nanosoft'
+
+            self.assertEqual(
+                af.load_affiliations(csv_path)['affiliation'].tolist(),
+                ['Lled'])
+
+            with open(csv_path, 'w') as f:
+                f.write("organization,affiliation\n"
+                        "Lled Inc,Marble\n")
+            os.utime(csv_path, ns=(0, os.stat(csv_path).st_mtime_ns + 1))
+
+            self.assertEqual(
+                af.load_affiliations(csv_path)['affiliation'].tolist(),
+                ['Marble'])
+
+            result = af.load_affiliations(json_path)
+
+            self.assertEqual(result['author'].tolist(), ['a1', 'a1'])
+            self.assertEqual(result['affiliation'].tolist(),
+                             ['Marble', 'Lled'])
+            self.assertEqual(result['start'][1],
+                             pandas.Timestamp('2015-01-01', tz='UTC'))
+            self.assertTrue(result['organization'].isna().all())
+            self.assertTrue(af.has_dated_overrides(result))
+
+    def test_remap_orgs(self):
+        """Test renamed organizations add up their contributions.
+        """
+
+        org_contributions_df = pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Lled Inc', 'Nano'],
+            'contributions': [100, 90, 20, 5]
+        })
+
+        result = af.remap_orgs(org_contributions_df,
+                               af.resolve_affiliations(AFFILIATIONS))
+
+        assert_frame_equal(result, pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Nanosoft'],
+            'contributions': [120, 90, 5]
+        }))
+
+    def test_remap_author_orgs(self):
+        """Test authors are re-affiliated before renaming organizations.
+        """
+
+        author_org_contributions_df = pandas.DataFrame({
+            'author': pandas.Categorical(['a1', 'a2', 'a3', 'a3']),
+            'organization': pandas.Categorical(['Lled Inc', 'Marble',
+                                                'Unknown', 'Lled']),
+            'contributions': [10, 7, 4, 2]
+        })
+
+        result = af.remap_author_orgs(author_org_contributions_df,
+                                      af.resolve_affiliations(AFFILIATIONS))
+
+        assert_frame_equal(result, pandas.DataFrame({
+            'organization': ['Marble', 'Lled'],
+            'contributions': [13, 10]
+        }))
+
+    def test_remap_author_orgs_dated(self):
+        """Test contributions follow the enrollments of each author.
+        """
+
+        affiliations = af.sortinghat_affiliations({
+            'uidentities': {
+                'a1': {
+                    'enrollments': [
+                        {'organization': 'Marble',
+                         'start': '2010-01-01T00:00:00',
+                         'end': '2015-01-01T00:00:00'},
+                        {'organization': 'Lled',
+                         'start': '2015-01-01T00:00:00',
+                         'end': '2100-01-01T00:00:00'}
+                    ]
+                }
+            }
+        })
+        affiliations = pandas.concat([affiliations, AFFILIATIONS],
+                                     ignore_index=True)
+        affiliations = af.resolve_affiliations(affiliations)
+
+        author_org_contributions_df = pandas.DataFrame({
+            'day': pandas.to_datetime(['2014-12-31', '2015-01-01',
+                                       '2009-06-01', '2016-01-01'],
+                                      utc=True),
+            'author': pandas.Categorical(['a1', 'a1', 'a1', 'a3']),
+            'organization': pandas.Categorical(['Lled', 'Lled', 'Nano',
+                                                'Unknown']),
+            'contributions': [10, 7, 3, 4]
+        })
+
+        result = af.remap_author_orgs(author_org_contributions_df,
+                                      affiliations)
+
+        # Contributions before any enrollment keep their organization
+        assert_frame_equal(result, pandas.DataFrame({
+            'organization': ['Marble', 'Lled', 'Nanosoft'],
+            'contributions': [14, 7, 3]
+        }))
+
+        with self.assertRaises(ValueError):
+            af.remap_author_orgs(
+                author_org_contributions_df.drop(columns='day'),
+                affiliations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import numpy
+import pandas
+import sys
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.metrics import cohorts as co
+from broomstick.core import DataSource
+
+
+# a, b, c join in January, d in February and e in March
+AUTHORS_DF = pandas.DataFrame({
+    'period': pandas.to_datetime(
+        ['2020-01-01'] * 3 + ['2020-02-01'] * 2 + ['2020-03-01'] * 3,
+        utc=True),
+    'author': pandas.Categorical(['a', 'b', 'c', 'a', 'd', 'b', 'd', 'e']),
+    'contributions': [1, 2, 3, 4, 5, 6, 7, 8]
+})
+
+
+class TestMetricsCohorts(TestCase):
+
+    def test_encode_authors(self):
+        """Test authors are numbered by first period, then by category.
+        """
+
+        df = AUTHORS_DF.sample(frac=1, random_state=1)
+        df['author'] = df['author'].cat.set_categories(
+            ['e', 'd', 'c', 'b', 'a', 'unused'])
+
+        bitmaps = co.encode_authors(df)
+
+        self.assertEqual(list(bitmaps.authors), ['c', 'b', 'a', 'd', 'e'])
+        self.assertEqual(list(bitmaps.cohorts), [0, 3, 4, 5])
+        self.assertEqual(bitmaps.bits.tolist(),
+                         [[0b11100000], [0b00110000], [0b01011000]])
+
+    def test_popcount(self):
+        """Test bits are counted for every bitmap.
+        """
+
+        bits = numpy.array([[0, 0], [255, 1], [0b1010, 128]],
+                           dtype=numpy.uint8)
+
+        self.assertEqual(list(co.popcount(bits)), [0, 9, 3])
+
+    def test_decode_authors(self):
+        """Test bitmaps are decoded to author ids.
+        """
+
+        bitmaps = co.encode_authors(AUTHORS_DF)
+
+        self.assertEqual(list(co.decode_authors(bitmaps, bitmaps.bits[2])),
+                         ['b', 'd', 'e'])
+
+    def test_many_authors(self):
+        """Test bitmaps spanning several bytes.
+        """
+
+        df = pandas.DataFrame({
+            'period': pandas.to_datetime(
+                ['2020-01-01'] * 20 + ['2020-02-01'] * 10, utc=True),
+            'author': pandas.Categorical(
+                ['a{:02d}'.format(i) for i in (*range(20), *range(15, 25))]),
+            'contributions': 1
+        })
+
+        bitmaps = co.encode_authors(df)
+        result = co.retention_from_bitmaps(bitmaps)
+
+        self.assertEqual(bitmaps.bits.shape, (2, 4))
+        self.assertEqual(list(result['active']), [20, 10])
+        self.assertEqual(list(result['new']), [20, 5])
+        self.assertEqual(list(result['retained']), [0, 5])
+        self.assertEqual(list(result['churned']), [0, 15])
+
+    def test_retention_from_bitmaps(self):
+        """Test authors are classified in every period.
+        """
+
+        result = co.retention_from_bitmaps(co.encode_authors(AUTHORS_DF))
+
+        self.assertEqual(list(result['period']),
+                         list(pandas.to_datetime(
+                             ['2020-01-01', '2020-02-01', '2020-03-01'],
+                             utc=True)))
+        self.assertEqual(list(result['active']), [3, 2, 3])
+        self.assertEqual(list(result['new']), [3, 1, 1])
+        self.assertEqual(list(result['returning']), [0, 1, 2])
+        self.assertEqual(list(result['retained']), [0, 1, 1])
+        self.assertEqual(list(result['churned']), [0, 2, 1])
+        self.assertTrue(numpy.isnan(result['retention'][0]))
+        self.assertAlmostEqual(result['retention'][1], 1 / 3)
+        self.assertAlmostEqual(result['retention'][2], 1 / 2)
+
+    def test_cohorts_from_bitmaps(self):
+        """Test cohort members are counted in later periods.
+        """
+
+        result = co.cohorts_from_bitmaps(co.encode_authors(AUTHORS_DF),
+                                         relative=True)
+
+        self.assertEqual(list(result['periods_since']), [0, 1, 2, 0, 1, 0])
+        self.assertEqual(list(result['authors']), [3, 1, 1, 1, 1, 1])
+        self.assertEqual(list(result['retention']),
+                         [1, 1 / 3, 1 / 3, 1, 1, 1])
+        self.assertEqual(result['cohort'][4],
+                         pandas.Timestamp('2020-02-01', tz='UTC'))
+        self.assertEqual(result['period'][4],
+                         pandas.Timestamp('2020-03-01', tz='UTC'))
+
+    def test_period_starts(self):
+        """Test every period overlapping the date range is listed.
+        """
+
+        periods = co.period_starts('2019-12-31', '2020-03-15', interval='1M')
+
+        self.assertEqual(list(periods), list(pandas.to_datetime(
+            ['2019-12-01', '2020-01-01', '2020-02-01', '2020-03-01'],
+            utc=True)))
+
+        # Weeks start on Monday
+        periods = co.period_starts('2020-01-01', '2020-01-13', interval='1w')
+
+        self.assertEqual(list(periods), list(pandas.to_datetime(
+            ['2019-12-30', '2020-01-06', '2020-01-13'], utc=True)))
+
+        with self.assertRaises(ValueError):
+            co.period_starts('2020-01-01', interval='7d')
+
+    def test_periods_without_authors(self):
+        """Test authors churn in periods without any author.
+        """
+
+        df = AUTHORS_DF[AUTHORS_DF['period'].dt.month != 2]
+        periods = pandas.to_datetime(
+            ['2020-01-01', '2020-02-01', '2020-03-01', '2020-04-01'],
+            utc=True)
+
+        bitmaps = co.encode_authors(df, periods=periods)
+        result = co.retention_from_bitmaps(bitmaps)
+
+        self.assertEqual(list(result['period']), list(periods))
+        self.assertEqual(list(result['active']), [3, 0, 3, 0])
+        self.assertEqual(list(result['retained']), [0, 0, 0, 0])
+        self.assertEqual(list(result['churned']), [0, 3, 0, 3])
+        self.assertEqual(list(result['returning']), [0, 0, 1, 0])
+        self.assertTrue(numpy.isnan(result['retention'][2]))
+
+        cohorts = co.cohorts_from_bitmaps(bitmaps)
+
+        self.assertEqual(list(cohorts['periods_since']),
+                         [0, 1, 2, 3, 0, 1])
+        self.assertEqual(list(cohorts['authors']), [3, 0, 1, 0, 2, 0])
+
+    def test_empty(self):
+        """Test metrics without any author.
+        """
+
+        bitmaps = co.encode_authors(AUTHORS_DF.iloc[:0])
+
+        self.assertEqual(len(co.retention_from_bitmaps(bitmaps)), 0)
+        self.assertEqual(len(co.cohorts_from_bitmaps(bitmaps)), 0)
+
+    @mock.patch('broomstick.metrics.cohorts.gm.'
+                'contributions_count_by_author_period',
+                return_value=AUTHORS_DF)
+    def test_contributor_retention(self, authors_mock):
+        """Test authors are fetched once with the given params.
+        """
+
+        result = co.contributor_retention(DataSource.GIT,
+                                          start_date='2020-01-01',
+                                          end_date='2020-04-30',
+                                          interval='1M',
+                                          exclude_bots=True)
+
+        authors_mock.assert_called_once_with(data_source=DataSource.GIT,
+                                             start_date='2020-01-01',
+                                             end_date='2020-04-30',
+                                             interval='1M',
+                                             exclude_unknown=False,
+                                             exclude_bots=True,
+                                             exclude_merges=False,
+                                             include_orgs=None,
+                                             exclude_orgs=None)
+        # April has no authors, but is in the requested range
+        self.assertEqual(list(result['new']), [3, 1, 1, 0])
+        self.assertEqual(list(result['churned']), [0, 2, 1, 3])
+
+    @mock.patch('broomstick.metrics.cohorts.gm.'
+                'contributions_count_by_author_period',
+                return_value=AUTHORS_DF)
+    def test_cohort_retention(self, authors_mock):
+        """Test cohort retention is relative by default.
+        """
+
+        result = co.cohort_retention(DataSource.GIT, start_date='2019-12-31')
+
+        authors_mock.assert_called_once()
+        self.assertIn('retention', result.columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import math
+import sys
+import unittest
+
+from unittest import TestCase
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.metrics import concentration as cm
+
+
+class TestMetricsConcentration(TestCase):
+
+    def test_sort_contributions(self):
+        """Test contributions are sorted in descending order.
+        """
+
+        self.assertEqual(list(cm.sort_contributions([30, 175, 165])),
+                         [175, 165, 30])
+
+    def test_factor(self):
+        """Test number of contributors needed to reach a threshold.
+        """
+
+        contributions = [175, 165, 30]
+
+        self.assertEqual(cm.factor(contributions), 2)
+        self.assertEqual(cm.factor(contributions, threshold=0.4), 1)
+        self.assertEqual(cm.factor(contributions, threshold=0.95), 3)
+        self.assertEqual(cm.factor(contributions, total=300), 1)
+        self.assertEqual(cm.factor(contributions, total=1000), 3)
+        self.assertEqual(cm.factor([]), 0)
+
+    def test_gini(self):
+        """Test Gini coefficient.
+        """
+
+        self.assertAlmostEqual(cm.gini([175, 165, 30]), 0.261261, places=6)
+        self.assertEqual(cm.gini([5, 5, 5, 5]), 0)
+        self.assertEqual(cm.gini([10, 0, 0, 0]), 0.75)
+        self.assertTrue(math.isnan(cm.gini([])))
+
+    def test_hhi(self):
+        """Test Herfindahl-Hirschman Index.
+        """
+
+        self.assertEqual(cm.hhi([5, 5, 5, 5]), 0.25)
+        self.assertEqual(cm.hhi([10, 0, 0]), 1)
+        self.assertTrue(math.isnan(cm.hhi([0, 0])))
+
+    def test_concentration(self):
+        """Test every metric is computed from a single vector.
+        """
+
+        result = cm.concentration([30, 175, 165])
+
+        self.assertEqual(result['contributors'], 3)
+        self.assertEqual(result['contributions'], 370)
+        self.assertEqual(result['factor'], 2)
+        self.assertAlmostEqual(result['gini'], cm.gini([175, 165, 30]))
+        self.assertAlmostEqual(result['hhi'], cm.hhi([175, 165, 30]))
+
+        result = cm.concentration([30, 175, 165], threshold=0.9, total=400)
+        self.assertEqual(result['factor'], 3)
+
+        result = cm.concentration([])
+        self.assertEqual(result['contributors'], 0)
+        self.assertEqual(result['factor'], 0)
+
+    def test_row_factors(self):
+        """Test factors are computed for every row at once.
+        """
+
+        matrix = [[30, 175, 165],
+                  [0, 0, 10],
+                  [0, 0, 0],
+                  [5, 5, 5]]
+
+        self.assertEqual(list(cm.row_factors(matrix)), [2, 1, 0, 2])
+        self.assertEqual(list(cm.row_factors(matrix, threshold=0.95)),
+                         [3, 1, 0, 3])
+        self.assertEqual(list(cm.row_factors([[], []])), [0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+# cufflinks adds `iplot` to frames on import, before it gets patched
+import cufflinks  # noqa: F401
+import numpy
+import pandas
+import sys
+import unittest
+
+from pandas.testing import assert_frame_equal
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.metrics import distribution as dm
+from broomstick.core import DataSource
+
+
+class TestMetricsDistribution(TestCase):
+
+    def test_histogram(self):
+        """Test contributions are binned into a compact frame.
+        """
+
+        result = dm.histogram([1, 2, 2, 3, 10], bins=3)
+
+        expected_df = pandas.DataFrame({
+            'bin_start': [1.0, 4.0, 7.0],
+            'bin_end': [4.0, 7.0, 10.0],
+            'count': [4, 0, 1]
+        }, columns=['bin_start', 'bin_end', 'count'])
+
+        assert_frame_equal(result, expected_df)
+
+    def test_histogram_log(self):
+        """Test logarithmic bins.
+        """
+
+        result = dm.histogram([1, 10, 100, 1000], bins=3, log=True)
+
+        numpy.testing.assert_allclose(result['bin_start'], [1, 10, 100])
+        numpy.testing.assert_allclose(result['bin_end'], [10, 100, 1000])
+        self.assertEqual(list(result['count']), [1, 1, 2])
+
+        # No contributions, no counts
+        result = dm.histogram([], bins=3, log=True)
+
+        self.assertEqual(result['count'].sum(), 0)
+
+    @mock.patch(
+        'broomstick.metrics.distribution.gm.contributions_count_by_org')
+    def test_contributions_distribution_by_org(
+            self,
+            contributions_count_by_org_mock):
+        """Test distribution of contributions among organizations.
+        """
+
+        contributions_count_by_org_mock.return_value = pandas.DataFrame(
+            {'organization': ['Lled', 'Marble', 'Nanosoft'],
+             'contributions': [175, 165, 30]},
+            columns=['organization', 'contributions'])
+
+        result = dm.contributions_distribution_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            exclude_bots=True,
+            bins=2)
+
+        contributions_count_by_org_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=True,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+
+        self.assertEqual(list(result['count']), [1, 2])
+
+    @mock.patch('cufflinks.go_offline')
+    @mock.patch('plotly.offline.init_notebook_mode')
+    @mock.patch.object(pandas.DataFrame, 'iplot', create=True)
+    def test_plot_histogram(self,
+                            iplot_mock,
+                            init_notebook_mode_mock,
+                            go_offline_mock):
+        """Test bins are plotted as bars.
+        """
+
+        dm.plot_histogram(dm.histogram([1, 2, 2, 3, 10], bins=3))
+
+        go_offline_mock.assert_called_with(connected=True)
+        init_notebook_mode_mock.assert_called_with(connected=True)
+        iplot_mock.assert_called_with(
+            kind='bar',
+            x='bin',
+            y='count',
+            xTitle='contributions',
+            yTitle='Organizations',
+            title='contributions Distribution')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -35,16 +35,14 @@ from broomstick.core import DataSource
 
 class TestMetricsFactors(TestCase):
 
-    @mock.patch('broomstick.metrics.factors.cufflinks.go_offline')
-    @mock.patch('broomstick.metrics.factors.init_notebook_mode')
+    @mock.patch('broomstick.metrics.factors.dist.plot_histogram')
     @mock.patch('broomstick.metrics.factors.gm.contributions_count_total')
     @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_org')
     def test_elephant_factor_with_print(
             self,
             contributions_count_by_org_mock,
             contributions_count_total_mock,
-            init_notebook_mode_mock,
-            go_offline_mock):
+            plot_histogram_mock):
         """Test elephant factor method with plotly print mode active.
         """
 
@@ -56,7 +54,6 @@ class TestMetricsFactors(TestCase):
         expected_df = pandas.DataFrame(
             expected_data,
             columns=['organization', 'contributions'])
-        expected_df['contributions'].iplot = MagicMock(return_value='test')
 
         contributions_count_total_mock.return_value = 175 + 165 + 30
 
@@ -77,19 +74,21 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=True)
-        go_offline_mock.assert_called_with(connected=True)
-        init_notebook_mode_mock.assert_called_with(connected=True)
-        expected_df['contributions'].iplot.assert_called_with(
-            kind='hist',
-            xTitle='contributions',
-            yTitle='Organizations',
-            title='contributions Distribution')
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.__assert_histogram_plotted(plot_histogram_mock)
 
         self.assertEqual(result, 2)
 
@@ -104,19 +103,21 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.ALL,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.ALL,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=True)
-        go_offline_mock.assert_called_with(connected=True)
-        init_notebook_mode_mock.assert_called_with(connected=True)
-        expected_df['contributions'].iplot.assert_called_with(
-            kind='hist',
-            xTitle='contributions',
-            yTitle='Organizations',
-            title='contributions Distribution')
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.__assert_histogram_plotted(plot_histogram_mock)
 
         self.assertEqual(result, 2)
 
@@ -132,19 +133,21 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
-        go_offline_mock.assert_called_with(connected=True)
-        init_notebook_mode_mock.assert_called_with(connected=True)
-        expected_df['contributions'].iplot.assert_called_with(
-            kind='hist',
-            xTitle='contributions',
-            yTitle='Organizations',
-            title='contributions Distribution')
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.__assert_histogram_plotted(plot_histogram_mock)
 
         self.assertEqual(result, 2)
 
@@ -161,26 +164,39 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
-        go_offline_mock.assert_called_with(connected=True)
-        init_notebook_mode_mock.assert_called_with(connected=True)
-        expected_df['contributions'].iplot.assert_called_with(
-            kind='hist',
-            xTitle='contributions',
-            yTitle='Organizations',
-            title='contributions Distribution')
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.__assert_histogram_plotted(plot_histogram_mock)
 
         self.assertEqual(result, 2)
 
-    @mock.patch('broomstick.metrics.factors.cufflinks.go_offline')
-    @mock.patch('broomstick.metrics.factors.init_notebook_mode')
+    def __assert_histogram_plotted(self, plot_histogram_mock):
+        """Checks the compact bins frame was plotted, not the orgs frame."""
+
+        bins_df = plot_histogram_mock.call_args[0][0]
+
+        self.assertEqual(list(bins_df.columns),
+                         ['bin_start', 'bin_end', 'count'])
+        self.assertEqual(len(bins_df), 20)
+        self.assertEqual(bins_df['count'].sum(), 3)
+
+    @mock.patch('cufflinks.go_offline')
+    @mock.patch('plotly.offline.init_notebook_mode')
     @mock.patch('broomstick.metrics.factors.gm.contributions_count_total')
-    @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_org')
+    @mock.patch(
+        'broomstick.metrics.factors.gm.contributions_count_by_org_pages')
     def test_elephant_factor_without_print(
             self,
             contributions_count_by_org_mock,
@@ -202,7 +218,8 @@ class TestMetricsFactors(TestCase):
 
         contributions_count_total_mock.return_value = 175 + 165 + 30
 
-        contributions_count_by_org_mock.return_value = expected_df
+        contributions_count_by_org_mock.side_effect = \
+            lambda **kwargs: iter([expected_df])
 
         # Test with start and end dates
         #
@@ -220,12 +237,20 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         go_offline_mock.assert_not_called()
         init_notebook_mode_mock.assert_not_called()
         expected_df['contributions'].iplot.assert_not_called()
@@ -244,12 +269,20 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.ALL,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.ALL,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         go_offline_mock.assert_not_called()
         init_notebook_mode_mock.assert_not_called()
         expected_df['contributions'].iplot.assert_not_called()
@@ -269,12 +302,20 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         go_offline_mock.assert_not_called()
         init_notebook_mode_mock.assert_not_called()
         expected_df['contributions'].iplot.assert_not_called()
@@ -295,18 +336,218 @@ class TestMetricsFactors(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_by_org_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         go_offline_mock.assert_not_called()
         init_notebook_mode_mock.assert_not_called()
         expected_df['contributions'].iplot.assert_not_called()
 
         self.assertEqual(result, 2)
 
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_total')
+    @mock.patch(
+        'broomstick.metrics.factors.gm.contributions_count_by_org_pages')
+    def test_elephant_factor_threshold(
+            self,
+            contributions_count_by_org_mock,
+            contributions_count_total_mock):
+        """Test elephant factor method with a custom threshold.
+        """
+
+        df = pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Nanosoft'],
+            'contributions': [175, 165, 30]
+        })
+
+        contributions_count_total_mock.return_value = 175 + 165 + 30
+        contributions_count_by_org_mock.side_effect = \
+            lambda **kwargs: iter([df])
+
+        result = fm.elephant_factor(DataSource.GIT,
+                                    start_date='2018-01-01',
+                                    print_dist=False,
+                                    threshold=0.95)
+        self.assertEqual(result, 3)
+
+        result = fm.elephant_factor(DataSource.GIT,
+                                    start_date='2018-01-01',
+                                    print_dist=False,
+                                    threshold=0.4)
+        self.assertEqual(result, 1)
+
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_total')
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_org')
+    def test_elephant_factor_affiliations(
+            self,
+            contributions_count_by_org_mock,
+            contributions_count_total_mock):
+        """Test elephant factor with affiliation overrides.
+        """
+
+        contributions_count_by_org_mock.return_value = pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Nanosoft'],
+            'contributions': [100, 60, 50]
+        })
+        affiliations = pandas.DataFrame({'organization': ['Lled Inc'],
+                                         'affiliation': ['Lled']})
+
+        result = fm.elephant_factor(DataSource.GIT,
+                                    start_date='2018-01-01',
+                                    print_dist=False,
+                                    affiliations=affiliations)
+
+        contributions_count_by_org_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None,
+            affiliations=affiliations,
+            mode='exact')
+        contributions_count_total_mock.assert_not_called()
+
+        self.assertEqual(result, 2)
+
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_total')
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_org')
+    def test_elephant_factor_preview(
+            self,
+            contributions_count_by_org_mock,
+            contributions_count_total_mock):
+        """Test elephant factor estimated from a sample of documents.
+        """
+
+        contributions_count_by_org_mock.return_value = pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Nanosoft'],
+            'contributions': [100, 60, 50],
+            'error': [10.0, 8.0, 7.0]
+        })
+        contributions_count_by_org_mock.return_value.attrs.update(
+            sampled=100, population=1000)
+
+        result = fm.elephant_factor(DataSource.GIT,
+                                    start_date='2018-01-01',
+                                    print_dist=False,
+                                    mode='preview')
+
+        contributions_count_by_org_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None,
+            affiliations=None,
+            mode='preview')
+        contributions_count_total_mock.assert_not_called()
+
+        # Lled alone reaches the threshold at the top of its error margin
+        self.assertEqual(result, {'value': 2, 'error': 0.5,
+                                  'sampled': 100, 'population': 1000})
+
+    def test_elephant_factor_unknown_mode(self):
+        """Test elephant factor fails with unknown modes.
+        """
+
+        with self.assertRaises(ValueError):
+            fm.elephant_factor(DataSource.GIT,
+                               start_date='2018-01-01',
+                               mode='guess')
+
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_author')
+    def test_pony_factor(self, contributions_count_by_author_mock):
+        """Test pony factor method.
+        """
+
+        contributions_count_by_author_mock.return_value = pandas.DataFrame({
+            'author': ['a', 'b', 'c', 'd'],
+            'contributions': [40, 30, 20, 10]
+        })
+
+        result = fm.pony_factor(DataSource.GIT,
+                                start_date='2018-01-01',
+                                exclude_bots=True)
+
+        contributions_count_by_author_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=False,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.assertEqual(result, 2)
+
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_author')
+    @mock.patch('broomstick.metrics.factors.gm.contributions_count_by_org')
+    def test_concentration_factors(self,
+                                   contributions_count_by_org_mock,
+                                   contributions_count_by_author_mock):
+        """Test concentration metrics are computed from a single fetch.
+        """
+
+        contributions_count_by_org_mock.return_value = pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Nanosoft'],
+            'contributions': [175, 165, 30]
+        })
+
+        result = fm.concentration_factors(DataSource.GIT,
+                                          start_date='2018-01-01',
+                                          end_date='2020-01-01')
+
+        self.assertEqual(contributions_count_by_org_mock.call_count, 1)
+        contributions_count_by_author_mock.assert_not_called()
+        self.assertEqual(result['factor'], 2)
+        self.assertEqual(result['contributors'], 3)
+        self.assertAlmostEqual(result['gini'], 0.261261, places=6)
+
+        with self.assertRaises(ValueError):
+            fm.concentration_factors(DataSource.GIT,
+                                     start_date='2018-01-01',
+                                     level='file')
+
+    def test_elephant_factor_from_pages(self):
+        """Test pages are only consumed until the threshold is reached.
+        """
+
+        consumed = []
+
+        def pages():
+            for contribs in [[50, 20], [10, 8, 5, 3], [2, 1, 1]]:
+                consumed.append(contribs)
+                yield pandas.DataFrame({'contributions': contribs})
+
+        self.assertEqual(fm.elephant_factor_from_pages(pages(), 50), 1)
+        self.assertEqual(len(consumed), 1)
+
+        consumed.clear()
+        self.assertEqual(fm.elephant_factor_from_pages(pages(), 85), 4)
+        self.assertEqual(len(consumed), 2)
+
+        consumed.clear()
+        self.assertEqual(fm.elephant_factor_from_pages(pages(), 1000), 9)
+        self.assertEqual(len(consumed), 3)
+
+        self.assertEqual(fm.elephant_factor_from_pages(iter([]), 10), 0)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -58,7 +58,11 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 1020)
 
@@ -75,7 +79,11 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 2022)
 
@@ -93,7 +101,11 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 111)
 
@@ -112,10 +124,39 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 9990)
 
+        # Test excluding bots and merges
+        #
+
+        contributions_count_total_mock.return_value = 8080
+
+        result = gm.contributions_count_total(
+            DataSource.GIT,
+            start_date=start_date,
+            exclude_bots=True,
+            exclude_merges=True,
+            include_orgs=None,
+            exclude_orgs=None)
+
+        contributions_count_total_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date=start_date,
+            end_date=None,
+            exclude_unknown=True,
+            exclude_bots=True,
+            exclude_merges=True,
+            include_orgs=None,
+            exclude_orgs=None)
+
+        self.assertEqual(result, 8080)
+
     @mock.patch('broomstick.metrics.general.com.contributions_count_unknown')
     def test_contributions_count_unknown(
             self,
@@ -139,7 +180,11 @@ class TestMetricsGeneral(TestCase):
         contributions_count_unknown_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 1020)
 
@@ -155,7 +200,11 @@ class TestMetricsGeneral(TestCase):
         contributions_count_unknown_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 3333)
 
@@ -186,11 +235,19 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_unknown_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=end_date)
+            end_date=end_date,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 50)
 
@@ -208,11 +265,19 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
         contributions_count_unknown_mock.assert_called_with(
             data_source=DataSource.GIT,
             start_date=start_date,
-            end_date=None)
+            end_date=None,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         self.assertEqual(result, 2)
 
@@ -249,7 +314,11 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         assert_frame_equal(result, expected_df)
 
@@ -264,7 +333,11 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=True)
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         assert_frame_equal(result, expected_df)
 
@@ -280,7 +353,11 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=None,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         assert_frame_equal(result, expected_df)
 
@@ -297,7 +374,213 @@ class TestMetricsGeneral(TestCase):
             data_source=DataSource.GIT,
             start_date=start_date,
             end_date=end_date,
-            exclude_unknown=False)
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+
+        assert_frame_equal(result, expected_df)
+
+    @mock.patch(
+        'broomstick.metrics.general.com.contributions_count_by_author_org')
+    @mock.patch('broomstick.metrics.general.com.contributions_count_by_org')
+    def test_contributions_count_by_org_affiliations(
+            self,
+            contributions_count_by_org_mock,
+            contributions_count_by_author_org_mock):
+        """Test affiliation overrides are applied to organizations.
+        """
+
+        contributions_count_by_org_mock.return_value = pandas.DataFrame({
+            'organization': ['Lled', 'Unknown', 'Lled Inc'],
+            'contributions': [100, 50, 30]
+        })
+        contributions_count_by_author_org_mock.return_value = \
+            pandas.DataFrame({
+                'author': ['a1', 'a2', 'a3'],
+                'organization': ['Lled', 'Unknown', 'Unknown'],
+                'contributions': [100, 40, 10]
+            })
+
+        # Organization aliases only need organizations
+        aliases = pandas.DataFrame({'organization': ['Lled Inc'],
+                                    'affiliation': ['Lled']})
+
+        result = gm.contributions_count_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            affiliations=aliases)
+
+        contributions_count_by_org_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        contributions_count_by_author_org_mock.assert_not_called()
+        assert_frame_equal(result, pandas.DataFrame({
+            'organization': ['Lled'], 'contributions': [130]}))
+
+        # Re-affiliated authors need authors
+        overrides = pandas.DataFrame({'author': ['a2'],
+                                      'affiliation': ['Marble']})
+
+        result = gm.contributions_count_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            exclude_unknown=False,
+            affiliations=overrides)
+
+        contributions_count_by_author_org_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        assert_frame_equal(result, pandas.DataFrame({
+            'organization': ['Lled', 'Marble', 'Unknown'],
+            'contributions': [100, 40, 10]}))
+
+    @mock.patch('broomstick.metrics.general.com.'
+                'contributions_count_by_author_org_daily')
+    def test_contributions_count_by_org_dated_affiliations(
+            self,
+            contributions_count_by_author_org_daily_mock):
+        """Test dated overrides are applied to contributions by day.
+        """
+
+        contributions_count_by_author_org_daily_mock.return_value = \
+            pandas.DataFrame({
+                'day': pandas.to_datetime(['2014-01-01', '2016-01-01'],
+                                          utc=True),
+                'author': ['a1', 'a1'],
+                'organization': ['Lled', 'Lled'],
+                'contributions': [10, 5]
+            })
+
+        overrides = pandas.DataFrame({'author': ['a1'],
+                                      'affiliation': ['Marble'],
+                                      'end': ['2015-01-01']})
+
+        result = gm.contributions_count_by_org(
+            DataSource.GIT,
+            start_date='2010-01-01',
+            affiliations=overrides)
+
+        contributions_count_by_author_org_daily_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2010-01-01',
+            end_date=None,
+            exclude_unknown=False,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        assert_frame_equal(result, pandas.DataFrame({
+            'organization': ['Marble', 'Lled'],
+            'contributions': [10, 5]}))
+
+    @mock.patch(
+        'broomstick.metrics.general.com.contributions_count_by_org_preview')
+    @mock.patch(
+        'broomstick.metrics.general.com.contributions_count_total_preview')
+    def test_contributions_preview(
+            self,
+            contributions_count_total_preview_mock,
+            contributions_count_by_org_preview_mock):
+        """Test preview mode estimates contributions from a sample.
+        """
+
+        estimate = {'value': 1000, 'error': 20.0,
+                    'sampled': 500, 'population': 1000}
+        contributions_count_total_preview_mock.return_value = estimate
+
+        result = gm.contributions_count_total(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            mode='preview')
+
+        contributions_count_total_preview_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=True,
+            exclude_bots=False,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.assertEqual(result, estimate)
+
+        expected_df = pandas.DataFrame({
+            'organization': ['Lled'], 'contributions': [1000],
+            'error': [20.0]})
+        contributions_count_by_org_preview_mock.return_value = expected_df
+
+        result = gm.contributions_count_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            exclude_bots=True,
+            mode='preview')
+
+        contributions_count_by_org_preview_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=True,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        assert_frame_equal(result, expected_df)
+
+        # Unknown modes and overrides of estimates are rejected
+        with self.assertRaises(ValueError):
+            gm.contributions_count_total(DataSource.GIT,
+                                         start_date='2018-01-01',
+                                         mode='guess')
+        with self.assertRaises(ValueError):
+            gm.contributions_count_by_org(DataSource.GIT,
+                                          start_date='2018-01-01',
+                                          affiliations=expected_df,
+                                          mode='preview')
+
+    @mock.patch(
+        'broomstick.metrics.general.com.contributions_count_by_author_org')
+    def test_contributions_count_by_author_org(
+            self,
+            contributions_count_by_author_org_mock):
+        """Test count contributions by author and organization method.
+        """
+
+        expected_df = pandas.DataFrame({
+            'author': ['a1b2', 'a1b2'],
+            'organization': ['Marble', 'Lled'],
+            'contributions': [300, 3]
+        })
+
+        contributions_count_by_author_org_mock.return_value = expected_df
+
+        result = gm.contributions_count_by_author_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            exclude_bots=True)
+
+        contributions_count_by_author_org_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date=None,
+            exclude_unknown=False,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
 
         assert_frame_equal(result, expected_df)
 
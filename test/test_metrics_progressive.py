@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import pandas
+import sys
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from pandas.testing import assert_frame_equal
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.metrics import progressive as pm
+from broomstick.core import DataSource
+
+
+SLICES = {
+    '2018-01-01T00:00:00Z': pandas.DataFrame(
+        {'organization': ['Lled', 'Marble'], 'contributions': [100, 20]}),
+    '2018-01-03T00:00:00Z': pandas.DataFrame(
+        {'organization': ['Marble', 'Nanosoft'], 'contributions': [200, 5]})
+}
+
+
+def count_slice(start_date, **kwargs):
+    return SLICES[start_date]
+
+
+class TestMetricsProgressive(TestCase):
+
+    def test_time_slices(self):
+        """Test date ranges are split into contiguous slices.
+        """
+
+        result = pm.time_slices('2018-01-01', '2018-01-05', slices=2)
+
+        self.assertEqual(result,
+                         [('2018-01-01T00:00:00Z', '2018-01-03T00:00:00Z'),
+                          ('2018-01-03T00:00:00Z', '2018-01-05T00:00:00Z')])
+
+        # Empty ranges still have a slice
+        result = pm.time_slices('2018-01-01', '2018-01-01', slices=2)
+
+        self.assertEqual(result,
+                         [('2018-01-01T00:00:00Z', '2018-01-01T00:00:00Z')])
+
+    @mock.patch(
+        'broomstick.metrics.progressive.gm.contributions_count_by_org',
+        side_effect=count_slice)
+    def test_progressive_contributions_by_org(
+            self,
+            contributions_count_by_org_mock):
+        """Test a running per-org table is yielded as slices complete.
+        """
+
+        results = list(pm.progressive_contributions_by_org(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            end_date='2018-01-05',
+            exclude_bots=True,
+            slices=2))
+
+        contributions_count_by_org_mock.assert_any_call(
+            data_source=DataSource.GIT,
+            start_date='2018-01-03T00:00:00Z',
+            end_date='2018-01-05T00:00:00Z',
+            exclude_unknown=True,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+
+        self.assertEqual([progress for progress, _ in results], [0.5, 1.0])
+
+        expected_df = pandas.DataFrame(
+            {'organization': ['Marble', 'Lled', 'Nanosoft'],
+             'contributions': [220, 100, 5]},
+            columns=['organization', 'contributions'])
+        assert_frame_equal(results[-1][1], expected_df)
+
+    @mock.patch('broomstick.metrics.progressive.gm.contributions_count_by_org')
+    def test_progressive_stop_early(self, contributions_count_by_org_mock):
+        """Test pending slices are cancelled when consumers stop early.
+        """
+
+        release = threading.Event()
+
+        def slow_slice(start_date, **kwargs):
+            if start_date != '2018-01-01T00:00:00Z':
+                release.wait(timeout=5)
+            return SLICES['2018-01-01T00:00:00Z']
+
+        contributions_count_by_org_mock.side_effect = slow_slice
+        shutdown = ThreadPoolExecutor.shutdown
+
+        with mock.patch.object(ThreadPoolExecutor, 'shutdown', autospec=True,
+                               side_effect=shutdown) as shutdown_mock:
+            results = pm.progressive_contributions_by_org(
+                DataSource.GIT,
+                start_date='2018-01-01',
+                end_date='2018-01-05',
+                slices=4,
+                max_workers=1)
+
+            self.assertEqual(next(results)[0], 0.25)
+            results.close()
+            release.set()
+
+        shutdown_mock.assert_called_once_with(mock.ANY, wait=False)
+        self.assertLessEqual(contributions_count_by_org_mock.call_count, 2)
+
+    @mock.patch(
+        'broomstick.metrics.progressive.gm.contributions_count_by_org',
+        side_effect=count_slice)
+    def test_progressive_elephant_factor(
+            self,
+            contributions_count_by_org_mock):
+        """Test the Elephant Factor is refined as slices complete.
+        """
+
+        results = list(pm.progressive_elephant_factor(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            end_date='2018-01-05',
+            slices=2,
+            max_workers=1))
+
+        # With a single worker slices complete in order
+        self.assertEqual(results, [(0.5, 1), (1.0, 1)])
+
+        results = list(pm.progressive_elephant_factor(
+            DataSource.GIT,
+            start_date='2018-01-01',
+            end_date='2018-01-05',
+            threshold=0.9,
+            slices=2,
+            max_workers=1))
+
+        self.assertEqual(results, [(0.5, 2), (1.0, 2)])
+
+    def test_refine_preview(self):
+        """Test previews are followed by exact results.
+        """
+
+        metric = mock.MagicMock(
+            side_effect=lambda mode, **kwargs: 3 if mode == 'exact' else 2)
+
+        results = list(pm.refine_preview(metric,
+                                         data_source=DataSource.GIT,
+                                         start_date='2018-01-01'))
+
+        self.assertEqual(results, [('preview', 2), ('exact', 3)])
+        metric.assert_any_call(mode='exact',
+                               data_source=DataSource.GIT,
+                               start_date='2018-01-01')
+        metric.assert_any_call(mode='preview',
+                               data_source=DataSource.GIT,
+                               start_date='2018-01-01')
+
+    def test_refine_preview_stop_early(self):
+        """Test consumers only wanting the preview don't wait for more.
+        """
+
+        release = threading.Event()
+        done = threading.Event()
+
+        def metric(mode, **kwargs):
+            if mode == 'exact':
+                release.wait(timeout=5)
+                done.set()
+            return mode
+
+        results = pm.refine_preview(metric, data_source=DataSource.GIT)
+
+        self.assertEqual(next(results), ('preview', 'preview'))
+
+        try:
+            # Returns while the exact value is still being computed
+            results.close()
+            self.assertFalse(done.is_set())
+        finally:
+            release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
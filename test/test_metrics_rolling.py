@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import pandas
+import sys
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick.metrics import rolling as rm
+from broomstick.core import DataSource
+
+
+DAILY_DF = pandas.DataFrame({
+    'day': pandas.to_datetime(['2020-01-01', '2020-01-02', '2020-01-05',
+                               '2020-01-09', '2020-01-10'], utc=True),
+    'organization': pandas.Categorical(['A', 'B', 'A', 'B', 'C']),
+    'contributions': [1, 2, 3, 4, 5]
+})
+
+
+@mock.patch('broomstick.metrics.rolling.gm.contributions_count_by_org_daily',
+            return_value=DAILY_DF)
+class TestMetricsRolling(TestCase):
+
+    def test_single_fetch(self, daily_mock):
+        """Test daily data is fetched once for every window and date.
+        """
+
+        rm.rolling_windows(DataSource.GIT,
+                           start_date='2020-01-05',
+                           end_date='2020-01-11',
+                           windows=(3, 7),
+                           step='3D',
+                           exclude_bots=True)
+
+        daily_mock.assert_called_once_with(
+            data_source=DataSource.GIT,
+            start_date='2019-12-28T00:00:00+00:00',
+            end_date='2020-01-11T00:00:00+00:00',
+            exclude_unknown=True,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+
+    def test_rolling_windows(self, daily_mock):
+        """Test windows cover the whole days before each date.
+        """
+
+        dates, orgs, sums = rm.rolling_windows(DataSource.GIT,
+                                               start_date='2020-01-05',
+                                               end_date='2020-01-11',
+                                               windows=(3, 7),
+                                               step='3D')
+
+        self.assertEqual([str(d.date()) for d in dates],
+                         ['2020-01-05', '2020-01-08', '2020-01-11'])
+        self.assertEqual(orgs, ['A', 'B', 'C'])
+        self.assertEqual(sums.shape, (2, 3, 3))
+
+        # 3 days window
+        self.assertEqual(sums[0].tolist(), [[0, 2, 0],
+                                            [3, 0, 0],
+                                            [0, 4, 5]])
+        # 7 days window
+        self.assertEqual(sums[1].tolist(), [[1, 2, 0],
+                                            [4, 2, 0],
+                                            [3, 4, 5]])
+
+    def test_rolling_contributions_by_org(self, daily_mock):
+        """Test tidy contributions by organization.
+        """
+
+        df = rm.rolling_contributions_by_org(DataSource.GIT,
+                                             start_date='2020-01-05',
+                                             end_date='2020-01-11',
+                                             windows=(7,),
+                                             step='3D')
+
+        last = df[df['date'] == pandas.Timestamp('2020-01-11', tz='UTC')]
+        self.assertEqual(list(last['organization']), ['C', 'B', 'A'])
+        self.assertEqual(list(last['contributions']), [5, 4, 3])
+        self.assertEqual(len(df), 7)
+
+    def test_rolling_contributions_count_total(self, daily_mock):
+        """Test total contributions per window.
+        """
+
+        df = rm.rolling_contributions_count_total(DataSource.GIT,
+                                                  start_date='2020-01-05',
+                                                  end_date='2020-01-11',
+                                                  windows=(3, 7),
+                                                  step='3D')
+
+        self.assertEqual(list(df.columns),
+                         ['date', 'window', 'contributions'])
+        self.assertEqual(list(df['window']), [3, 7, 3, 7, 3, 7])
+        self.assertEqual(list(df['contributions']), [2, 3, 3, 6, 9, 12])
+
+    def test_rolling_elephant_factor(self, daily_mock):
+        """Test elephant factor per window.
+        """
+
+        df = rm.rolling_elephant_factor(DataSource.GIT,
+                                        start_date='2020-01-05',
+                                        end_date='2020-01-11',
+                                        windows=(3, 7),
+                                        step='3D')
+
+        self.assertEqual(list(df['elephant_factor']), [1, 1, 1, 1, 1, 2])
+
+        df = rm.rolling_elephant_factor(DataSource.GIT,
+                                        start_date='2020-01-05',
+                                        end_date='2020-01-11',
+                                        windows=(7,),
+                                        step='3D',
+                                        threshold=0.9)
+
+        self.assertEqual(list(df['elephant_factor']), [2, 2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
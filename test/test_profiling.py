@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import json
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import unittest
+
+from unittest import TestCase, mock
+from unittest.mock import MagicMock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+import broomstick
+
+from broomstick import profiling as prof
+from broomstick.data.es import resilience as rs
+
+
+class TestProfiling(TestCase):
+
+    def test_stage_disabled(self):
+        """Test stages are not recorded when not profiling.
+        """
+
+        with prof.stage('http'):
+            pass
+
+        with broomstick.profile() as profiler:
+            pass
+
+        self.assertEqual(profiler.records, [])
+        self.assertEqual(list(profiler.summary().columns),
+                         prof.SUMMARY_COLUMNS)
+
+    def test_profile(self):
+        """Test nested stages are recorded with their time and memory.
+        """
+
+        with prof.profile() as profiler:
+            with prof.stage('metric'):
+                with prof.stage('http'):
+                    pass
+                with prof.stage('frame'):
+                    data = bytearray(10 ** 6)
+                    del data
+                with prof.stage('frame'):
+                    pass
+
+        summary = profiler.summary()
+
+        # Slowest stages first
+        self.assertEqual(summary['stage'][0], 'metric')
+        self.assertTrue(summary['wall'].is_monotonic_decreasing)
+
+        stages = summary.set_index('stage')
+
+        self.assertEqual(set(stages.index),
+                         {'metric', 'metric/http', 'metric/frame'})
+        self.assertEqual(stages.loc['metric/frame', 'calls'], 2)
+        self.assertGreaterEqual(stages.loc['metric', 'wall'],
+                                stages.loc['metric/frame', 'wall'])
+
+        # Peaks of nested stages count for the stages they are nested in
+        self.assertGreaterEqual(stages.loc['metric/frame', 'peak_memory'],
+                                10 ** 6)
+        self.assertGreaterEqual(stages.loc['metric', 'peak_memory'], 10 ** 6)
+        self.assertLess(stages.loc['metric/http', 'peak_memory'], 10 ** 6)
+
+    def test_profile_without_reset_peak(self):
+        """Test peaks are tracked without `tracemalloc.reset_peak`.
+        """
+
+        # Python < 3.9
+        tracemalloc = MagicMock(wraps=prof.tracemalloc, spec=[
+            'start', 'stop', 'is_tracing', 'get_traced_memory',
+            'clear_traces'])
+
+        with mock.patch('broomstick.profiling.tracemalloc', tracemalloc):
+            with prof.profile() as profiler:
+                with prof.stage('metric'):
+                    with prof.stage('frame'):
+                        data = bytearray(10 ** 6)
+                        del data
+                    with prof.stage('http'):
+                        pass
+
+        stages = profiler.summary().set_index('stage')
+
+        self.assertTrue(tracemalloc.clear_traces.called)
+        self.assertGreaterEqual(stages.loc['metric/frame', 'peak_memory'],
+                                10 ** 6)
+        self.assertGreaterEqual(stages.loc['metric', 'peak_memory'], 10 ** 6)
+        self.assertLess(stages.loc['metric/http', 'peak_memory'], 10 ** 6)
+
+    def test_profile_threads(self):
+        """Test stages of each thread are nested separately.
+        """
+
+        def work():
+            with prof.stage('worker'):
+                pass
+
+        with prof.profile(memory=False) as profiler:
+            with prof.stage('main'):
+                thread = threading.Thread(target=work)
+                thread.start()
+                thread.join()
+
+        self.assertEqual(sorted(r.path for r in profiler.records),
+                         ['main', 'worker'])
+        self.assertTrue(all(r.peak == 0 for r in profiler.records))
+
+    def test_profile_nested(self):
+        """Test profiling cannot be enabled twice.
+        """
+
+        with prof.profile():
+            with self.assertRaises(RuntimeError):
+                with prof.profile():
+                    pass
+
+    def test_profiled(self):
+        """Test decorated functions run as stages.
+        """
+
+        @prof.profiled()
+        def compute(x):
+            """Doubles x."""
+            return 2 * x
+
+        with prof.profile() as profiler:
+            self.assertEqual(compute(2), 4)
+
+        self.assertEqual(compute.__name__, 'compute')
+        self.assertEqual(compute.__doc__, 'Doubles x.')
+        self.assertEqual([r.path for r in profiler.records], ['compute'])
+
+    def test_execute_stages(self):
+        """Test searches are split in HTTP and response conversion stages.
+        """
+
+        rs.reset_breakers()
+
+        s = MagicMock()
+        s.params.return_value = s
+        s.execute.return_value.to_dict.return_value = {'hits': {}}
+
+        with prof.profile() as profiler:
+            rs.execute(s)
+
+        self.assertEqual([r.path for r in profiler.records],
+                         ['http', 'to_dict'])
+
+    def test_dumps(self):
+        """Test cProfile stats and speedscope timelines are written.
+        """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats_path = os.path.join(tmp_dir, 'out.prof')
+            speedscope_path = os.path.join(tmp_dir, 'out.speedscope.json')
+
+            with prof.profile(cprofile=stats_path,
+                              speedscope=speedscope_path):
+                with prof.stage('metric'):
+                    with prof.stage('http'):
+                        pass
+
+            self.assertTrue(pstats.Stats(stats_path).total_calls > 0)
+
+            with open(speedscope_path) as f:
+                timeline = json.load(f)
+
+        self.assertEqual(timeline['$schema'], prof.SPEEDSCOPE_SCHEMA)
+        self.assertEqual(timeline['shared']['frames'],
+                         [{'name': 'metric'}, {'name': 'http'}])
+
+        events = timeline['profiles'][0]['events']
+
+        self.assertEqual([(e['type'], e['frame']) for e in events],
+                         [('O', 0), ('O', 1), ('C', 1), ('C', 0)])
+        self.assertEqual(timeline['profiles'][0]['endValue'],
+                         events[-1]['at'])
+
+
+if __name__ == '__main__':
+    unittest.main()
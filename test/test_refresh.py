@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import io
+import json
+import os
+import pandas
+import sys
+import tempfile
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import refresh
+from broomstick.core import DataSource
+
+
+def daily_frame(days, orgs, contributions):
+    return pandas.DataFrame({
+        'day': pandas.to_datetime(days, utc=True),
+        'organization': pandas.Categorical(orgs),
+        'contributions': contributions
+    })
+
+
+FULL_DF = daily_frame(['2020-01-01', '2020-01-01', '2020-01-02'],
+                      ['Lled', 'Marble', 'Lled'], [2, 1, 1])
+
+CHANGED_DF = daily_frame(['2020-01-02', '2020-01-03'],
+                         ['Marble', 'Bitergia'], [5, 1])
+
+
+@mock.patch('broomstick.metrics.general.contributions_count_by_org_daily')
+@mock.patch('broomstick.data.es.common.enriched_days')
+@mock.patch('broomstick.data.es.common.last_enriched')
+class TestRefresh(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'cache.sqlite')
+        self.conn = refresh.connect(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_first_refresh(self, last_mock, days_mock, daily_mock):
+        """Test the first refresh counts every contribution.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        summary = refresh.refresh(self.conn, DataSource.GIT, '2019-12-31',
+                                  exclude_bots=True)
+
+        daily_mock.assert_called_once_with(data_source=DataSource.GIT,
+                                           start_date='2019-12-31',
+                                           exclude_unknown=True,
+                                           exclude_bots=True,
+                                           exclude_merges=False,
+                                           include_orgs=None,
+                                           exclude_orgs=None)
+        days_mock.assert_not_called()
+        self.assertEqual(summary['checkpoint'], 1000)
+        self.assertEqual(summary['days'], 2)
+        self.assertTrue(summary['full'])
+
+        df = refresh.contributions_by_org(self.conn, summary['aggregate'])
+
+        self.assertEqual(list(df['organization']), ['Lled', 'Marble'])
+        self.assertEqual(list(df['contributions']), [3, 1])
+
+    def test_incremental_refresh(self, last_mock, days_mock, daily_mock):
+        """Test only the days of new documents are counted again.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        aggregate = refresh.refresh(self.conn, DataSource.GIT,
+                                    '2019-12-31')['aggregate']
+
+        last_mock.return_value = 2000
+        days_mock.return_value = pandas.to_datetime(
+            ['2019-12-01', '2020-01-02', '2020-01-03'], utc=True)
+        daily_mock.return_value = CHANGED_DF
+
+        summary = refresh.refresh(self.conn, DataSource.GIT, '2019-12-31',
+                                  lag=0.5)
+
+        days_mock.assert_called_once_with(DataSource.GIT,
+                                          since=500, until=2000)
+        self.assertEqual(list(daily_mock.call_args[1]['days']),
+                         list(pandas.to_datetime(['2020-01-02', '2020-01-03'],
+                                                 utc=True)))
+        self.assertEqual(summary, {'aggregate': aggregate,
+                                   'checkpoint': 2000,
+                                   'days': 2,
+                                   'full': False})
+
+        df = refresh.contributions_by_org(self.conn, aggregate)
+
+        self.assertEqual(list(df['organization']),
+                         ['Marble', 'Lled', 'Bitergia'])
+        self.assertEqual(list(df['contributions']), [6, 2, 1])
+        self.assertEqual(refresh.elephant_factor(self.conn, aggregate), 1)
+
+        # Totals match the sum of the days
+        df = refresh.contributions_by_org(self.conn, aggregate,
+                                          start_date='2019-12-31')
+
+        self.assertEqual(list(df['contributions']), [6, 2, 1])
+
+    def test_no_changes(self, last_mock, days_mock, daily_mock):
+        """Test refreshes without new documents don't count anything.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        aggregate = refresh.refresh(self.conn, DataSource.GIT,
+                                    '2019-12-31')['aggregate']
+
+        days_mock.return_value = pandas.DatetimeIndex([], tz='UTC')
+        daily_mock.reset_mock()
+
+        summary = refresh.refresh(self.conn, DataSource.GIT, '2019-12-31')
+
+        daily_mock.assert_not_called()
+        self.assertEqual(summary['days'], 0)
+        self.assertEqual(list(refresh.contributions_by_org(
+            self.conn, aggregate)['contributions']), [3, 1])
+
+    def test_full_refresh(self, last_mock, days_mock, daily_mock):
+        """Test full refreshes replace every cached day.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        aggregate = refresh.refresh(self.conn, DataSource.GIT,
+                                    '2019-12-31')['aggregate']
+
+        daily_mock.return_value = CHANGED_DF
+
+        refresh.refresh(self.conn, DataSource.GIT, '2019-12-31', full=True)
+
+        days_mock.assert_not_called()
+        df = refresh.contributions_by_org(self.conn, aggregate)
+
+        self.assertEqual(list(df['organization']), ['Marble', 'Bitergia'])
+        self.assertEqual(list(df['contributions']), [5, 1])
+
+    def test_windows(self, last_mock, days_mock, daily_mock):
+        """Test contributions of a range of whole days.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        aggregate = refresh.refresh(self.conn, DataSource.GIT,
+                                    '2019-12-31')['aggregate']
+
+        df = refresh.contributions_by_org(self.conn, aggregate,
+                                          start_date='2020-01-01',
+                                          end_date='2020-01-02')
+
+        self.assertEqual(list(df['organization']), ['Lled'])
+        self.assertEqual(list(df['contributions']), [1])
+
+        df = refresh.contributions_by_org(self.conn, aggregate,
+                                          end_date='2020-01-01T10:00:00')
+
+        self.assertEqual(list(df['contributions']), [2, 1])
+
+    def test_aggregate_per_params(self, last_mock, days_mock, daily_mock):
+        """Test each set of params is cached and checkpointed apart.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        first = refresh.refresh(self.conn, DataSource.GIT, '2019-12-31')
+        other = refresh.refresh(self.conn, DataSource.GIT, '2019-12-31',
+                                exclude_merges=True)
+
+        self.assertNotEqual(first['aggregate'], other['aggregate'])
+        self.assertTrue(other['full'])
+
+    @mock.patch('broomstick.data.es.common.create_es_connection')
+    def test_main(self, connection_mock, last_mock, days_mock, daily_mock):
+        """Test the command line refreshes every data source.
+        """
+        last_mock.return_value = 1000
+        daily_mock.return_value = FULL_DF
+
+        with mock.patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            code = refresh.main(['-d', self.path, '-s', 'git',
+                                 '--start-date', '2019-12-31',
+                                 '--exclude-bots'])
+
+        self.assertEqual(code, 0)
+        connection_mock.assert_called_once_with(config_file='.settings')
+        self.assertEqual(daily_mock.call_args[1]['exclude_bots'], True)
+
+        summary = json.loads(stdout.getvalue())
+
+        self.assertEqual(summary['data_source'], 'git')
+        self.assertEqual(summary['elephant_factor'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+import datetime
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import report
+from broomstick.core import DataSource
+
+
+SPEC = {
+    'data_sources': ['git', 'all'],
+    'windows': ['2019-01-01:2020-01-01'],
+    'params': {'exclude_bots': True, 'exclude_orgs': ['Lled', 'Marble']},
+    'metrics': [
+        'contributions_count_total',
+        {'name': 'elephant_factor', 'params': {'threshold': 0.8}},
+        'contributions_unknown_percentage',
+        'pony_factor',
+        {'name': 'concentration_factors', 'params': {'level': 'author'}}
+    ]
+}
+
+QUERY = '{"exclude_bots": true, "exclude_orgs": ["Lled", "Marble"]}'
+
+RESPONSE = {
+    'aggregations': {
+        'total_contribs': {'value': 400},
+        'unknown': {'doc_count': 100, 'unknown_contribs': {'value': 100}},
+        'organizations': {
+            'buckets': [
+                {'key': 'Lled', 'doc_count': 175,
+                 'total_contribs': {'value': 175}},
+                {'key': 'Unknown', 'doc_count': 100,
+                 'total_contribs': {'value': 100}},
+                {'key': 'Marble', 'doc_count': 95,
+                 'total_contribs': {'value': 95}},
+                {'key': 'Nanosoft', 'doc_count': 30,
+                 'total_contribs': {'value': 30}}
+            ]
+        }
+    }
+}
+
+
+class TestReport(TestCase):
+
+    def test_load_spec(self):
+        """Test specifications are read from YAML and JSON files.
+        """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            json_path = os.path.join(tmp_dir, 'report.json')
+            with open(json_path, 'w') as f:
+                json.dump(SPEC, f)
+
+            yaml_path = os.path.join(tmp_dir, 'report.yaml')
+            with open(yaml_path, 'w') as f:
+                f.write("data_sources: [git]\n"
+                        "windows:\n"
+                        "  - {start: 2019-01-01}\n"
+                        "metrics: [elephant_factor]\n")
+
+            self.assertEqual(report.load_spec(json_path), SPEC)
+            self.assertEqual(report.load_spec(yaml_path), {
+                'data_sources': ['git'],
+                'windows': [{'start': datetime.date(2019, 1, 1)}],
+                'metrics': ['elephant_factor']
+            })
+
+    def test_parse_window(self):
+        """Test windows can be strings or dicts.
+        """
+
+        self.assertEqual(report.parse_window('2019-01-01:2020-01-01'),
+                         ('2019-01-01', '2020-01-01'))
+        self.assertEqual(report.parse_window('2019-01-01'),
+                         ('2019-01-01', None))
+        self.assertEqual(
+            report.parse_window({'start': datetime.date(2019, 1, 1),
+                                 'end': datetime.date(2020, 1, 1)}),
+            ('2019-01-01', '2020-01-01'))
+
+    def test_compile_spec(self):
+        """Test organization metrics share a search per data source.
+        """
+
+        plan = report.compile_spec(SPEC)
+
+        self.assertEqual(list(plan.summaries), [
+            (DataSource.GIT, '2019-01-01', '2020-01-01', QUERY),
+            (DataSource.ALL, '2019-01-01', '2020-01-01', QUERY)
+        ])
+        self.assertEqual(
+            [task.metric for task in plan.summaries[
+                (DataSource.GIT, '2019-01-01', '2020-01-01', QUERY)]],
+            ['contributions_count_total', 'elephant_factor',
+             'contributions_unknown_percentage'])
+
+        # Author level metrics are run on their own
+        self.assertEqual(
+            [(task.metric, task.data_source) for task in plan.standalone],
+            [('pony_factor', DataSource.GIT),
+             ('pony_factor', DataSource.ALL),
+             ('concentration_factors', DataSource.GIT),
+             ('concentration_factors', DataSource.ALL)])
+        self.assertEqual(plan.standalone[-1].params,
+                         {'level': 'author', 'exclude_bots': True,
+                          'exclude_orgs': ['Lled', 'Marble']})
+
+    @mock.patch('broomstick.runner.run_metric')
+    @mock.patch('broomstick.data.es.common.multi_search')
+    @mock.patch('broomstick.data.es.common.org_summary_search')
+    def test_run_plan(self, org_summary_search_mock, multi_search_mock,
+                      run_metric_mock):
+        """Test summary searches are batched into a single request.
+        """
+
+        org_summary_search_mock.side_effect = \
+            lambda data_source, **kwargs: data_source
+        multi_search_mock.return_value = [RESPONSE, RESPONSE]
+        run_metric_mock.return_value = [{'metric': 'standalone'}]
+
+        spec = dict(SPEC, metrics=SPEC['metrics'][:3] + ['pony_factor'])
+        records = report.run_plan(report.compile_spec(spec), jobs=2)
+
+        org_summary_search_mock.assert_called_with(
+            data_source=DataSource.ALL,
+            start_date='2019-01-01',
+            end_date='2020-01-01',
+            exclude_bots=True,
+            exclude_orgs=['Lled', 'Marble'])
+        multi_search_mock.assert_called_once_with([DataSource.GIT,
+                                                   DataSource.ALL])
+        run_metric_mock.assert_called_with('pony_factor', DataSource.ALL,
+                                           '2019-01-01', '2020-01-01',
+                                           exclude_bots=True,
+                                           exclude_orgs=['Lled', 'Marble'])
+
+        self.assertEqual(records[:3], [
+            {'metric': 'contributions_count_total', 'data_source': 'git',
+             'start_date': '2019-01-01', 'end_date': '2020-01-01',
+             'value': 300},
+            {'metric': 'elephant_factor', 'data_source': 'git',
+             'start_date': '2019-01-01', 'end_date': '2020-01-01',
+             'value': 2},
+            {'metric': 'contributions_unknown_percentage',
+             'data_source': 'git',
+             'start_date': '2019-01-01', 'end_date': '2020-01-01',
+             'value': 25.0}
+        ])
+        self.assertEqual(len(records), 8)
+        self.assertEqual(records[-2:], [{'metric': 'standalone'}] * 2)
+
+    @mock.patch('broomstick.runner.run_metric')
+    @mock.patch('broomstick.data.es.common.multi_search')
+    @mock.patch('broomstick.data.es.common.org_summary_search')
+    def test_run_plan_parallel(self, org_summary_search_mock,
+                               multi_search_mock, run_metric_mock):
+        """Test batches and standalone tasks run at the same time.
+        """
+
+        started = threading.Event()
+
+        def multi_search(searches):
+            # Only returns once a standalone task is running
+            self.assertTrue(started.wait(timeout=5))
+            return [RESPONSE] * len(searches)
+
+        def run_metric(*args, **kwargs):
+            started.set()
+            return [{'metric': 'standalone'}]
+
+        multi_search_mock.side_effect = multi_search
+        run_metric_mock.side_effect = run_metric
+
+        spec = dict(SPEC, metrics=SPEC['metrics'][:1] + ['pony_factor'])
+        records = report.run_plan(report.compile_spec(spec), jobs=2)
+
+        self.assertEqual(len(records), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
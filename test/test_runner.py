@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import pandas
+import sys
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import runner
+from broomstick.core import DataSource
+
+
+class TestRunner(TestCase):
+
+    def test_get_metric(self):
+        """Test metric functions are resolved by name.
+        """
+
+        from broomstick.metrics import factors as fm
+
+        self.assertIs(runner.get_metric('elephant_factor'),
+                      fm.elephant_factor)
+
+        with self.assertRaises(ValueError):
+            runner.get_metric('unknown_metric')
+
+    def test_parse_data_source(self):
+        """Test data sources are parsed case insensitively.
+        """
+
+        self.assertEqual(runner.parse_data_source('git'), DataSource.GIT)
+        self.assertEqual(runner.parse_data_source('ALL'), DataSource.ALL)
+        self.assertEqual(runner.parse_data_source(DataSource.GIT),
+                         DataSource.GIT)
+
+        with self.assertRaises(ValueError):
+            runner.parse_data_source('jira')
+
+    @mock.patch('broomstick.metrics.general.com.contributions_count_total')
+    def test_run_metric_scalar(self, contributions_count_total_mock):
+        """Test running a metric returning a single value.
+        """
+
+        contributions_count_total_mock.return_value = 1020
+
+        records = runner.run_metric('contributions_count_total', 'git',
+                                    '2018-01-01', '2020-01-01',
+                                    exclude_bots=True,
+                                    print_dist=True)
+
+        contributions_count_total_mock.assert_called_with(
+            data_source=DataSource.GIT,
+            start_date='2018-01-01',
+            end_date='2020-01-01',
+            exclude_unknown=True,
+            exclude_bots=True,
+            exclude_merges=False,
+            include_orgs=None,
+            exclude_orgs=None)
+        self.assertEqual(records, [{
+            'metric': 'contributions_count_total',
+            'data_source': 'git',
+            'start_date': '2018-01-01',
+            'end_date': '2020-01-01',
+            'value': 1020
+        }])
+
+    @mock.patch('broomstick.metrics.factors.elephant_factor')
+    def test_run_metric_defaults(self, elephant_factor_mock):
+        """Test metric defaults override the given params.
+        """
+
+        elephant_factor_mock.return_value = 2
+
+        records = runner.run_metric('elephant_factor', DataSource.ALL,
+                                    '2018-01-01', print_dist=True)
+
+        elephant_factor_mock.assert_called_with(
+            data_source=DataSource.ALL,
+            start_date='2018-01-01',
+            end_date=None,
+            print_dist=False)
+        self.assertEqual(records[0]['value'], 2)
+
+    @mock.patch('broomstick.metrics.factors.pony_factor')
+    def test_run_metric_mode(self, pony_factor_mock):
+        """Test metrics are not computed in modes they don't support.
+        """
+
+        self.assertTrue(runner.supports_mode('elephant_factor', 'preview'))
+        self.assertTrue(runner.supports_mode('pony_factor', 'exact'))
+        self.assertFalse(runner.supports_mode('pony_factor', 'preview'))
+
+        with self.assertRaises(ValueError):
+            runner.run_metric('pony_factor', DataSource.GIT, '2018-01-01',
+                              mode='preview')
+
+        pony_factor_mock.assert_not_called()
+
+    def test_to_records_frame(self):
+        """Test data frames produce one record per row.
+        """
+
+        df = pandas.DataFrame({
+            'organization': ['Lled', 'Marble'],
+            'contributions': [179, 125]
+        })
+
+        records = runner.to_records(df, metric='contributions_count_by_org')
+
+        self.assertEqual(records, [
+            {'metric': 'contributions_count_by_org',
+             'organization': 'Lled', 'contributions': 179},
+            {'metric': 'contributions_count_by_org',
+             'organization': 'Marble', 'contributions': 125}
+        ])
+        self.assertIs(type(records[0]['contributions']), int)
+
+    def test_to_records_dict(self):
+        """Test dicts produce a single record.
+        """
+
+        records = runner.to_records({'factor': 2, 'gini': 0.5},
+                                    metric='concentration_factors')
+
+        self.assertEqual(records, [{'metric': 'concentration_factors',
+                                    'factor': 2, 'gini': 0.5}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2020 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+# Authors:
+#     Alberto Pérez García-Plaza <alpgarcia@bitergia.com>
+#
+
+import asyncio
+import json
+import sys
+import time
+import unittest
+
+from unittest import TestCase, mock
+
+# Make sure we use our code and not any other could we have installed
+sys.path.insert(0, '..')
+
+from broomstick import server
+from broomstick.core import DataSource
+
+
+def slow_metric(metric, data_source, start_date, end_date=None, **params):
+    time.sleep(0.1)
+    return [{'metric': metric, 'value': 2}]
+
+
+class TestTTLCache(TestCase):
+
+    def test_expiration(self):
+        """Test entries are not returned after they expire.
+        """
+
+        cache = server.TTLCache(ttl=0.05)
+        cache.set('key', 'value')
+
+        self.assertEqual(cache.get('key'), 'value')
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual(len(cache), 0)
+
+    def test_eviction(self):
+        """Test the oldest entry is evicted when the cache is full.
+        """
+
+        cache = server.TTLCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(cache.get('c'), 3)
+
+
+class TestMetricsService(TestCase):
+
+    @mock.patch('broomstick.server.runner.run_metric',
+                side_effect=slow_metric)
+    def test_single_flight(self, run_metric_mock):
+        """Test concurrent identical requests run a single computation.
+        """
+
+        service = server.MetricsService()
+
+        async def burst():
+            requests = [service.get('elephant_factor', 'git', '2018-01-01')
+                        for _ in range(10)]
+            requests.append(service.get('elephant_factor', 'all',
+                                        '2018-01-01'))
+            return await asyncio.gather(*requests)
+
+        results = asyncio.run(burst())
+        service.close()
+
+        self.assertEqual(len(results), 11)
+        self.assertTrue(all(r == [{'metric': 'elephant_factor', 'value': 2}]
+                            for r in results))
+        self.assertEqual(run_metric_mock.call_count, 2)
+        run_metric_mock.assert_any_call('elephant_factor', DataSource.GIT,
+                                        '2018-01-01', None)
+
+    @mock.patch('broomstick.server.runner.run_metric',
+                side_effect=slow_metric)
+    def test_cache(self, run_metric_mock):
+        """Test results are served from cache after being computed.
+        """
+
+        service = server.MetricsService(ttl=60)
+
+        async def sequential():
+            first = await service.get('elephant_factor', 'git', '2018-01-01',
+                                      exclude_bots=True)
+            second = await service.get('elephant_factor', 'GIT',
+                                       '2018-01-01', exclude_bots=True)
+            third = await service.get('elephant_factor', 'git', '2018-01-01')
+            return first, second, third
+
+        asyncio.run(sequential())
+        service.close()
+
+        self.assertEqual(run_metric_mock.call_count, 2)
+
+    @mock.patch('broomstick.server.runner.run_metric',
+                side_effect=RuntimeError('boom'))
+    def test_errors_not_cached(self, run_metric_mock):
+        """Test failed computations are not cached.
+        """
+
+        service = server.MetricsService()
+
+        async def failing():
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    await service.get('elephant_factor', 'git', '2018-01-01')
+
+        asyncio.run(failing())
+        service.close()
+
+        self.assertEqual(run_metric_mock.call_count, 2)
+
+
+class TestHTTPServer(TestCase):
+
+    def request(self, target):
+        """Sends a GET request to a test server and returns the response."""
+
+        async def roundtrip():
+            service = server.MetricsService()
+            srv = await server.start_server(service, port=0)
+            port = srv.sockets[0].getsockname()[1]
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write('GET {} HTTP/1.1\r\nHost: test\r\n\r\n'
+                         .format(target).encode('latin-1'))
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+
+            srv.close()
+            await srv.wait_closed()
+            service.close()
+
+            return response
+
+        head, _, body = asyncio.run(roundtrip()).partition(b'\r\n\r\n')
+        status = int(head.split()[1])
+
+        return status, json.loads(body)
+
+    @mock.patch('broomstick.server.runner.run_metric',
+                side_effect=slow_metric)
+    def test_metric(self, run_metric_mock):
+        """Test a metric is computed from the query string.
+        """
+
+        status, body = self.request(
+            '/metrics/elephant_factor?data_source=git&start_date=2018-01-01'
+            '&end_date=2020-01-01&exclude_bots=true'
+            '&exclude_orgs=Lled,Marble')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {'results': [{'metric': 'elephant_factor',
+                                             'value': 2}]})
+        run_metric_mock.assert_called_with('elephant_factor',
+                                           DataSource.GIT,
+                                           '2018-01-01', '2020-01-01',
+                                           exclude_bots=True,
+                                           exclude_orgs=('Lled', 'Marble'))
+
+    @mock.patch('broomstick.server.runner.run_metric',
+                side_effect=slow_metric)
+    def test_metric_typed_params(self, run_metric_mock):
+        """Test params are converted using the metric defaults.
+        """
+
+        status, _ = self.request(
+            '/metrics/elephant_factor?data_source=git&start_date=2018-01-01'
+            '&threshold=0.8&exclude_unknown=false')
+
+        self.assertEqual(status, 200)
+        run_metric_mock.assert_called_with('elephant_factor',
+                                           DataSource.GIT,
+                                           '2018-01-01', None,
+                                           threshold=0.8,
+                                           exclude_unknown=False)
+
+        status, _ = self.request(
+            '/metrics/rolling_elephant_factor?data_source=git'
+            '&start_date=2018-01-01&windows=30,90')
+
+        self.assertEqual(status, 200)
+        run_metric_mock.assert_called_with('rolling_elephant_factor',
+                                           DataSource.GIT,
+                                           '2018-01-01', None,
+                                           windows=(30, 90))
+
+        status, body = self.request(
+            '/metrics/elephant_factor?data_source=git&start_date=2018-01-01'
+            '&threshold=high')
+
+        self.assertEqual(status, 400)
+        self.assertIn('threshold', body['error'])
+
+    def test_parse_param(self):
+        """Test query string values are converted.
+        """
+
+        self.assertEqual(server.parse_param('bins', '10', 20), 10)
+        self.assertEqual(server.parse_param('threshold', '1', 0.5), 1.0)
+        self.assertEqual(server.parse_param('exclude_bots', 'True', False),
+                         True)
+        self.assertEqual(server.parse_param('exclude_orgs', 'Lled,Marble'),
+                         ('Lled', 'Marble'))
+        self.assertEqual(server.parse_param('interval', '1w', '1M'), '1w')
+        self.assertEqual(server.parse_param('mode', 'preview'), 'preview')
+
+        with self.assertRaises(ValueError):
+            server.parse_param('exclude_bots', 'yes', False)
+
+        with self.assertRaises(ValueError):
+            server.parse_param('windows', '30,ninety', (90, 365))
+
+    def test_list_metrics(self):
+        """Test available metrics are listed.
+        """
+
+        status, body = self.request('/metrics')
+
+        self.assertEqual(status, 200)
+        self.assertIn('elephant_factor', body['metrics'])
+
+    def test_bad_requests(self):
+        """Test errors are reported with the right status codes.
+        """
+
+        status, _ = self.request('/metrics/foo?data_source=git')
+        self.assertEqual(status, 404)
+
+        status, _ = self.request('/metrics/elephant_factor?data_source=git')
+        self.assertEqual(status, 400)
+
+        status, _ = self.request('/metrics/elephant_factor?data_source=jira'
+                                 '&start_date=2018-01-01')
+        self.assertEqual(status, 400)
+
+    @mock.patch('broomstick.server.runner.run_metric',
+                side_effect=slow_metric)
+    def test_unsupported_params(self, run_metric_mock):
+        """Test only params in the whitelist are passed to metrics.
+        """
+
+        status, body = self.request(
+            '/metrics/elephant_factor?data_source=git&start_date=2018-01-01'
+            '&affiliations=/etc/passwd')
+
+        self.assertEqual(status, 400)
+        self.assertIn('affiliations', body['error'])
+        run_metric_mock.assert_not_called()
+
+        # Params the metric doesn't accept are left out of the cache key
+        status, _ = self.request(
+            '/metrics/elephant_factor?data_source=git&start_date=2018-01-01'
+            '&windows=30&exclude_bots=true')
+
+        self.assertEqual(status, 200)
+        run_metric_mock.assert_called_with('elephant_factor',
+                                           DataSource.GIT,
+                                           '2018-01-01', None,
+                                           exclude_bots=True)
+
+
+if __name__ == '__main__':
+    unittest.main()